@@ -7,11 +7,13 @@ import time
 import requests
 from flask import Flask, request
 
-from blockchain import chain_utils, block_utils
+from blockchain import chain_utils, block_utils, merkle_utils, transport
 from blockchain.chain import Blockchain
+from blockchain.consensus import consensus_algorithm
+from blockchain.gossip import Gossip, get_block_message_id, get_record_message_id
+from blockchain.lazy_chain import CorruptBlockError
 from blockchain.chord import chord_utils
 from blockchain.chord.chord import Chord
-from blockchain.maintenance_record import MaintenanceRecord
 
 app = Flask(__name__)
 
@@ -27,6 +29,9 @@ peers = []
 # Address of discovery node
 discovery_node_address = '172.17.0.1:500'
 
+# Seconds to wait for peers' block locators when reaching consensus, slower peers are left out
+consensus_deadline = float(os.environ.get("MIBLOCK_CONSENSUS_DEADLINE", 10))
+
 # Address of node
 node_address = ''
 
@@ -36,8 +41,21 @@ blockchain = Blockchain()
 # Node's chord instance
 chord = None
 
+# Node's gossip state, records and blocks it has already passed on
+gossip = Gossip()
+
 online = False
 
+
+# -----------------------------------------------------------------------\
+# Requests reading a stored block that no longer matches its header fail |
+# -----------------------------------------------------------------------/
+@app.errorhandler(CorruptBlockError)
+def handle_corrupt_block(error):
+    logger.error(f"Request failed - {error}")
+    return "Node's stored chain is corrupt", 500
+
+
 #                                                     /+=---------=+\
 # --------------------------------------------------=+|  Discovery  |+=-------------------------------------------------
 #                                                     \+=---------=+/
@@ -176,18 +194,17 @@ def accept_peer():
     # Reach chain consensus with network
     peer_chain_consensus()
 
-    # Return a list of peers on the network and an updated version of the chain
+    # Return a list of peers on the network and an updated version of the chain, the chain is
+    # spliced together from the cached encoding of each block
     response_peers = peers.copy()
     response_peers.append(discovery_node_address)
-    response = {
-        'peers': response_peers,
-        'chain': chain_utils.get_chain_json(blockchain.chain)
-    }
+    response = b'{"chain":%s,"peers":%s}' % (chain_utils.get_chain_encoding(blockchain.chain),
+                                             json.dumps(response_peers).encode())
 
     # Added the new node to the list of peers.
     peers.append(address)
 
-    return json.dumps(response, sort_keys=True, indent=2), 200
+    return response, 200
 
 
 # ----------------------------------------------------------------\
@@ -210,14 +227,19 @@ def register_node():
     headers = {'Content-Type': 'application/json'}
 
     # Send request to directory node for chain and peer list
-    response = requests.post(f'http://{discovery_node_address}/node', data=json.dumps(data), headers=headers)
+    try:
+        response = transport.post(f'http://{discovery_node_address}/node', data=json.dumps(data), headers=headers)
+    except requests.RequestException as error:
+        logger.error(f"Failed to reach discovery node '{discovery_node_address}': {error}")
+        return 'Discovery node failed', 400
 
     # If request successful, update chain and list of peers
     if response.status_code != 200:
         return 'Discovery node failed', 400
 
-    # Save received chain to node
-    blockchain.chain = chain_utils.get_chain_from_json(response.json()['chain'])
+    # Save received chain to node, an invalid chain is never adopted
+    if not blockchain.replace_chain(chain_utils.get_chain_from_json(response.json()['chain'])):
+        return 'Chain from discovery node is not valid', 400
 
     online = True
 
@@ -241,6 +263,37 @@ def get_node_hostname():
     return json.dumps({'hostname': socket.gethostbyname(socket.gethostname())}), 200
 
 
+# ---------------------------------------------------------\
+# Get the size and hit rate of the node's fingerprint cache |
+# ---------------------------------------------------------/
+@app.route('/node/fingerprint-cache', methods=['GET'])
+def get_fingerprint_cache_stats():
+    return json.dumps(chain_utils.get_fingerprint_cache().get_stats()), 200
+
+
+# -----------------------------------------------------------------\
+# Get the number of blocks with records held in the node's memory |
+# -----------------------------------------------------------------/
+@app.route('/node/block-cache', methods=['GET'])
+def get_block_cache_stats():
+    return json.dumps(blockchain.chain.get_stats()), 200
+
+
+# -------------------------------------------------------------------\
+# Get the node's consensus algorithm and the key it seals blocks with |
+# -------------------------------------------------------------------/
+@app.route('/node/consensus', methods=['GET'])
+def get_node_consensus():
+    consensus = blockchain.consensus
+    node_id = getattr(consensus, 'node_id', None)
+    consensus_json = {
+        'algorithm': consensus_algorithm,
+        'node_id': block_utils.get_hex_from_hash(node_id),
+        'authority': node_id in getattr(consensus, 'authorities', set())
+    }
+    return json.dumps(consensus_json), 200
+
+
 #                                                    /+=----------=+\
 # -------------------------------------------------=+|  Blockchain  |+=-------------------------------------------------
 #                                                    \+=----------=+/
@@ -251,10 +304,48 @@ def get_node_hostname():
 @app.route('/chain', methods=['GET'])
 def get_chain():
     logger.info("Node was asked to return its chain and peer list")
+    chain = blockchain.chain
+    length = len(chain)
+
+    # A range of blocks can be requested with 'start' and 'end', only those blocks are read.
+    # Peers syncing from a common ancestor request the blocks from 'since' onwards.
+    try:
+        start_index = max(int(request.args.get('since', request.args.get('start', 0))), 0)
+        end_index = min(int(request.args.get('end', length)), length)
+    except ValueError:
+        return "Start and end must be block indexes", 400
+
+    # Chain is spliced together from the cached encoding of each block
+    chain_encoding = chain_utils.get_chain_encoding(chain[index] for index in range(start_index, end_index))
+    response = b'{"chain":%s,"length":%d,"peers":%s,"start":%d}' % (chain_encoding, length,
+                                                                    json.dumps(peers).encode(), start_index)
+    return response, 200
+
+
+# ---------------------------------------------------------------------------\
+# Get a block locator of a node's chain, so a peer can find their last shared block |
+# ---------------------------------------------------------------------------/
+@app.route('/chain/locator', methods=['GET'])
+def get_chain_locator():
+    logger.info("Node was asked to return its block locator")
     response = {
         'length': len(blockchain.chain),
-        'chain': chain_utils.get_chain_json(blockchain.chain),
-        'peers': peers
+        'work': blockchain.chain_work,
+        'locator': [{'index': index, 'hash': block_hash.hex()} for index, block_hash in blockchain.get_block_locator()]
+    }
+    return json.dumps(response), 200
+
+
+# ------------------------------------------------------------\
+# Get the block headers of a node's chain, without the records |
+# ------------------------------------------------------------/
+@app.route('/chain/headers', methods=['GET'])
+def get_chain_headers():
+    logger.info("Node was asked to return its block headers")
+    headers = [block_utils.get_header_dict_from_object(header) for header in blockchain.chain.headers]
+    response = {
+        'length': len(headers),
+        'headers': headers
     }
     return json.dumps(response, sort_keys=True, indent=2), 200
 
@@ -267,8 +358,8 @@ def manage_records():
     if request.method == 'POST':
         logger.info("Node was asked to add a record to its record pool")
 
-        # Generate record from request data
-        record = generate_record_from_request(request.get_json())
+        # Generate record from request data, the node fingerprints the file itself
+        record = generate_record_from_request(request.get_json(), trusted=False)
 
         # Generate record returns None with invalid data
         if record is None or not block_utils.is_record_valid(record):
@@ -278,10 +369,13 @@ def manage_records():
         blockchain.record_pool.add_record(record)
 
         # Broadcast record to peers
+        gossip.mark_seen(get_record_message_id(record))
         broadcast_record_to_peers(record)
 
         # Send record to its successor
         file_successor = chord_utils.find_successor(node_address, chord_utils.get_hash(record.filename))
+        if file_successor is None:
+            return "Record's successor could not be found", 400
         logger.info(f"Maintenance record's successor is '{file_successor}'")
 
         if str(file_successor) != str(node_address):
@@ -292,7 +386,11 @@ def manage_records():
             block_utils.move_record_file(record.filename)
             chord.stored_files.append(record.filename)
 
-        response = requests.get(f"http://{file_successor}/node/file?filename={record.filename}")
+        try:
+            response = transport.get(f"http://{file_successor}/node/file?filename={record.filename}")
+        except requests.RequestException as error:
+            logger.error(f"Failed to reach file successor '{file_successor}': {error}")
+            return "Record's successor could not be reached", 400
         if response.status_code != 200:
             return response.content, 400
         else:
@@ -306,7 +404,7 @@ def manage_records():
 
         # Add all unverified records to return list
         for record in blockchain.record_pool.unverified_records:
-            response.append(record.__dict__)
+            response.append(record.get_record_data())
 
         # Generate response data
         data = {
@@ -332,17 +430,15 @@ def mine_block():
     if mined_block is None:
         return "No records to verify", 400
 
-    # Store length of chain before reaching consensus with peers
-    length_of_chain = len(blockchain.chain)
-
     # Reach consensus with peers
     peer_chain_consensus()
 
-    # If node's chain is most up to date, broadcast it to peer's to synchronise chain
-    if length_of_chain == len(blockchain.chain):
+    # If the mined block is still the end of the chain, broadcast it to peer's to synchronise chain
+    if blockchain.last_block_on_chain().hash == mined_block.hash:
+        gossip.mark_seen(get_block_message_id(mined_block))
         broadcast_block_to_peers(mined_block)
 
-    return json.dumps(block_utils.get_block_dict_from_object(mined_block)), 200
+    return block_utils.get_block_encoding(mined_block), 200
 
 
 # -------------------------------------------------------------------------------------------\
@@ -359,11 +455,23 @@ def add_block():
     if block is None:
         return "There was an error when adding block", 400
 
-    # Add new block to node's chain
+    # Blocks arrive once from each peer gossiping them, only the first is added
+    message_id = get_block_message_id(block)
+    if gossip.has_seen(message_id):
+        return "Block was already received", 200
+
+    # Add new block to node's chain, verified records are removed from the record pool. The block
+    # is only marked as seen once it is added, so a block rejected now is accepted if sent again.
     if blockchain.add_block(block):
-        # If block contains verified records in node's record pool, remove records.
-        blockchain.record_pool.remove_records(block.records)
+        # Pass the block on without making the sending peer wait for it to spread
+        ttl, sender = get_gossip_fields(request)
+        if gossip.mark_seen(message_id) and ttl > 0:
+            if not gossip.relay(broadcast_block_to_peers, block, ttl - 1, sender):
+                logger.warning("Too many messages waiting to be passed on, block was not passed on")
         return "Block was added to node's chain", 201
+    elif gossip.has_seen(message_id):
+        # The same block from another peer was added whilst this one was checked
+        return "Block was already received", 200
     else:
         return "There was an error when adding block", 400
 
@@ -380,7 +488,13 @@ def verify_record():
     filename = request.args['filename']
     logger.info(f"Node was asked check the validity of record '{filename}'")
     file_successor = chord_utils.find_successor(node_address, chord_utils.get_hash(filename))
-    response = requests.get(f"http://{file_successor}/chord/record?filename={filename}")
+    if file_successor is None:
+        return "File not found", 404
+    try:
+        response = transport.get(f"http://{file_successor}/chord/record?filename={filename}")
+    except requests.RequestException as error:
+        logger.error(f"Failed to reach file successor '{file_successor}': {error}")
+        return "File not found", 404
 
     if response.status_code == 200:
         file_hash = response.json()["file_hash"]
@@ -392,6 +506,69 @@ def verify_record():
     else:
         return "File not found", 404
 
+
+# ---------------------------------------------------\
+# Get every record on the chain for a given aircraft |
+# ---------------------------------------------------/
+@app.route('/chain/records', methods=['GET'])
+def get_aircraft_records():
+    if "aircraft_reg_number" not in request.args:
+        return 'No aircraft registration number specified', 400
+
+    aircraft_reg_number = request.args['aircraft_reg_number']
+    logger.info(f"Node was asked for the records of aircraft '{aircraft_reg_number}'")
+
+    records = chain_utils.get_records_by_aircraft(aircraft_reg_number)
+    response = {
+        'length': len(records),
+        'records': records
+    }
+    return json.dumps(response, sort_keys=True, indent=2), 200
+
+
+# ------------------------------------------------------------------------------\
+# Re-validate the whole chain, either now or as a low priority background task |
+# ------------------------------------------------------------------------------/
+@app.route('/chain/validate', methods=['GET'])
+def validate_chain():
+    if request.args.get('background') == 'true':
+        logger.info("Node was asked to re-validate its chain in the background")
+        if not blockchain.background_validation['running']:
+            blockchain.start_background_validation()
+        return json.dumps(blockchain.background_validation), 202
+
+    logger.info("Node was asked to re-validate its chain")
+    response = {
+        'valid': blockchain.is_chain_valid(),
+        'validated_index': blockchain.validated_index,
+        'background_validation': blockchain.background_validation
+    }
+    return json.dumps(response, sort_keys=True, indent=2), 200
+
+
+# -------------------------------------------------------------------------\
+# Get a proof that a record is included in a block, checkable with headers |
+# -------------------------------------------------------------------------/
+@app.route('/chain/record-proof', methods=['GET'])
+def get_record_proof():
+    if "filename" not in request.args:
+        return 'No filename specified', 400
+
+    filename = request.args['filename']
+    logger.info(f"Node was asked for an inclusion proof of record '{filename}'")
+
+    record_proof = blockchain.get_record_proof(filename)
+    if record_proof is None:
+        return "Record is not on the chain", 404
+
+    block, record, proof = record_proof
+    response = {
+        'header': block_utils.get_header_dict_from_object(block),
+        'record': record.get_record_data(),
+        'proof': merkle_utils.get_proof_dict(proof)
+    }
+    return json.dumps(response, sort_keys=True, indent=2), 200
+
 # ------------------------------------------------[Chain Synchronisation]-----------------------------------------------
 
 
@@ -409,8 +586,20 @@ def sync_record():
     if record is None:
         return 'Invalid data provided to create maintenance record', 400
 
-    # Add new record to record pool
-    blockchain.record_pool.add_record(record)
+    # Records arrive once from each peer gossiping them, only the first is added
+    message_id = get_record_message_id(record)
+    if gossip.has_seen(message_id):
+        return 'Record was already received', 200
+
+    # Add new record to record pool, a record already in the pool or on the chain isn't marked as seen
+    if not blockchain.record_pool.add_record(record):
+        return 'Record is already in the record pool or verified', 200
+
+    # Pass the record on without making the sending peer wait for it to spread
+    ttl, sender = get_gossip_fields(request)
+    if gossip.mark_seen(message_id) and ttl > 0:
+        if not gossip.relay(broadcast_record_to_peers, record, ttl - 1, sender):
+            logger.warning("Too many messages waiting to be passed on, record was not passed on")
     return 'Record added to pool', 200
 
 
@@ -432,19 +621,26 @@ def sync_peers():
 @app.route('/chain/sync/record-pool', methods=['GET'])
 def sync_record_pool():
 
-    # Sync node's peer list by requesting other node's peer lists
+    # Request the record pool of every peer, unreachable peers are skipped
+    synced_peers = 0
     for peer in peers:
-        response = requests.get(f"http://{peer}/chain/record-pool")
-        if response.status_code == 200 and response.json()['length'] != 0:
-            json_records = response.json()['records']
-            records = []
-            for json_record in json_records:
-                record = block_utils.get_record_object_from_dict(json_record, stored=False)
-                records.append(record)
-            for record in records:
+        try:
+            response = transport.get(f"http://{peer}/chain/record-pool")
+        except requests.RequestException as error:
+            logger.warning(f"Failed to request record pool from '{peer}': {error}")
+            continue
+        if response.status_code != 200:
+            logger.warning(f"Failed to request record pool from '{peer}': {response.status_code}")
+            continue
+
+        synced_peers += 1
+        for json_record in response.json()['records']:
+            record = block_utils.get_record_object_from_dict(json_record, stored=False)
+            if record is not None:
                 blockchain.record_pool.add_record(record)
-        else:
-            return 'Failure whilst synchronising record pool', 400
+
+    if peers and synced_peers == 0:
+        return 'Failure whilst synchronising record pool', 400
     return 'Synced record pool', 200
 
 
@@ -597,8 +793,8 @@ def get_file_hash():
         return 'No filename specified', 400
     filename = str(request.args["filename"])
     file_path = block_utils.path_to_stored_record(filename)
-    record = MaintenanceRecord("temp", "temp", filename, file_path)
-    return json.dumps({"file_hash":record.file_hash}), 200
+    file_hash = chain_utils.get_fingerprint_cache().get_sha256(file_path)
+    return json.dumps({"file_hash": file_hash}), 200
 
 #                                                 /+=-------------------=+\
 # ----------------------------------------------=+|  Broadcast Functions  |+=-------------------------------------------
@@ -606,31 +802,59 @@ def get_file_hash():
 
 # Attempts to establish chain consensus amongst known peers
 def peer_chain_consensus():
-    updated_chain = False
-
-    # Request chain from each peer
-    for peer in peers:
-        headers = {'Content-Type': "application/json"}
-        response = requests.get(f"http://{peer}/chain", headers=headers)
-        # If peer's chain is longer and valid, update chain
-        if response.json()['length'] > len(blockchain.chain) and \
-                blockchain.is_chain_valid():
-            blockchain.chain = chain_utils.get_chain_from_json(response.json()['chain'])
-            updated_chain = True
+    headers = {'Content-Type': "application/json"}
 
-    if updated_chain:
-        if os.path.exists(chain_utils.path_to_stored_chain()):
-            chain_utils.write_chain(blockchain.chain)
+    # A peer failing to send its locator is left out of this round of consensus
+    def request_locator(peer):
+        response = transport.get(f"http://{peer}/chain/locator", headers=headers)
+        response.raise_for_status()
+        return response.json()
+
+    # Request a block locator from every peer at once, rather than their whole chain, without
+    # waiting on peers that are slow to respond
+    consensus_peers = peers.copy()
+    responses, errors = transport.fan_out(consensus_peers, request_locator, deadline=consensus_deadline)
+    log_fan_out_errors("request block locator from", errors)
+
+    for peer in consensus_peers:
+        if peer not in responses:
+            continue
+        # If peer's chain has more work, fetch only the blocks after the last block both chains share,
+        # the fetched blocks are checked before the node's chain is changed
+        if responses[peer].get('work', 0) > blockchain.chain_work:
+            locator = [(entry['index'], bytes.fromhex(entry['hash'])) for entry in responses[peer]['locator']]
+            ancestor_index = blockchain.find_common_ancestor(locator)
+
+            try:
+                response = transport.get(f"http://{peer}/chain?since={ancestor_index + 1}", headers=headers)
+            except requests.RequestException as error:
+                logger.warning(f"Failed to request blocks from '{peer}': {error}")
+                continue
+            if response.status_code != 200:
+                continue
+            blocks = chain_utils.get_chain_from_json(response.json()['chain'])
+
+            # The claimed work only decides whether to fetch the blocks, the fetched blocks' own work decides a fork
+            if None not in blocks:
+                fork_work = blockchain.get_fork_work(ancestor_index, blocks)
+                if fork_work != responses[peer]['work']:
+                    logger.warning(f"Peer '{peer}' claimed its chain has '{responses[peer]['work']}' work, but "
+                                   f"its blocks have '{fork_work}' work")
+
+            logger.info(f"Syncing '{len(blocks)}' blocks after index '{ancestor_index}' from '{peer}'")
+            blockchain.sync_chain(ancestor_index, blocks)
 
 
 # Broadcasts a solved block to the network
-def broadcast_block_to_peers(block):
-    # Send solved block to all known peer's in the network
-    data = block_utils.get_block_dict_from_object(block)
-    headers = {'Content-Type': "application/json"}
+def broadcast_block_to_peers(block, ttl=Gossip.ttl, sender=None):
+    # Send solved block to a few peers, who gossip it on to theirs until the TTL runs out
+    data = block_utils.get_block_encoding(block)
+    headers = get_gossip_headers(ttl)
 
-    for peer in peers:
-        requests.post(f"http://{peer}/chain/add-block", data=json.dumps(data), headers=headers)
+    _, errors = transport.fan_out(gossip.choose_peers(peers, sender),
+                                  lambda peer: transport.post(f"http://{peer}/chain/add-block", data=data,
+                                                              headers=headers))
+    log_fan_out_errors("send block to", errors)
 
 
 # Tells known peers to update their finger tables
@@ -638,22 +862,29 @@ def broadcast_chord_update(nodes_to_update):
     # Get all peers known to discovery node
     for node in nodes_to_update:
         logger.info(f"Telling '{node}' to update their finger table")
-        requests.get(f"http://{node}/chord/update")
+        try:
+            transport.get(f"http://{node}/chord/update")
+        except requests.RequestException as error:
+            logger.warning(f"Failed to tell '{node}' to update their finger table: {error}")
 
 
 # Broadcasts a new unverified record to the network
-def broadcast_record_to_peers(record):
+def broadcast_record_to_peers(record, ttl=Gossip.ttl, sender=None):
     data = {
         'aircraft_reg_number': record.aircraft_reg_number,
         'date_of_record': record.date_of_record,
         'filename': record.filename,
-        'file_path': record.file_path
+        'file_path': record.file_path,
+        'file_hash': record.file_hash.hex()
     }
-    headers = {'Content-Type': "application/json"}
+    headers = get_gossip_headers(ttl)
 
-    # Send unverified record to all known peer's in the network
-    for peer in peers:
-        requests.post(f"http://{peer}/chain/sync/record", data=json.dumps(data), headers=headers)
+    # Send unverified record to a few peers, who gossip it on to theirs until the TTL runs out
+    data = json.dumps(data)
+    _, errors = transport.fan_out(gossip.choose_peers(peers, sender),
+                                  lambda peer: transport.post(f"http://{peer}/chain/sync/record", data=data,
+                                                              headers=headers))
+    log_fan_out_errors("send record to", errors)
 
 
 # Send a maintenance record to it's successor
@@ -696,7 +927,11 @@ def initialise_receiving_peer(successor_node, filename):
     logger.info(f"Telling successor '{successor_node}' to expect an incoming file transfer")
 
     # Tell peer to expect an incoming connection
-    response = requests.post(f"http://{successor_node}/node/record", data=data, headers=headers)
+    try:
+        response = transport.post(f"http://{successor_node}/node/record", data=data, headers=headers)
+    except requests.RequestException as error:
+        logger.error(f"Failed to reach file successor '{successor_node}': {error}")
+        return 'File successor could not be reached', 400
     return response.content, response.status_code
 
 
@@ -715,7 +950,11 @@ def file_transfer_handler(file_successor, filename, stored=True):
 
     # Get hostname of file successor to set up a socket connection
     logger.debug("Requesting file successors hostname")
-    successor_hostname = requests.get(f"http://{file_successor}/node/hostname").json()['hostname']
+    try:
+        successor_hostname = transport.get(f"http://{file_successor}/node/hostname").json()['hostname']
+    except requests.RequestException as error:
+        logger.error(f"Failed to request file successors hostname from '{file_successor}': {error}")
+        return False
     logger.info(f"Received file successors hostname '{successor_hostname}'")
 
     # Creating threads to setup server peer and client peer
@@ -733,29 +972,64 @@ def file_transfer_handler(file_successor, filename, stored=True):
     t1.join()
     t2.join()
 
-    response = requests.get(f"http://{file_successor}/node/file?filename={filename}")
+    try:
+        response = transport.get(f"http://{file_successor}/node/file?filename={filename}")
+    except requests.RequestException as error:
+        logger.error(f"Failed to reach file successor '{file_successor}': {error}")
+        return False
     return response.status_code == 200
 
 
 def broadcast_peer_sync(broadcast=False):
     # Sync node's peer list by requesting other node's peer lists
     for peer in peers:
-        response = requests.get(f"http://{peer}/discovery/peers")
-        for response_peer in response.json()['peers']:
+        try:
+            response_peers = transport.get(f"http://{peer}/discovery/peers").json()['peers']
+        except requests.RequestException as error:
+            logger.warning(f"Failed to request peers from '{peer}': {error}")
+            continue
+        for response_peer in response_peers:
             if response_peer not in peers and response_peer != node_address:
                 peers.append(response_peer)
 
     if broadcast:
         for peer in peers:
-            requests.get(f"http://{peer}/chain/sync/peers")
+            try:
+                transport.get(f"http://{peer}/chain/sync/peers")
+            except requests.RequestException as error:
+                logger.warning(f"Failed to ask '{peer}' to sync peers: {error}")
 
 #                                                 /+=-------------------=+\
 # ----------------------------------------------=+|   Utility Functions   |+=-------------------------------------------
 #                                                 \+=-------------------=+/
 
 
+# Creates the headers of a gossip message, the TTL is the number of times it is passed on again
+def get_gossip_headers(ttl):
+    return {
+        'Content-Type': "application/json",
+        'X-Gossip-TTL': str(ttl),
+        'X-Gossip-Sender': node_address
+    }
+
+
+# Gets the TTL and sender of a gossip message, messages without a TTL aren't passed on
+def get_gossip_fields(gossip_request):
+    try:
+        ttl = int(gossip_request.headers.get('X-Gossip-TTL', 0))
+    except ValueError:
+        ttl = 0
+    return min(ttl, Gossip.ttl), gossip_request.headers.get('X-Gossip-Sender')
+
+
+# Logs the peers a fanned out request failed for
+def log_fan_out_errors(action, errors):
+    for peer, error in errors.items():
+        logger.warning(f"Failed to {action} '{peer}': {error}")
+
+
 # Creates a MaintenanceRecord object from a request
-def generate_record_from_request(record_json):
+def generate_record_from_request(record_json, trusted=True):
     # Parameters needed for a valid record
     record_parameters = ['aircraft_reg_number', 'date_of_record', 'filename']
 
@@ -763,6 +1037,10 @@ def generate_record_from_request(record_json):
     if not all(param in record_json for param in record_parameters):
         return None
 
+    # A file hash is only accepted from peers, otherwise the file is hashed by this node
+    if not trusted:
+        record_json = {param: record_json[param] for param in record_parameters}
+
     if block_utils.stored_maintenance_record_exists(record_json['filename']):
         return block_utils.get_record_object_from_dict(record_json, stored=True)
     else:
@@ -772,10 +1050,10 @@ def generate_record_from_request(record_json):
 # Creates a Block object from a request
 def generate_block_from_request(block_json):
     # Parameters needed for a valid block
-    block_parameters = ['index', 'previous_hash', 'timestamp', 'nonce', 'records', 'hash']
+    block_parameters = ['index', 'previous_hash', 'timestamp', 'nonce', 'difficulty', 'records', 'hash']
 
     # Bad request if request does not contain all correct
-    if not all(param in block_json for param in block_parameters):
+    if not isinstance(block_json, dict) or not all(param in block_json for param in block_parameters):
         return None
 
     return block_utils.get_block_object_from_dict(block_json)
@@ -789,7 +1067,8 @@ def join_chord_network(address):
 
     # Notify node's successor of our existence
     logger.info("Notifying our successor")
-    chord_utils.notify_successor(chord.successor, chord.node_address)
+    if not chord_utils.notify_successor(chord.successor, chord.node_address):
+        logger.warning(f"Failed to notify successor '{chord.successor}'")
 
     # Predecessor and successor points are correct, fix finger tables of effected nodes
     logger.info("Fixing our finger table")
@@ -801,14 +1080,18 @@ def join_chord_network(address):
 
     # Successor may have files in our jurisdiction, make sure they are sent to us
     logger.info("Telling successor to update their file store")
-    response = requests.get(f"http://{chord.successor}/chord/sync/files")
+    try:
+        response = transport.get(f"http://{chord.successor}/chord/sync/files")
+    except requests.RequestException as error:
+        logger.error(f"Failed to reach successor '{chord.successor}': {error}")
+        return f"Successor '{chord.successor}' could not be reached"
     if response.status_code != 200:
         return response.reason
     return 0
 
 
 def reset_node():
-    global peers, node_address, blockchain, chord
+    global peers, node_address, blockchain, chord, gossip
     # List of known peer addresses
     peers = []
 
@@ -820,3 +1103,10 @@ def reset_node():
 
     # Node's chord instance
     chord = None
+
+    # Node's gossip state, messages still being passed on to the old network are dropped
+    gossip.close()
+    gossip = Gossip()
+
+    # Connections to the old network's peers are no longer needed
+    transport.close_sessions()
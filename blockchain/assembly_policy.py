@@ -0,0 +1,82 @@
+import heapq
+import json
+
+from datetime import datetime
+
+# Orderings records can be taken from the record pool in
+orderings = ['arrival', 'oldest', 'aircraft']
+
+# Formats a record's date is parsed with when ordering records oldest first
+date_formats = ['%d/%m/%Y', '%Y-%m-%d']
+
+
+class BlockAssemblyPolicy:
+    max_records = None
+    max_size = None
+    ordering = None
+
+    def __init__(self, max_records=500, max_size=1000000, ordering='arrival'):
+        """
+        BlockAssemblyPolicy class constructor, decides which unverified records go in a block
+        :param max_records: Maximum number of records in a block
+        :param max_size:    Maximum size in bytes of the serialised records in a block
+        :param ordering:    Order records are taken in, 'arrival' takes records in the order
+                            they were added to the pool, 'oldest' by date of record and
+                            'aircraft' groups records by aircraft registration number
+        """
+        if ordering not in orderings:
+            raise ValueError(f"Unknown record ordering '{ordering}', expected one of {orderings}")
+
+        self.max_records = max_records
+        self.max_size = max_size
+        self.ordering = ordering
+
+    def select_records(self, records):
+        """
+        Selects as many records as the policy allows
+        :param records: Iterable of unverified records in the order they were added
+        :return:        List of records to be verified in the next block
+        """
+        # Only the records that can go in the block are ordered, rather than sorting the whole pool
+        if self.ordering == 'oldest':
+            records = heapq.nsmallest(self.max_records, records, key=get_date_sort_key)
+        elif self.ordering == 'aircraft':
+            records = heapq.nsmallest(self.max_records, records, key=lambda record: str(record.aircraft_reg_number))
+
+        selected_records = []
+        block_size = 0
+        for record in records:
+            if len(selected_records) == self.max_records:
+                break
+
+            # The block is full once the next record would take it over its size limit, records
+            # later in the order don't jump ahead of it and the rest of the pool isn't scanned
+            record_size = get_record_size(record)
+            if block_size + record_size > self.max_size:
+                break
+
+            selected_records.append(record)
+            block_size += record_size
+        return selected_records
+
+
+def get_record_size(record):
+    """
+    :param record:  Record in MaintenanceRecord type
+    :return:        Size in bytes of the record once serialised in a block
+    """
+    return len(json.dumps(record.get_record_data(), sort_keys=True).encode())
+
+
+def get_date_sort_key(record):
+    """
+    Gets a key ordering records by date, dates that can't be parsed are ordered last
+    :param record:  Record in MaintenanceRecord type
+    :return:        Sort key for the record
+    """
+    for date_format in date_formats:
+        try:
+            return 0, datetime.strptime(str(record.date_of_record), date_format), ''
+        except ValueError:
+            continue
+    return 1, datetime.min, str(record.date_of_record)
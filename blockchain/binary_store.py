@@ -0,0 +1,421 @@
+import json
+import mmap
+import os
+import struct
+import threading
+import zlib
+
+from blockchain.durability import GroupCommit, fsync_file, replace_file
+
+# Each entry starts with the length of the entry's body and a CRC32 checksum of the body
+entry_prefix_format = '>II'
+entry_prefix_size = struct.calcsize(entry_prefix_format)
+
+# Fixed-layout block header: index, previous hash, timestamp, nonce, difficulty, Merkle root,
+# hash, whether the block is signed, signer, signature and the number of records
+header_format = '>Q32sdQB32s32sB32s64sI'
+header_size = struct.calcsize(header_format)
+
+# Each record is its file hash followed by its length-prefixed fields in JSON format
+record_fields = ['aircraft_reg_number', 'date_of_record', 'filename']
+field_length_format = '>I'
+field_length_size = struct.calcsize(field_length_format)
+
+# Each entry in the offset table is the offset of a block in the chain file
+offset_format = '>Q'
+offset_size = struct.calcsize(offset_format)
+
+
+def encode_block(block_dict):
+    """
+    Encodes a block in the binary format
+    :param block_dict:  Block in dictionary format
+    :return:            Entry in bytes, made up of the entry prefix, header and records
+    """
+    signed = block_dict.get('signer') is not None
+    body = [struct.pack(header_format,
+                        block_dict['index'],
+                        bytes.fromhex(block_dict['previous_hash'].rjust(64, '0')),
+                        block_dict['timestamp'],
+                        block_dict['nonce'],
+                        block_dict['difficulty'],
+                        bytes.fromhex(block_dict['merkle_root']),
+                        bytes.fromhex(block_dict['hash']),
+                        signed,
+                        bytes.fromhex(block_dict['signer']) if signed else bytes(32),
+                        bytes.fromhex(block_dict['signature']) if signed else bytes(64),
+                        len(block_dict['records']))]
+
+    for record in block_dict['records']:
+        body.append(bytes.fromhex(record['file_hash']))
+        for field in record_fields:
+            value = json.dumps(record[field], separators=(',', ':')).encode()
+            body.append(struct.pack(field_length_format, len(value)) + value)
+
+    body = b''.join(body)
+    return struct.pack(entry_prefix_format, len(body), zlib.crc32(body)) + body
+
+
+def decode_header(buffer, offset):
+    """
+    Decodes a block header without copying the rest of the block
+    :param buffer:  Buffer holding the chain file
+    :param offset:  Offset of the block's entry in the buffer
+    :return:        Block header in dictionary format and the number of records in the block
+    """
+    (index, previous_hash, timestamp, nonce, difficulty, merkle_root, block_hash, signed, signer, signature,
+     num_records) = struct.unpack_from(header_format, buffer, offset + entry_prefix_size)
+
+    header_dict = {
+        'index': index,
+        'previous_hash': previous_hash.hex(),
+        'timestamp': timestamp,
+        'nonce': nonce,
+        'difficulty': difficulty,
+        'merkle_root': merkle_root.hex(),
+        'hash': block_hash.hex(),
+        'signer': signer.hex() if signed else None,
+        'signature': signature.hex() if signed else None
+    }
+    return header_dict, num_records
+
+
+def decode_records(buffer, offset, num_records):
+    """
+    Decodes the records section of a block
+    :param buffer:      Buffer holding the chain file
+    :param offset:      Offset of the block's entry in the buffer
+    :param num_records: Number of records in the block
+    :return:            List of records in dictionary format
+    """
+    records = []
+    position = offset + entry_prefix_size + header_size
+    for _ in range(num_records):
+        record = {'file_hash': bytes(buffer[position:position + 32]).hex()}
+        position += 32
+        for field in record_fields:
+            (length,) = struct.unpack_from(field_length_format, buffer, position)
+            position += field_length_size
+            record[field] = json.loads(bytes(buffer[position:position + length]))
+            position += length
+        records.append(record)
+    return records
+
+
+def decode_block(buffer, offset):
+    """
+    :param buffer:  Buffer holding the chain file
+    :param offset:  Offset of the block's entry in the buffer
+    :return:        Block in dictionary format
+    """
+    block_dict, num_records = decode_header(buffer, offset)
+    block_dict['records'] = decode_records(buffer, offset, num_records)
+    return block_dict
+
+
+def get_entry_size(buffer, offset):
+    """
+    Checks the entry at an offset is complete and its checksum matches
+    :param buffer:  Buffer holding the chain file
+    :param offset:  Offset of the entry in the buffer
+    :return:        Size of the entry in bytes, None if the entry is torn or corrupt
+    """
+    if offset + entry_prefix_size > len(buffer):
+        return None
+
+    body_size, checksum = struct.unpack_from(entry_prefix_format, buffer, offset)
+    body_end = offset + entry_prefix_size + body_size
+    if body_size < header_size or body_end > len(buffer):
+        return None
+    if zlib.crc32(buffer[offset + entry_prefix_size:body_end]) != checksum:
+        return None
+    return entry_prefix_size + body_size
+
+
+class BinaryChainStore:
+    chain_path = None
+    offsets_path = None
+    offsets = []
+
+    def __init__(self, chain_path, offsets_path, commit_window=0.005):
+        """
+        BinaryChainStore class constructor, stores the chain in a compact binary file with a
+        table of the offset of every block. The file is memory-mapped so any block can be read
+        without reading the blocks before it.
+        :param chain_path:      Path to the binary chain file
+        :param offsets_path:    Path to the file holding the offset table
+        :param commit_window:   Seconds an fsync waits for more appended blocks to join it
+        """
+        self.chain_path = chain_path
+        self.offsets_path = offsets_path
+        self.offsets = []
+        self.chain_map = None
+        self.chain_file = None
+        self.lock = threading.Lock()
+        self.group_commit = GroupCommit(self.sync_chain, commit_window)
+        self.recover()
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def get_chain_map(self):
+        """
+        Maps the chain file into memory, the map is recreated when the file changes
+        :return: Memory map of the chain file, None if the file is empty
+        """
+        if self.chain_map is None and os.path.exists(self.chain_path) and os.path.getsize(self.chain_path) > 0:
+            with open(self.chain_path, 'rb') as chain_file:
+                self.chain_map = mmap.mmap(chain_file.fileno(), 0, access=mmap.ACCESS_READ)
+        return self.chain_map
+
+    def close_chain_map(self):
+        """
+        Unmaps the chain file before it is written to
+        """
+        if self.chain_map is not None:
+            self.chain_map.close()
+            self.chain_map = None
+
+    def recover(self):
+        """
+        Loads the offset table and removes a torn entry left at the end of the file by a crash
+        """
+        with self.lock:
+            self.offsets = []
+            chain_map = self.get_chain_map()
+            if chain_map is None:
+                return
+
+            indexed_offsets = self.read_offsets()
+
+            # Offsets must be increasing and point inside the file
+            for offset in indexed_offsets:
+                if offset >= len(chain_map) or (self.offsets and offset <= self.offsets[-1]):
+                    break
+                self.offsets.append(offset)
+
+            # Check the last indexed entry, then pick up entries missing from the offset table
+            scan_offset = self.offsets.pop() if self.offsets else 0
+            while scan_offset < len(chain_map):
+                entry_size = get_entry_size(chain_map, scan_offset)
+                if entry_size is None:
+                    break
+                self.offsets.append(scan_offset)
+                scan_offset += entry_size
+
+            # Remove the torn entry and everything after it
+            if scan_offset < len(chain_map):
+                self.close_chain_map()
+                with open(self.chain_path, 'r+b') as chain_file:
+                    chain_file.truncate(scan_offset)
+
+            if self.offsets != indexed_offsets:
+                self.write_offsets()
+
+    def read_offsets(self):
+        """
+        :return: Block offsets stored in the offset table, ignoring a partly written offset
+        """
+        if not os.path.exists(self.offsets_path):
+            return []
+
+        with open(self.offsets_path, 'rb') as offsets_file:
+            data = offsets_file.read()
+
+        complete_size = len(data) - len(data) % offset_size
+        return [offset for (offset,) in struct.iter_unpack(offset_format, data[:complete_size])]
+
+    def write_offsets(self):
+        """
+        Writes every block offset to the offset table, replacing the old table atomically
+        """
+        temp_path = self.offsets_path + ".tmp"
+        with open(temp_path, 'wb') as offsets_file:
+            offsets_file.write(b''.join(struct.pack(offset_format, offset) for offset in self.offsets))
+        replace_file(temp_path, self.offsets_path)
+
+    def append(self, block_encoding):
+        """
+        Appends a block to the end of the chain file. The block is only durable once
+        wait_for_commit returns for the write.
+        :param block_encoding:  Canonical encoding of the block in bytes
+        :return:                Sequence number of the write
+        """
+        entry = encode_block(json.loads(block_encoding))
+        with self.lock:
+            self.close_chain_map()
+            if self.chain_file is None:
+                self.chain_file = open(self.chain_path, 'ab')
+            offset = self.chain_file.tell()
+            self.chain_file.write(entry)
+            self.chain_file.flush()
+
+            # The offset table isn't synced, it is rebuilt from the chain file after a crash
+            with open(self.offsets_path, 'ab') as offsets_file:
+                offsets_file.write(struct.pack(offset_format, offset))
+            self.offsets.append(offset)
+            return self.group_commit.add_write()
+
+    def sync_chain(self):
+        """
+        Syncs every block appended to the chain file to disk
+        """
+        with self.lock:
+            if self.chain_file is None:
+                return
+            chain_fd = os.dup(self.chain_file.fileno())
+
+        # Blocks can still be appended whilst the file is synced
+        try:
+            os.fsync(chain_fd)
+        finally:
+            os.close(chain_fd)
+
+    def wait_for_commit(self, sequence):
+        """
+        Waits until an appended block is durable, blocks appended together share one fsync
+        :param sequence:    Sequence number of the write
+        """
+        self.group_commit.wait(sequence)
+
+    def read(self, index):
+        """
+        Reads a single block, seeking straight to it with the offset table
+        :param index:   Index of the block
+        :return:        Block in dictionary format, None if no block has the index
+        """
+        with self.lock:
+            if not 0 <= index < len(self.offsets):
+                return None
+            return decode_block(self.get_chain_map(), self.offsets[index])
+
+    def read_all(self, start_index=0):
+        """
+        Reads every block from the chain file
+        :param start_index: Index of the first block to read
+        :return:            List of blocks in dictionary format
+        """
+        with self.lock:
+            chain_map = self.get_chain_map()
+            return [decode_block(chain_map, offset) for offset in self.offsets[start_index:]]
+
+    def read_headers(self, start_index=0):
+        """
+        Reads the header of every block, the records of each block are skipped
+        :param start_index: Index of the first block to read
+        :return:            List of block headers in dictionary format
+        """
+        with self.lock:
+            chain_map = self.get_chain_map()
+            return [decode_header(chain_map, offset)[0] for offset in self.offsets[start_index:]]
+
+    def read_record_filenames(self, start_index=0):
+        """
+        Reads the filename of every record
+        :param start_index: Index of the first block to read
+        :return:            List of tuples of a record's filename and the index of its block
+        """
+        return [(record['filename'], block_dict['index'])
+                for block_dict in self.read_all(start_index) for record in block_dict['records']]
+
+    def truncate(self, length):
+        """
+        Removes every block after the first 'length' blocks, e.g. when they are orphaned by a fork
+        :param length:  Number of blocks kept
+        """
+        with self.lock:
+            if length >= len(self.offsets):
+                return
+
+            self.close_chain_map()
+            if self.chain_file is not None:
+                self.chain_file.close()
+                self.chain_file = None
+
+            # Offsets past the end of the chain file are dropped by 'recover' after a crash
+            with open(self.chain_path, 'r+b') as chain_file:
+                chain_file.truncate(self.offsets[length])
+                fsync_file(chain_file)
+
+            self.offsets = self.offsets[:length]
+            self.write_offsets()
+
+    def rewrite(self, block_encodings):
+        """
+        Replaces every block in the chain file, e.g. when adopting a peer's chain
+        :param block_encodings: List of canonical block encodings in bytes
+        """
+        with self.lock:
+            self.close_chain_map()
+            if self.chain_file is not None:
+                self.chain_file.close()
+                self.chain_file = None
+
+            # The new file is written and synced beside the old one, then renamed over it
+            temp_path = self.chain_path + ".tmp"
+            offsets = []
+            with open(temp_path, 'wb') as chain_file:
+                for block_encoding in block_encodings:
+                    offsets.append(chain_file.tell())
+                    chain_file.write(encode_block(json.loads(block_encoding)))
+                fsync_file(chain_file)
+
+            # The old offset table is emptied first, so a crash before the new table is written
+            # leaves 'recover' to rebuild it by scanning the new file rather than trusting old offsets
+            self.offsets = []
+            self.write_offsets()
+            replace_file(temp_path, self.chain_path)
+
+            self.offsets = offsets
+            self.write_offsets()
+
+    def find_block_index(self, filename):
+        """
+        Finds the block a record was verified in by scanning every block
+        :param filename:    Filename of the record
+        :return:            Index of the block, None if the record is not on the chain
+        """
+        for record_filename, block_index in self.read_record_filenames():
+            if record_filename == filename:
+                return block_index
+        return None
+
+    def get_records_by_aircraft(self, aircraft_reg_number):
+        """
+        Finds every record for an aircraft by scanning every block
+        :param aircraft_reg_number: Registration number of the aircraft
+        :return:                    List of records in dictionary format, in chain order
+        """
+        return [record for block_dict in self.read_all() for record in block_dict['records']
+                if record['aircraft_reg_number'] == aircraft_reg_number]
+
+
+def convert_json_to_binary(json_path, chain_path, offsets_path):
+    """
+    Converts a chain stored in JSON format, a list of blocks in dictionary format as in a
+    '/chain' response, to the binary format
+    :param json_path:       Path to the chain in JSON format
+    :param chain_path:      Path to write the binary chain file to
+    :param offsets_path:    Path to write the offset table to
+    """
+    with open(json_path, 'r') as json_file:
+        chain_json = json.load(json_file)
+
+    # A whole '/chain' response can be converted as well as a bare list of blocks
+    if isinstance(chain_json, dict):
+        chain_json = chain_json['chain']
+
+    store = BinaryChainStore(chain_path, offsets_path)
+    store.rewrite([json.dumps(block_dict).encode() for block_dict in chain_json])
+
+
+def convert_binary_to_json(chain_path, offsets_path, json_path):
+    """
+    Converts a binary chain file back to JSON format, a list of blocks in dictionary format
+    :param chain_path:      Path to the binary chain file
+    :param offsets_path:    Path to the offset table
+    :param json_path:       Path to write the chain in JSON format to
+    """
+    store = BinaryChainStore(chain_path, offsets_path)
+    with open(json_path, 'w') as json_file:
+        json.dump(store.read_all(), json_file, sort_keys=True, indent=2)
@@ -1,55 +1,137 @@
 import hashlib
-import json
+import struct
+
+from blockchain import merkle_utils
+
+# Header layout: index, previous hash, timestamp, difficulty, Merkle root of the records and nonce
+header_prefix_format = '>Q32sdB32s'
+nonce_format = '>Q'
+
+# Values cached on a sealed block, these are derived from the block so can be set after sealing
+cached_fields = ('merkle_root', 'encoding')
 
 
 class Block:
-    index = None
-    previous_hash = None
-    timestamp = None
-    nonce = None
-    hash = None
-    records = []
+    # Slots keep blocks small when a large chain is held in memory
+    __slots__ = ('index', 'previous_hash', 'timestamp', 'nonce', 'difficulty', 'hash', 'signer', 'signature',
+                 'records', 'merkle_root', 'encoding')
 
-    def __init__(self, index, previous_hash, timestamp, records, nonce=0):
+    def __init__(self, index, previous_hash, timestamp, records, nonce=0, difficulty=0):
         """
-        Block class constructor
+        Block class constructor, a block can't be changed once it is sealed with a hash
         :param index:           Unique identification number of the block
-        :param previous_hash:   Hash of the previous block in the chain
+        :param previous_hash:   Hash of the previous block in the chain in bytes
         :param timestamp:       Time since Unix epoch
         :param records:         A list of maintenance records verified in the block
         :param nonce:           A number used whilst mining to change the block's hash
+        :param difficulty:      Number of leading zero bits required in the block's hash
         """
         self.index = index
         self.previous_hash = previous_hash
         self.timestamp = timestamp
         self.nonce = nonce
-        self.records = records
+        self.difficulty = difficulty
+        self.records = tuple(records)
+        # Set when the block is sealed by an authority rather than mined
+        self.signer = None
+        self.signature = None
+        # Computed once the block is sealed, the canonical encoding is set by block_utils
+        self.merkle_root = None
+        self.encoding = None
+        self.hash = None
+
+    def __setattr__(self, name, value):
+        # Changing a sealed block would invalidate its hash
+        if name not in cached_fields and getattr(self, 'hash', None) is not None:
+            raise AttributeError(f"Block with index '{self.index}' is sealed and can't be changed")
+        object.__setattr__(self, name, value)
+
+    def get_merkle_root(self):
+        """
+        Returns the root of a Merkle tree over the records in the block, the root of a sealed
+        block is only computed once
+        """
+        if self.merkle_root is not None:
+            return self.merkle_root
+
+        leaf_hashes = [merkle_utils.get_record_leaf_hash(record) for record in self.records]
+        merkle_root = merkle_utils.get_merkle_root(leaf_hashes)
+        if self.hash is not None:
+            self.merkle_root = merkle_root
+        return merkle_root
+
+    def get_header_prefix(self):
+        """
+        Returns the block header without the nonce, this stays the same whilst mining
+        """
+        return get_block_header_prefix(self.index, self.previous_hash, self.timestamp, self.difficulty,
+                                       self.get_merkle_root())
+
+    def get_header(self):
+        """
+        Returns the fixed-size header of a block, the header is what the block hash is taken of
+        """
+        return self.get_header_prefix() + struct.pack(nonce_format, self.nonce)
+
+    def get_midstate(self):
+        """
+        Returns a hash object that has already consumed the header prefix, copies of it only
+        need to be updated with the nonce to produce a block hash
+        """
+        return hashlib.sha256(self.get_header_prefix())
 
     def get_block_hash(self):
         """
-        Returns the hash of a block
+        Returns the hash of a block in bytes
         """
-        record_list = []
-        # Get a JSON representation for each record in the block
-        for record in self.records:
-            record_data = {
-                'aircraft_reg_number': record.aircraft_reg_number,
-                'date_of_record': record.date_of_record,
-                'filename': record.filename,
-                'file_hash': record.file_hash
-            }
-            record_list.append(record_data)
+        return hashlib.sha256(self.get_header()).digest()
+
+
+def get_block_header_prefix(index, previous_hash, timestamp, difficulty, merkle_root):
+    """
+    Returns a block header without the nonce from the header's fields
+    :param index:           Index of the block
+    :param previous_hash:   Hash of the previous block in the chain in bytes
+    :param timestamp:       Time the block was created
+    :param difficulty:      Number of leading zero bits required in the block's hash
+    :param merkle_root:     Merkle root of the block's records in bytes
+    :return:                Header prefix in bytes
+    """
+    return struct.pack(header_prefix_format, index, previous_hash, timestamp, difficulty, merkle_root)
+
+
+def get_block_hash_from_header(header_dict):
+    """
+    Returns the hash of a block from a header in dictionary format, allowing a client
+    holding only block headers to check them
+    :param header_dict: Block header in dictionary format
+    :return:            Block hash in bytes
+    """
+    header_prefix = get_block_header_prefix(header_dict['index'],
+                                            get_hash_from_hex(header_dict['previous_hash']),
+                                            header_dict['timestamp'],
+                                            header_dict['difficulty'],
+                                            get_hash_from_hex(header_dict['merkle_root']))
+    return hashlib.sha256(header_prefix + struct.pack(nonce_format, header_dict['nonce'])).digest()
 
-        # Representation of block without it's hash
-        block = {
-            "index": self.index,
-            "previous_hash": self.previous_hash,
-            "timestamp": self.timestamp,
-            "nonce": self.nonce,
-            "records": record_list
-        }
 
-        json_block = json.dumps(block, sort_keys=True)
-        return hashlib.sha256(json_block.encode()).hexdigest()
+def get_block_digest_from_midstate(midstate, nonce):
+    """
+    Returns the hash of a block from its midstate and a nonce
+    :param midstate:    Hash object that has consumed the block's header prefix
+    :param nonce:       Nonce to hash
+    :return:            Block hash in bytes
+    """
+    block_hash = midstate.copy()
+    block_hash.update(struct.pack(nonce_format, nonce))
+    return block_hash.digest()
 
 
+def get_hash_from_hex(hex_hash):
+    """
+    Converts a hash in hex format, as blocks are sent and stored, to bytes
+    :param hex_hash:    Hash in hex format
+    :return:            Hash in bytes
+    """
+    # The genesis block's previous hash of "0" is padded to the length of a SHA-256 hash
+    return bytes.fromhex(hex_hash.rjust(64, '0'))
@@ -0,0 +1,412 @@
+import json
+import os
+import struct
+import threading
+import zlib
+
+from blockchain.durability import GroupCommit, fsync_file, replace_file
+
+# Each entry in the index is the offset of a block in the log
+offset_format = '>Q'
+offset_size = struct.calcsize(offset_format)
+
+
+def encode_entry(block_encoding):
+    """
+    Encodes a block as a log entry, a CRC32 checksum followed by the block in JSON format
+    :param block_encoding:  Canonical encoding of the block in bytes
+    :return:                Log entry in bytes
+    """
+    return b'%08x ' % zlib.crc32(block_encoding) + block_encoding + b'\n'
+
+
+def encode_header(block_dict):
+    """
+    Encodes the header of a block and the filenames of its records as a line of the header file
+    :param block_dict:  Block in dictionary format
+    :return:            Block header in JSON format followed by a newline, in bytes
+    """
+    header_dict = {field: value for field, value in block_dict.items() if field != 'records'}
+    header_dict['record_filenames'] = [record['filename'] for record in block_dict['records']]
+    return json.dumps(header_dict, sort_keys=True, separators=(',', ':')).encode() + b'\n'
+
+
+def decode_entry(entry):
+    """
+    Decodes a log entry back to a block
+    :param entry:   Log entry in bytes
+    :return:        Block in dictionary format, None if the entry is torn or corrupt
+    """
+    if len(entry) < 10 or not entry.endswith(b'\n') or entry[8:9] != b' ':
+        return None
+
+    json_block = entry[9:-1]
+    try:
+        if int(entry[:8], 16) != zlib.crc32(json_block):
+            return None
+        return json.loads(json_block)
+    except ValueError:
+        return None
+
+
+class BlockLog:
+    log_path = None
+    index_path = None
+    headers_path = None
+    offsets = []
+
+    def __init__(self, log_path, index_path, commit_window=0.005, headers_path=None):
+        """
+        BlockLog class constructor, an append-only log of blocks with an index of the offset
+        of every block in the log. Each entry is checksummed, so the log doubles as a
+        write-ahead log the index can be rebuilt from after a crash.
+        :param log_path:        Path to the file holding the log
+        :param index_path:      Path to the file holding the block offsets
+        :param commit_window:   Seconds an fsync waits for more appended blocks to join it
+        :param headers_path:    Path to the file holding a copy of every block header, so the
+                                headers are read without parsing every block's records. Headers
+                                are read from the log when this is not provided.
+        """
+        self.log_path = log_path
+        self.index_path = index_path
+        self.headers_path = headers_path
+        self.offsets = []
+        self.log_file = None
+        self.lock = threading.Lock()
+        self.group_commit = GroupCommit(self.sync_log, commit_window)
+        self.recover()
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def recover(self):
+        """
+        Loads the block offsets and removes a torn entry left at the end of the log by a crash
+        """
+        with self.lock:
+            if not os.path.exists(self.log_path):
+                self.offsets = []
+                self.recover_header_file()
+                return
+
+            log_size = os.path.getsize(self.log_path)
+            indexed_offsets = self.read_index()
+
+            # Index entries must be increasing and point inside the log
+            self.offsets = []
+            for offset in indexed_offsets:
+                if offset >= log_size or (self.offsets and offset <= self.offsets[-1]):
+                    break
+                self.offsets.append(offset)
+
+            with open(self.log_path, 'rb') as log_file:
+                # Check the last indexed entry, then pick up entries missing from the index
+                scan_offset = self.offsets.pop() if self.offsets else 0
+                log_file.seek(scan_offset)
+                while scan_offset < log_size:
+                    entry = log_file.readline()
+                    if decode_entry(entry) is None:
+                        break
+                    self.offsets.append(scan_offset)
+                    scan_offset += len(entry)
+
+            # Remove the torn entry and everything after it
+            if scan_offset < log_size:
+                with open(self.log_path, 'r+b') as log_file:
+                    log_file.truncate(scan_offset)
+
+            if self.offsets != indexed_offsets:
+                self.write_index()
+            self.recover_header_file()
+
+    def read_index(self):
+        """
+        :return: Block offsets stored in the index, ignoring a partly written offset
+        """
+        if not os.path.exists(self.index_path):
+            return []
+
+        with open(self.index_path, 'rb') as index_file:
+            data = index_file.read()
+
+        complete_size = len(data) - len(data) % offset_size
+        return [offset for (offset,) in struct.iter_unpack(offset_format, data[:complete_size])]
+
+    def write_index(self):
+        """
+        Writes every block offset to the index, replacing the old index atomically
+        """
+        temp_path = self.index_path + ".tmp"
+        with open(temp_path, 'wb') as index_file:
+            index_file.write(b''.join(struct.pack(offset_format, offset) for offset in self.offsets))
+        replace_file(temp_path, self.index_path)
+
+    def append(self, block_encoding):
+        """
+        Appends a block to the end of the log, only the new block is written. The block is
+        only durable once wait_for_commit returns for the write.
+        :param block_encoding:  Canonical encoding of the block in bytes
+        :return:                Sequence number of the write
+        """
+        entry = encode_entry(block_encoding)
+        with self.lock:
+            if self.log_file is None:
+                self.log_file = open(self.log_path, 'ab')
+            offset = self.log_file.tell()
+            self.log_file.write(entry)
+            self.log_file.flush()
+
+            # The index and header file aren't synced, they are rebuilt from the log after a crash
+            with open(self.index_path, 'ab') as index_file:
+                index_file.write(struct.pack(offset_format, offset))
+            if self.headers_path is not None:
+                with open(self.headers_path, 'ab') as headers_file:
+                    headers_file.write(encode_header(json.loads(block_encoding)))
+            self.offsets.append(offset)
+            return self.group_commit.add_write()
+
+    def sync_log(self):
+        """
+        Syncs every block appended to the log to disk
+        """
+        with self.lock:
+            if self.log_file is None:
+                return
+            log_fd = os.dup(self.log_file.fileno())
+
+        # Blocks can still be appended whilst the log is synced
+        try:
+            os.fsync(log_fd)
+        finally:
+            os.close(log_fd)
+
+    def wait_for_commit(self, sequence):
+        """
+        Waits until an appended block is durable, blocks appended together share one fsync
+        :param sequence:    Sequence number of the write
+        """
+        self.group_commit.wait(sequence)
+
+    def read(self, index):
+        """
+        Reads a single block from the log
+        :param index:   Index of the block
+        :return:        Block in dictionary format
+        """
+        with self.lock:
+            return self.read_unlocked(index)
+
+    def read_unlocked(self, index):
+        """
+        Reads a single block from the log, the caller must hold the lock
+        :param index:   Index of the block
+        :return:        Block in dictionary format
+        """
+        with open(self.log_path, 'rb') as log_file:
+            log_file.seek(self.offsets[index])
+            return decode_entry(log_file.readline())
+
+    def read_all(self, start_index=0):
+        """
+        Reads every block from the log
+        :param start_index: Index of the first block to read
+        :return:            List of blocks in dictionary format
+        """
+        with self.lock:
+            if not os.path.exists(self.log_path) or start_index >= len(self.offsets):
+                return []
+
+            block_dicts = []
+            with open(self.log_path, 'rb') as log_file:
+                log_file.seek(self.offsets[start_index])
+                for _ in range(start_index, len(self.offsets)):
+                    block_dicts.append(decode_entry(log_file.readline()))
+            return block_dicts
+
+    def read_headers(self, start_index=0):
+        """
+        Reads the header of every block, from the header file when there is one so no block's
+        records are parsed, otherwise the log holds whole blocks so every block is read
+        :param start_index: Index of the first block to read
+        :return:            List of block headers in dictionary format
+        """
+        if self.headers_path is not None:
+            headers = self.read_header_file(start_index)
+            for header_dict in headers:
+                del header_dict['record_filenames']
+            return headers
+
+        headers = []
+        for block_dict in self.read_all(start_index):
+            del block_dict['records']
+            headers.append(block_dict)
+        return headers
+
+    def read_header_file(self, start_index=0):
+        """
+        Reads the header file, which holds a line for every block in the log once the log
+        is recovered
+        :param start_index: Index of the first block to read
+        :return:            List of block headers with the filenames of their records, in
+                            dictionary format
+        """
+        with self.lock:
+            if not self.offsets:
+                return []
+            with open(self.headers_path, 'rb') as headers_file:
+                return [json.loads(line) for index, line in zip(range(len(self.offsets)), headers_file)
+                        if index >= start_index]
+
+    def recover_header_file(self):
+        """
+        Rebuilds the header file from the log when it doesn't hold exactly one complete header
+        for each block or its last header doesn't match the last block, e.g. after a crash.
+        The caller must hold the lock.
+        """
+        if self.headers_path is None:
+            return
+
+        num_headers, last_line = 0, b''
+        if os.path.exists(self.headers_path):
+            with open(self.headers_path, 'rb') as headers_file:
+                for last_line in headers_file:
+                    num_headers += 1
+
+        if num_headers == len(self.offsets) and (num_headers == 0 or last_line.endswith(b'\n')):
+            try:
+                last_block = self.read_unlocked(num_headers - 1) if num_headers > 0 else None
+                if num_headers == 0 or (last_block is not None and json.loads(last_line)['hash'] == last_block['hash']):
+                    return
+            except (ValueError, KeyError):
+                pass
+
+        header_encodings = []
+        if self.offsets:
+            with open(self.log_path, 'rb') as log_file:
+                for offset in self.offsets:
+                    log_file.seek(offset)
+                    block_dict = decode_entry(log_file.readline())
+                    if block_dict is None:
+                        break
+                    header_encodings.append(encode_header(block_dict))
+
+        # A block that can't be read is treated like a torn entry, the log is cut back to the
+        # blocks before it as the chain would be once the block was found to be invalid
+        if len(header_encodings) < len(self.offsets):
+            with open(self.log_path, 'r+b') as log_file:
+                log_file.truncate(self.offsets[len(header_encodings)])
+                fsync_file(log_file)
+            self.offsets = self.offsets[:len(header_encodings)]
+            self.write_index()
+        self.write_header_file(header_encodings)
+
+    def write_header_file(self, header_encodings):
+        """
+        Writes every block header to the header file, replacing the old file atomically
+        :param header_encodings:    List of header file lines in bytes, see encode_header
+        """
+        temp_path = self.headers_path + ".tmp"
+        with open(temp_path, 'wb') as headers_file:
+            headers_file.write(b''.join(header_encodings))
+        replace_file(temp_path, self.headers_path)
+
+    def read_record_filenames(self, start_index=0):
+        """
+        Reads the filename of every record, from the header file when there is one, otherwise
+        by scanning every block
+        :param start_index: Index of the first block to read
+        :return:            List of tuples of a record's filename and the index of its block
+        """
+        if self.headers_path is not None:
+            return [(filename, header_dict['index']) for header_dict in self.read_header_file(start_index)
+                    for filename in header_dict['record_filenames']]
+
+        return [(record['filename'], block_dict['index'])
+                for block_dict in self.read_all(start_index) for record in block_dict['records']]
+
+    def rewrite(self, block_encodings):
+        """
+        Replaces every block in the log, e.g. when adopting a peer's chain
+        :param block_encodings: List of canonical block encodings in bytes
+        """
+        with self.lock:
+            if self.log_file is not None:
+                self.log_file.close()
+                self.log_file = None
+
+            # The new log is written and synced beside the old one, then renamed over it
+            temp_path = self.log_path + ".tmp"
+            offsets = []
+            with open(temp_path, 'wb') as log_file:
+                for block_encoding in block_encodings:
+                    offsets.append(log_file.tell())
+                    log_file.write(encode_entry(block_encoding))
+                fsync_file(log_file)
+
+            # The old index is emptied first, so a crash before the new index is written leaves
+            # 'recover' to rebuild it by scanning the new log rather than trusting old offsets
+            self.offsets = []
+            self.write_index()
+            replace_file(temp_path, self.log_path)
+
+            self.offsets = offsets
+            self.write_index()
+            if self.headers_path is not None:
+                self.write_header_file([encode_header(json.loads(encoding)) for encoding in block_encodings])
+
+    def truncate(self, length):
+        """
+        Removes every block after the first 'length' blocks, e.g. when they are orphaned by a fork
+        :param length:  Number of blocks kept
+        """
+        with self.lock:
+            if length >= len(self.offsets):
+                return
+
+            if self.log_file is not None:
+                self.log_file.close()
+                self.log_file = None
+
+            # Index entries past the end of the log are dropped by 'recover' after a crash
+            with open(self.log_path, 'r+b') as log_file:
+                log_file.truncate(self.offsets[length])
+                fsync_file(log_file)
+
+            self.offsets = self.offsets[:length]
+            self.write_index()
+            if self.headers_path is not None:
+                self.truncate_header_file(length)
+
+    def truncate_header_file(self, length):
+        """
+        Removes every header after the first 'length' headers from the header file
+        :param length:  Number of headers kept
+        """
+        with open(self.headers_path, 'rb') as headers_file:
+            header_encodings = [line for _, line in zip(range(length), headers_file)]
+        self.write_header_file(header_encodings)
+
+    def find_block_index(self, filename):
+        """
+        Finds the block a record was verified in, the log has no record index so the filename
+        of every record is scanned
+        :param filename:    Filename of the record
+        :return:            Index of the block, None if the record is not on the chain
+        """
+        for record_filename, block_index in self.read_record_filenames():
+            if record_filename == filename:
+                return block_index
+        return None
+
+    def get_records_by_aircraft(self, aircraft_reg_number):
+        """
+        Finds every record for an aircraft by scanning every block
+        :param aircraft_reg_number: Registration number of the aircraft
+        :return:                    List of records in dictionary format, in chain order
+        """
+        records = []
+        for block_dict in self.read_all():
+            for record in block_dict['records']:
+                if record['aircraft_reg_number'] == aircraft_reg_number:
+                    records.append(record)
+        return records
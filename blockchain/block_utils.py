@@ -1,53 +1,165 @@
-import hashlib
+import json
+import math
 import os
 
-from blockchain import chain_utils
-from blockchain.block import Block
-from blockchain.maintenance_record import MaintenanceRecord
+from blockchain import chain_utils, merkle_utils, maintenance_record
+from blockchain.block import Block, get_hash_from_hex
 
 
 def get_block_object_from_dict(block_dict):
     """
     Blocks are sometimes represented in their dictionary form to allow JSON serialisation
-    of block. 'get_object_from_dict' returns a block to a Block object.
+    of block. 'get_object_from_dict' returns a block to a Block object, converting hashes
+    from hex format to bytes.
 
     :param block_dict:  A dictionary representing a block object
-    :return:            A Block object
+    :return:            A Block object, None if the block is malformed or its hash is not valid
     """
+    if not is_block_dict_well_formed(block_dict):
+        return None
+
     index = block_dict["index"]
     nonce = block_dict["nonce"]
-    block_hash = block_dict["hash"]
+    block_difficulty = block_dict["difficulty"]
+    block_hash = get_hash_from_hex(block_dict["hash"])
     timestamp = block_dict["timestamp"]
-    previous_hash = block_dict["previous_hash"]
+    previous_hash = get_hash_from_hex(block_dict["previous_hash"])
 
     records = []
     for record_dict in block_dict["records"]:
         record = get_record_object_from_dict(record_dict, False)
+        if record is None:
+            return None
         records.append(record)
 
-    block = Block(index, previous_hash, timestamp, records, nonce)
+    block = Block(index, previous_hash, timestamp, records, nonce, block_difficulty)
+    if block_dict.get("signer") is not None:
+        block.signer = bytes.fromhex(block_dict["signer"])
+        block.signature = bytes.fromhex(block_dict["signature"])
     if block.get_block_hash() == block_hash:
         block.hash = block_hash
         return block
     return None
 
 
+def is_block_dict_well_formed(block_dict):
+    """
+    Checks a block received from a peer has every field with a value the block header can
+    hold, so a malformed block is rejected rather than failing when it is hashed
+    :param block_dict:  Block in dictionary format
+    :return:            True if block is well formed, False otherwise
+    """
+    if not isinstance(block_dict, dict):
+        return False
+
+    # Integer fields must fit in the header, booleans are integers in Python so are excluded
+    for field, max_value in (('index', 2 ** 64 - 1), ('nonce', 2 ** 64 - 1), ('difficulty', 255)):
+        value = block_dict.get(field)
+        if not isinstance(value, int) or isinstance(value, bool) or not 0 <= value <= max_value:
+            return False
+
+    timestamp = block_dict.get('timestamp')
+    if not isinstance(timestamp, (int, float)) or isinstance(timestamp, bool) or not math.isfinite(timestamp):
+        return False
+
+    # The genesis block's previous hash of "0" is shorter than a SHA-256 hash
+    for field in ('hash', 'previous_hash'):
+        if not is_hex_well_formed(block_dict.get(field), 64):
+            return False
+    # Ed25519 public keys are 32 bytes and signatures 64 bytes
+    for field, length in (('signer', 64), ('signature', 128)):
+        value = block_dict.get(field)
+        if value is not None and not (is_hex_well_formed(value, length) and len(value) == length):
+            return False
+    if block_dict.get('signer') is not None and block_dict.get('signature') is None:
+        return False
+
+    records = block_dict.get('records')
+    if not isinstance(records, list):
+        return False
+    # Peers send each record's file hash, the node may not have the record's file to hash itself
+    record_fields = ('aircraft_reg_number', 'date_of_record', 'filename')
+    return all(isinstance(record, dict) and all(field in record for field in record_fields) and
+               is_file_hash_well_formed(record.get('file_hash')) for record in records)
+
+
+def is_hex_well_formed(value, max_length):
+    """
+    :param value:       Value in question
+    :param max_length:  Maximum number of hex digits
+    :return:            True if value is a non-empty string of at most max_length hex digits
+    """
+    if not isinstance(value, str) or not 0 < len(value) <= max_length:
+        return False
+    return all(character in '0123456789abcdefABCDEF' for character in value)
+
+
+def get_header_object_from_dict(header_dict):
+    """
+    Converts a block header in dictionary format to a Block object without records, the
+    header's Merkle root stands in for the records so the block hash can still be checked
+    :param header_dict: Block header in dictionary format
+    :return:            Block object holding only the header
+    """
+    header = Block(header_dict["index"],
+                   get_hash_from_hex(header_dict["previous_hash"]),
+                   header_dict["timestamp"],
+                   [],
+                   header_dict["nonce"],
+                   header_dict["difficulty"])
+    header.records = None
+    header.merkle_root = get_hash_from_hex(header_dict["merkle_root"])
+    if header_dict.get("signer") is not None:
+        header.signer = bytes.fromhex(header_dict["signer"])
+        header.signature = bytes.fromhex(header_dict["signature"])
+    header.hash = get_hash_from_hex(header_dict["hash"])
+    return header
+
+
+def get_header_object_from_block(block):
+    """
+    :param block:   Block with its records
+    :return:        Block object holding only the block's header
+    """
+    return get_header_object_from_dict(get_header_dict_from_object(block))
+
+
 def get_record_object_from_dict(record_dict, stored):
     """
-    Converts a record in dictionary format to object form
+    Converts a record in dictionary format to object form. A file hash carried in the record
+    is trusted rather than re-hashing the file, the file is only hashed when it is missing.
     :param stored:      Determines which directory
     :param record_dict: Record in dictionary format
-    :return:            Record in MaintenanceRecord type
+    :return:            Record in MaintenanceRecord type, None if the file hash is malformed or
+                        there is no file hash and the node doesn't have the record's file
     """
-    if stored:
-        file_path = path_to_stored_record(record_dict['filename'])
+    file_hash = record_dict.get('file_hash')
+    if file_hash is not None:
+        if not is_file_hash_well_formed(file_hash):
+            return None
+        file_hash = bytes.fromhex(file_hash)
     else:
-        file_path = path_to_unused_record(record_dict['filename'])
+        # The file is hashed by this node, so the node must have it
+        record_exists = stored_maintenance_record_exists if stored else unused_maintenance_record_exists
+        if not record_exists(record_dict['filename']):
+            return None
 
-    return MaintenanceRecord(record_dict['aircraft_reg_number'],
-                             record_dict['date_of_record'],
-                             record_dict['filename'],
-                             file_path)
+    return maintenance_record.MaintenanceRecord(record_dict['aircraft_reg_number'],
+                                                record_dict['date_of_record'],
+                                                record_dict['filename'],
+                                                stored,
+                                                file_hash)
+
+
+def is_file_hash_well_formed(file_hash):
+    """
+    Checks a file hash received from storage or a peer is a SHA-256 hash in hex format
+    :param file_hash:   File hash in question
+    :return:            True if file hash is well formed, False otherwise
+    """
+    if not isinstance(file_hash, str) or len(file_hash) != 64:
+        return False
+    return all(character in '0123456789abcdef' for character in file_hash)
 
 
 def get_block_dict_from_object(block):
@@ -56,28 +168,98 @@ def get_block_dict_from_object(block):
     :param block:   Regular block from a node's chain
     :return:        Block in format suitable for JSON serialisation
     """
-    formatted_records = []
-    for record in block.records:
-        record_data = {
-            'aircraft_reg_number': record.aircraft_reg_number,
-            'date_of_record': record.date_of_record,
-            'filename': record.filename,
-            'file_hash': record.file_hash
-        }
-        formatted_records.append(record_data)
+    formatted_records = [record.get_record_data() for record in block.records]
 
     block_dict = {
         'index': block.index,
-        'previous_hash': block.previous_hash,
+        'previous_hash': block.previous_hash.hex(),
         'timestamp': block.timestamp,
         'nonce': block.nonce,
+        'difficulty': block.difficulty,
+        'merkle_root': block.get_merkle_root().hex(),
         'records': formatted_records,
-        'hash': block.hash
+        'hash': get_hex_from_hash(block.hash),
+        'signer': get_hex_from_hash(block.signer),
+        'signature': get_hex_from_hash(block.signature)
     }
 
     return block_dict
 
 
+def get_block_encoding(block):
+    """
+    Gets the canonical encoding of a block, the block in JSON format with sorted keys and no
+    whitespace. A sealed block is only encoded once, the encoding is reused whenever the
+    block is stored or sent to a peer.
+    :param block:   Regular block from a node's chain
+    :return:        Block encoding in bytes
+    """
+    if block.encoding is not None:
+        return block.encoding
+
+    block_encoding = json.dumps(get_block_dict_from_object(block), sort_keys=True, separators=(',', ':')).encode()
+    if block.hash is not None:
+        block.encoding = block_encoding
+    return block_encoding
+
+
+def get_header_dict_from_object(block):
+    """
+    Gets the header of a block in a format suitable for JSON serialisation
+    :param block:   Regular block from a node's chain
+    :return:        Block header in dictionary format
+    """
+    return {
+        'index': block.index,
+        'previous_hash': block.previous_hash.hex(),
+        'timestamp': block.timestamp,
+        'nonce': block.nonce,
+        'difficulty': block.difficulty,
+        'merkle_root': block.get_merkle_root().hex(),
+        'hash': get_hex_from_hash(block.hash),
+        'signer': get_hex_from_hash(block.signer),
+        'signature': get_hex_from_hash(block.signature)
+    }
+
+
+def get_hex_from_hash(hash_bytes):
+    """
+    :param hash_bytes:  Hash, key or signature in bytes, or None
+    :return:            Value in hex format, None if no value was given
+    """
+    return None if hash_bytes is None else hash_bytes.hex()
+
+
+def is_record_proof_valid(header_dict, record_dict, proof, headers, authorities=None):
+    """
+    Checks a record is included in a block using only the block's header, allowing clients
+    holding only block headers to verify records without the whole chain
+    :param header_dict: Header of the block the record is in
+    :param record_dict: Record in dictionary format
+    :param proof:       Merkle inclusion proof for the record, in JSON format
+    :param headers:     Block headers in object form the client trusts, e.g. a node's
+                        chain.headers, the header must be one of them
+    :param authorities: Set of public keys in bytes allowed to seal blocks under proof of
+                        authority, the configured authorities are used when not provided
+    :return:            True if the record is in the block, False otherwise
+    """
+    # Imported here as consensus imports chain_utils, which imports this module
+    from blockchain import consensus
+
+    # Header must hash to the block hash and be sealed under the network's consensus algorithm
+    header = get_header_object_from_dict(header_dict)
+    if not consensus.is_header_sealed(header, authorities):
+        return False
+
+    # A header sealed at a low difficulty it claims itself is cheap to forge, so the header must
+    # also be the one on the trusted chain at its height
+    if not 0 <= header.index < len(headers) or headers[header.index].hash != header.hash:
+        return False
+
+    leaf_hash = merkle_utils.get_leaf_hash(record_dict)
+    return merkle_utils.is_merkle_proof_valid(leaf_hash, merkle_utils.get_proof_from_dict(proof), header.merkle_root)
+
+
 def is_record_valid(record):
     """
     Checks the validity of a record
@@ -109,7 +291,7 @@ def path_to_unused_record(filename):
 
 
 def path_to_stored_record(filename):
-    if unused_maintenance_record_exists(filename):
+    if stored_maintenance_record_exists(filename):
         return str(chain_utils.get_app_root_directory()) + f"/data/records/used/{filename}"
     return None
 
@@ -133,22 +315,5 @@ def move_record_file(filename):
 
 
 def get_checksum_of_file(file_path):
-    # MD5 checksum
-    md5_hash = hashlib.md5()
-
-    # Open file as file
-    with open(file_path, 'rb') as file:
-        while True:
-            # Read 1024 bytes
-            data = file.read(1024)
-
-            # Reached end of file, no more data to read
-            if not data:
-                break
-
-            # Update hash with new data
-            md5_hash.update(data)
-        # Close file when finished
-        file.close()
-
-    return md5_hash.hexdigest()
+    # MD5 checksum, files that are unchanged since they were last hashed are not read again
+    return chain_utils.get_fingerprint_cache().get_md5(file_path)
@@ -1,10 +1,15 @@
+import atexit
 import os
+import threading
 import time
-import json
 
+from blockchain.assembly_policy import BlockAssemblyPolicy
 from blockchain.block import Block
+from blockchain.consensus import get_consensus
+from blockchain.lazy_chain import CorruptBlockError, ForkedChain
+from blockchain.miner import Miner, MiningSession
 from blockchain.record_pool import RecordPool
-from blockchain import chain_utils
+from blockchain import chain_utils, difficulty, merkle_utils
 
 # Create logger
 logger = chain_utils.init_logger("Chain")
@@ -12,7 +17,21 @@ logger = chain_utils.init_logger("Chain")
 
 class Blockchain:
     chain = []
-    mining_difficulty = 4
+    # Number of processes used to mine a block, defaults to every core on the machine
+    mining_workers = int(os.environ.get("MIBLOCK_MINING_WORKERS", 0)) or None
+    # Policy deciding which records from the record pool go in a mined block
+    assembly_policy = BlockAssemblyPolicy(int(os.environ.get("MIBLOCK_BLOCK_MAX_RECORDS", 500)),
+                                          int(os.environ.get("MIBLOCK_BLOCK_MAX_SIZE", 1000000)),
+                                          os.environ.get("MIBLOCK_BLOCK_ORDERING", "arrival"))
+    # Number of blocks whose records are held in memory, other blocks are read from storage
+    block_cache_size = int(os.environ.get("MIBLOCK_BLOCK_CACHE_SIZE", 1000))
+    # Number of blocks added between snapshots of the chain's headers and record index
+    snapshot_interval = int(os.environ.get("MIBLOCK_SNAPSHOT_INTERVAL", 100))
+    # Blocks checked by background validation between pauses, and the length of a pause
+    background_validation_segment = 100
+    background_validation_pause = 0.01
+    # Every node creates the same genesis block, so chains from different nodes share their first block
+    genesis_timestamp = 0.0
 
     def __init__(self):
         """
@@ -20,13 +39,35 @@ class Blockchain:
         """
         logger.info("Initialising node's chain")
         self.record_pool = RecordPool()
-        self.chain = chain_utils.load_chain_from_storage()
+        self.miner = Miner(self.mining_workers)
+        # Consensus algorithm sealing and checking blocks, chosen with MIBLOCK_CONSENSUS
+        self.consensus = get_consensus(self.miner)
+        self.mining_session = None
+        self.chain_lock = threading.RLock()
+        self.record_index = {}
+        self.background_validation = {'running': False, 'valid': None, 'checked': 0}
+        self.genesis_hash = self.create_genesis_block().hash
+
+        # Headers and record index are loaded from the local snapshot when it is intact
+        self.chain = chain_utils.load_chain_from_storage(self.block_cache_size, chain_utils.load_chain_snapshot())
         if len(self.chain) == 0:
             self.init_chain()
+        self.build_record_index()
+        self.chain_work = self.get_chain_work(self.chain.headers)
+
+        # Blocks beyond the validation checkpoint are checked before the chain is extended
+        self.load_validation_checkpoint()
+        self.validate_new_blocks()
+
+        # Blocks loaded from the snapshot weren't hashed, so the whole chain is checked in the background
+        if self.chain.snapshot_length > 0:
+            logger.info(f"Loaded '{self.chain.snapshot_length}' block headers from the local snapshot")
+            self.start_background_validation()
+        atexit.register(self.write_snapshot)
 
     def init_chain(self):
         """
-        Initialises the blockchain with genesis block and writes it to a JSON file
+        Initialises the blockchain with genesis block and writes it to the block log
         """
         logger.info("Generating genesis block...")
         self.generate_genesis_block()
@@ -35,44 +76,255 @@ class Blockchain:
         if not os.path.exists(f"{app_root_dir}/data"):
             chain_utils.generate_data_folder()
 
-        logger.info("Generating blocks.json...")
-        blocks_json_file = open(f"{app_root_dir}/data/blocks.json", "w")
-        chain_json = chain_utils.get_chain_json(self.chain)
-        json.dump(chain_json, blocks_json_file, sort_keys=True, indent=2)
-        blocks_json_file.close()
-        self.chain = chain_utils.load_chain_from_storage()
+        logger.info("Generating block log...")
+        chain_utils.write_chain(self.chain)
+        self.chain = chain_utils.load_chain_from_storage(self.block_cache_size)
+
+    def replace_chain(self, chain):
+        """
+        Replaces the node's chain, e.g. with a longer chain from a peer. The new chain is
+        checked before it is written to storage and only its headers are kept in memory.
+        :param chain:   Chain in object form
+        :return:        True if the chain was replaced, False if the new chain is not valid
+        """
+        with self.chain_lock:
+            if len(chain) == 0 or None in chain or not self.is_chain_segment_valid(chain, 0, len(chain)):
+                logger.error("Chain not replaced - new chain is not valid")
+                return False
+
+            chain_utils.write_chain(chain)
+            self.chain = chain_utils.load_chain_from_storage(self.block_cache_size)
+            self.build_record_index()
+            self.chain_work = self.get_chain_work(self.chain.headers)
+
+            # New chain was checked above, blocks are only read back to check they were stored intact
+            self.validated_index, self.validated_hash = -1, None
+            if self.validate_new_blocks():
+                self.write_snapshot()
+
+            # Any block being mined was built on the replaced chain
+            if self.mining_session is not None:
+                self.mining_session.cancel()
+            return True
+
+    def get_block_locator(self):
+        """
+        Gets a block locator, the hashes of blocks at exponentially increasing depths from the
+        end of the chain. A peer finds the last block both chains share from a locator of a
+        few dozen hashes, however long the chain is.
+        :return: List of tuples of a block's index and hash, from the end of the chain back
+                 to the genesis block
+        """
+        headers = self.chain.headers
+        locator = []
+
+        # The ten most recent blocks are listed one by one, then the gaps double each time
+        index, step = len(headers) - 1, 1
+        while index > 0:
+            locator.append((index, headers[index].hash))
+            if len(locator) >= 10:
+                step *= 2
+            index -= step
+        locator.append((0, headers[0].hash))
+        return locator
+
+    def find_common_ancestor(self, locator):
+        """
+        Finds the last block the node's chain shares with a peer's chain
+        :param locator: Peer's block locator, see get_block_locator
+        :return:        Index of the common ancestor, -1 if the chains share no blocks
+        """
+        headers = self.chain.headers
+        for index, block_hash in locator:
+            if index < len(headers) and headers[index].hash == block_hash:
+                return index
+        return -1
+
+    def sync_chain(self, ancestor_index, blocks):
+        """
+        Adopts a peer's chain given only the peer's blocks after the last block both chains
+        share, blocks that extend the node's chain are added one at a time
+        :param ancestor_index:  Index of the common ancestor, see find_common_ancestor
+        :param blocks:          Peer's blocks after the common ancestor in object form
+        :return:                True if the peer's blocks were adopted, False otherwise
+        """
+        if len(blocks) == 0 or None in blocks:
+            return False
+
+        # Every chain starts from the same genesis block, a peer's chain sharing no block with
+        # the node's chain is only adopted if it starts from the node's genesis block
+        if ancestor_index == -1:
+            if blocks[0].index != 0 or blocks[0].hash != self.genesis_hash:
+                logger.error("Peer's blocks not adopted - peer's chain has another genesis block")
+                return False
+            ancestor_index, blocks = 0, blocks[1:]
+            if len(blocks) == 0:
+                return False
+
+        with self.chain_lock:
+            # Gaps in the locator can put the ancestor below where the chains diverge, blocks the
+            # node already has are skipped rather than rolled back and added again
+            while blocks and ancestor_index + 1 < len(self.chain) and blocks[0].index == ancestor_index + 1 and \
+                    blocks[0].hash == self.chain.headers[ancestor_index + 1].hash:
+                ancestor_index, blocks = ancestor_index + 1, blocks[1:]
+            if len(blocks) == 0:
+                return False
+
+            if ancestor_index == len(self.chain) - 1:
+                for block in blocks:
+                    if not self.add_block(block):
+                        return False
+                return True
+
+            # The chains have diverged, the fork with the most work wins
+            return self.reorganise(ancestor_index, blocks)
+
+    def reorganise(self, ancestor_index, blocks):
+        """
+        Switches to a peer's fork if it has more cumulative work than the node's chain. Only
+        the blocks after the common ancestor are checked, rolled back and added, so a
+        reorganisation costs work in proportion to its depth. Records in orphaned blocks that
+        aren't on the fork are returned to the record pool.
+        :param ancestor_index:  Index of the last block both chains share
+        :param blocks:          Peer's blocks after the common ancestor in object form
+        :return:                True if the node switched to the fork, False otherwise
+        """
+        with self.chain_lock:
+            # The genesis block is never orphaned
+            if not 0 <= ancestor_index < len(self.chain):
+                return False
+
+            # Fork's blocks must follow on from the common ancestor and be validly sealed
+            forked_chain = ForkedChain(self.chain, ancestor_index, blocks)
+            if any(block.index != ancestor_index + 1 + offset for offset, block in enumerate(blocks)) or \
+                    not self.is_chain_segment_valid(forked_chain, ancestor_index + 1, len(forked_chain)):
+                logger.error(f"Fork after index '{ancestor_index}' not adopted - fork is not valid")
+                return False
+
+            fork_work = self.get_chain_work(blocks)
+            orphaned_work = self.get_chain_work(self.chain.headers[ancestor_index + 1:])
+            if fork_work <= orphaned_work:
+                logger.info(f"Fork after index '{ancestor_index}' not adopted - fork has less work")
+                return False
+
+            logger.info(f"Reorganising chain after index '{ancestor_index}', orphaning "
+                        f"'{len(self.chain) - ancestor_index - 1}' blocks for '{len(blocks)}' blocks")
+
+            # Roll back the orphaned blocks, records in a corrupt block can't be returned to the pool
+            orphaned_blocks = []
+            for index in range(ancestor_index + 1, len(self.chain)):
+                try:
+                    orphaned_blocks.append(self.chain[index])
+                except CorruptBlockError as error:
+                    logger.error(f"Records of orphaned block not restored - {error}")
+            self.roll_back_chain(ancestor_index + 1)
+
+            # Add the fork's blocks
+            commit_sequence = None
+            for block in blocks:
+                commit_sequence = chain_utils.write_block_to_chain(block)
+                self.chain.append(block)
+                self.index_block_records(block)
+            self.chain_work += fork_work
+
+            # Records that were only in orphaned blocks need verifying again
+            self.record_pool.restore_records([record for block in orphaned_blocks for record in block.records
+                                              if record.filename not in self.record_index])
+
+            # Fork was checked above, so a validated chain stays validated
+            if self.validated_index >= ancestor_index:
+                self.set_validation_checkpoint(blocks[-1])
+
+        chain_utils.wait_for_chain_commit(commit_sequence)
+        return True
+
+    def roll_back_chain(self, length):
+        """
+        Removes every block after the first 'length' blocks from the chain and its storage.
+        Records in the removed blocks are no longer on the chain, so are removed from the
+        record index. Only the headers of the removed blocks are read.
+        :param length:  Number of blocks kept
+        """
+        with self.chain_lock:
+            self.chain_work -= self.get_chain_work(self.chain.headers[length:])
+            chain_utils.truncate_chain(length)
+            self.chain.truncate(length)
+
+            removed_filenames = [filename for filename, index in self.record_index.items() if index >= length]
+            for filename in removed_filenames:
+                del self.record_index[filename]
+            self.record_pool.mark_unverified(removed_filenames)
+
+            if self.validated_index >= length:
+                self.set_validation_checkpoint(self.chain.headers[length - 1])
+
+            # Any block being mined was built on the removed blocks
+            if self.mining_session is not None:
+                self.mining_session.cancel()
+
+    def get_fork_work(self, ancestor_index, blocks):
+        """
+        :param ancestor_index:  Index of the last block the node's chain shares with a fork
+        :param blocks:          Fork's blocks after the common ancestor
+        :return:                Total work of the chain the fork is on, from the genesis block
+        """
+        return self.get_chain_work(self.chain.headers[:ancestor_index + 1]) + self.get_chain_work(blocks)
+
+    def get_chain_work(self, headers):
+        """
+        :param headers: Blocks or block headers
+        :return:        Total work of the blocks under the node's consensus algorithm
+        """
+        return sum(self.consensus.get_block_work(header) for header in headers)
+
+    def build_record_index(self):
+        """
+        Builds an index from the filename of every record on the chain to the index of the
+        block it was verified in, without loading the records of every block
+        """
+        self.record_index = {}
+        self.record_pool.clear_verified_records()
+        for filename, block_index in self.chain.get_record_filenames():
+            self.record_index[filename] = block_index
+        self.record_pool.mark_verified(list(self.record_index))
+
+    def index_block_records(self, block):
+        """
+        Adds the records of a block to the record index and removes them from the record pool
+        :param block:   Block on the chain
+        """
+        for record in block.records:
+            self.record_index[record.filename] = block.index
+        self.record_pool.remove_records(block.records)
 
     def generate_genesis_block(self):
         """
          Generates the genesis block for the blockchain
         """
-        genesis_block = Block(0, "0", time.time(), [])
-        genesis_block.hash = genesis_block.get_block_hash()
-        self.chain.append(genesis_block)
+        self.chain.append(self.create_genesis_block())
 
-    def proof_of_work(self, block):
+    def create_genesis_block(self):
         """
-        Proof of work consensus algorithm, a mathematical problem that requires computational
-        power to solve
+        :return: Genesis block, which is the same on every node using the same consensus algorithm
         """
-        logger.info(f"Starting proof of work for block with index '{block.index}'")
-        block.nonce = 0
-        solved = False
+        genesis_block = Block(0, bytes(32), self.genesis_timestamp, [], difficulty=self.consensus.get_difficulty([], 0))
+        genesis_block.hash = genesis_block.get_block_hash()
+        return genesis_block
 
-        # Increment nonce until valid hash is found
-        while not solved:
-            block_hash = block.get_block_hash()
-            if block_hash[0:self.mining_difficulty] == '0' * self.mining_difficulty:
-                logger.info(f"Block solved with a hash '{block_hash}'")
-                return block_hash
-            else:
-                block.nonce += 1
+    def seal_block(self, block, session=None):
+        """
+        Seals a block with the node's consensus algorithm, e.g. by proof of work
+        :param block:   Block to be sealed
+        :param session: Mining session allowing sealing to be cancelled
+        :return:        Hash of the sealed block, None if the block could not be sealed
+        """
+        return self.consensus.seal(block, session)
 
     def last_block_on_chain(self):
         """
-        :return: Block at the end of the chain
+        :return: Header of the block at the end of the chain, the block's records aren't loaded
         """
-        return self.chain[-1]
+        return self.chain.get_header(-1)
 
     def add_block(self, block):
         """
@@ -83,91 +335,313 @@ class Blockchain:
         :return:        True if block added, False otherwise
         """
         logger.info(f"Adding block with index '{block.index}'")
-        last_block = self.last_block_on_chain()
-        previous_hash = last_block.hash
-
-        # Verify correct previous hash exists in block
-        if block.previous_hash == previous_hash:
-            # Verify the block hash and the proof of work
-            if self.is_block_hash_valid(block):
-                chain_utils.write_block_to_chain(block)
-                self.chain.append(block)
-                logger.info(f"Added block")
-                return self.is_chain_valid()
+        with self.chain_lock:
+            last_block = self.last_block_on_chain()
+            previous_hash = last_block.hash
+
+            # Verify correct previous hash exists in block
+            if block.previous_hash == previous_hash:
+                # Verify the block's timestamp is after the previous block's and not in the future
+                if not difficulty.is_timestamp_valid(block.timestamp, last_block.timestamp):
+                    logger.error(f"Block not added - timestamp not valid")
+                    return False
+
+                # Verify the block hash and the block's seal
+                if self.is_block_hash_valid(block):
+                    commit_sequence = chain_utils.write_block_to_chain(block)
+                    self.chain.append(block)
+                    self.index_block_records(block)
+                    self.chain_work += self.consensus.get_block_work(block)
+                    logger.info(f"Added block")
+
+                    # A block being mined at this height is now stale
+                    if self.mining_session is not None and self.mining_session.block.index <= block.index:
+                        logger.info(f"Cancelling mining of stale block with index '{self.mining_session.block.index}'")
+                        self.mining_session.cancel()
+
+                    # Only blocks added since the last validated block need to be checked
+                    if not self.validate_new_blocks():
+                        return False
+
+                    if block.index % self.snapshot_interval == 0:
+                        self.write_snapshot()
+                else:
+                    logger.error(f"Block not added - block hash not valid")
+                    return False
             else:
-                logger.error(f"Block not added - block hash not valid")
+                logger.error(f"Block not added - previous hash not valid")
                 return False
-        else:
-            logger.error(f"Block not added - previous hash not valid")
-            return False
+
+        # Waiting outside the lock lets blocks arriving together share one fsync
+        chain_utils.wait_for_chain_commit(commit_sequence)
+        return True
 
     def mine(self):
         """
-        Method allowing a node to verify transactions
+        Method allowing a node to verify transactions, mining restarts on the new end of
+        the chain whenever a peer's block is accepted before the new block is solved
         :return: The index of the new block
         """
         logger.info("Mining new block")
-        for block in self.chain:
-            self.record_pool.remove_records(block.records)
+        while True:
+            with self.chain_lock:
+                records = self.record_pool.get_unverified_records(self.assembly_policy)
+                last_block = self.last_block_on_chain()
 
-        records = self.record_pool.get_unverified_records()
-        last_block = self.last_block_on_chain()
+                if len(records) == 0:
+                    return None
 
-        if len(records) == 0:
-            return None
+                # Initialise new block
+                new_block = Block(index=last_block.index + 1,
+                                  previous_hash=last_block.hash,
+                                  timestamp=difficulty.get_next_timestamp(last_block.timestamp),
+                                  records=records,
+                                  difficulty=self.consensus.get_difficulty(self.chain, last_block.index + 1))
+                session = MiningSession(new_block)
+                self.mining_session = session
 
-        # Initialise new block
-        new_block = Block(index=last_block.index + 1,
-                          previous_hash=last_block.hash,
-                          timestamp=time.time(),
-                          records=records)
+            # Seal the block to obtain its hash, e.g. by solving the proof of work
+            new_block.hash = self.seal_block(new_block, session)
 
-        # Solve mathematical problem to obtain block hash
-        new_block.hash = self.proof_of_work(new_block)
+            with self.chain_lock:
+                if self.mining_session is session:
+                    self.mining_session = None
 
-        # Attempt to add the block to the chain
-        if self.add_block(new_block):
-            self.record_pool.remove_records(records)
-            return new_block
-        else:
-            return None
+                # Node can't seal blocks, e.g. it is not an authority
+                if new_block.hash is None and not session.cancelled:
+                    return None
 
-    def is_block_hash_valid(self, block):
+                # Restart mining if a peer's block was added whilst solving
+                if new_block.hash is None or self.last_block_on_chain().hash != new_block.previous_hash:
+                    logger.info("Chain changed whilst mining, restarting on the new end of the chain")
+                    continue
+
+                # Attempt to add the block to the chain
+                if self.add_block(new_block):
+                    return new_block
+                else:
+                    return None
+
+    def is_block_hash_valid(self, block, chain=None):
         """
-        Checks the validity of a block's hash
+        Checks the validity of a block's hash and that the block was sealed as the node's
+        consensus algorithm requires, e.g. mined at the difficulty expected at its height
         :param block:   The block in question
+        :param chain:   Chain holding the blocks before the block, defaults to the node's chain
         :return:        True if block hash is valid, False otherwise
         """
-        block_hash = block.get_block_hash()
-        if block_hash.startswith('0' * self.mining_difficulty) and block_hash == block.hash:
-            return True
-        return False
+        if chain is None:
+            chain = self.chain
+        return self.consensus.is_block_sealed(block, chain)
 
     def is_chain_valid(self):
         """
-        Checks the validity of a node's chain
+        Checks the validity of a node's chain from the genesis block
         :return: True if node's chain is valid, False otherwise
         """
-        previous_hash = ""
-        # Check hashes are valid for each block in chain
-        for block in self.chain:
-            if block.index != 0:
-                # Check previous block's data is unchanged
-                if block.previous_hash != previous_hash:
-                    return False
-                # Check block's data is unchanged
-                if not self.is_block_hash_valid(block):
+        chain = self.chain
+        return self.is_chain_segment_valid(chain, 0, len(chain))
+
+    def is_chain_segment_valid(self, chain, start_index, end_index):
+        """
+        Checks the validity of part of a chain, the block before the segment is trusted
+        :param chain:       Chain in object form
+        :param start_index: Index of the first block to check
+        :param end_index:   Index after the last block to check
+        :return:            True if the segment is valid, False otherwise
+        """
+        try:
+            previous_block = chain[start_index - 1] if start_index > 0 else None
+            # Check hashes are valid for each block in the segment, blocks are accessed one at a
+            # time so a lazily loaded chain isn't held in memory
+            for index in range(start_index, end_index):
+                block = chain[index]
+                if not self.is_block_valid(block, index, previous_block, chain):
                     return False
-            previous_hash = block.get_block_hash()
+                previous_block = block
+        except CorruptBlockError as error:
+            logger.error(error)
+            return False
         return True
 
+    def is_block_valid(self, block, index, previous_block, chain):
+        """
+        Checks a block follows on from the block before it and is validly sealed
+        :param block:           The block in question
+        :param index:           Position of the block in the chain
+        :param previous_block:  Block before the block in the chain, None for the genesis block
+        :param chain:           Chain holding the blocks before the block
+        :return:                True if the block is valid, False otherwise
+        """
+        if block is None or block.index != index:
+            return False
+
+        # Genesis block isn't sealed, it must be the genesis block every node creates
+        if block.index == 0:
+            return block.hash == self.genesis_hash
+
+        # Check previous block's data is unchanged
+        if previous_block is None or block.previous_hash != previous_block.hash:
+            return False
+        # Check block's timestamp follows on from the previous block's
+        if not difficulty.is_timestamp_valid(block.timestamp, previous_block.timestamp):
+            return False
+        # Check block's data is unchanged
+        return self.is_block_hash_valid(block, chain)
+
+    def load_validation_checkpoint(self):
+        """
+        Loads the highest validated block from storage, a checkpoint that no longer matches
+        the chain is discarded
+        """
+        self.validated_index, self.validated_hash = -1, None
+
+        checkpoint = chain_utils.load_validation_checkpoint()
+        if checkpoint is None:
+            return
+
+        index, block_hash = checkpoint
+        if index < len(self.chain) and self.chain.headers[index].hash == block_hash:
+            self.validated_index, self.validated_hash = index, block_hash
+
+    def set_validation_checkpoint(self, block):
+        """
+        Records a block as the highest validated block and persists it
+        :param block:   Highest block on the chain known to be valid
+        """
+        self.validated_index, self.validated_hash = block.index, block.hash
+        chain_utils.write_validation_checkpoint(block.index, block.hash)
+
+    def validate_new_blocks(self):
+        """
+        Checks only the blocks added since the validation checkpoint
+        :return: True if the new blocks are valid, False otherwise
+        """
+        with self.chain_lock:
+            start_index = self.validated_index + 1
+            if start_index >= len(self.chain):
+                return True
+
+            if not self.is_chain_segment_valid(self.chain, start_index, len(self.chain)):
+                logger.error(f"Chain is not valid after block with index '{self.validated_index}'")
+                return False
+
+            self.set_validation_checkpoint(self.last_block_on_chain())
+            return True
+
+    def write_snapshot(self):
+        """
+        Stores a snapshot of the chain's headers and record index, allowing the node to start
+        without reading the whole chain from storage
+        """
+        with self.chain_lock:
+            # A chain found to be invalid is never snapshotted
+            if self.background_validation['valid'] is False:
+                return
+            chain_utils.write_chain_snapshot(self.chain.headers, self.record_index)
+
+    def start_background_validation(self):
+        """
+        Re-validates the whole chain in a background thread
+        """
+        self.background_validation = {'running': True, 'valid': None, 'checked': 0}
+        thread = threading.Thread(target=self.run_background_validation, daemon=True)
+        thread.start()
+
+    def run_background_validation(self):
+        """
+        Re-validates the whole chain a segment at a time, pausing between segments so the
+        validation does not hold up requests. The chain is cut back to the last valid block
+        if an invalid block is found, so it is never extended past the invalid block.
+        """
+        logger.info("Starting background validation of the chain")
+        chain = self.chain
+
+        for start_index in range(0, len(chain), self.background_validation_segment):
+            end_index = min(start_index + self.background_validation_segment, len(chain))
+            if not self.is_chain_segment_valid(chain, start_index, end_index):
+                invalid_index = self.find_invalid_block(start_index, end_index)
+                logger.error(f"Background validation found an invalid block with index '{invalid_index}'")
+                self.background_validation = {'running': False, 'valid': False, 'checked': invalid_index}
+                # The next start reads the whole chain from storage rather than the snapshot
+                chain_utils.remove_chain_snapshot()
+                self.remove_invalid_blocks(invalid_index)
+                return
+            self.background_validation['checked'] = end_index
+            time.sleep(self.background_validation_pause)
+
+        logger.info("Background validation found the chain to be valid")
+        self.background_validation = {'running': False, 'valid': True, 'checked': len(chain)}
+
+    def find_invalid_block(self, start_index, end_index):
+        """
+        Finds the first invalid block in a segment of the node's chain
+        :param start_index: Index of the first block to check
+        :param end_index:   Index after the last block to check
+        :return:            Index of the first invalid block, end_index if every block is valid
+        """
+        for index in range(start_index, end_index):
+            if not self.is_chain_segment_valid(self.chain, index, index + 1):
+                return index
+        return end_index
+
+    def remove_invalid_blocks(self, invalid_index):
+        """
+        Cuts the chain back to the block before an invalid block, the node then catches up
+        with its peers' chains from there. An invalid genesis block is replaced.
+        :param invalid_index:   Index of the invalid block
+        """
+        with self.chain_lock:
+            # The chain may have been reorganised since the block was checked
+            if invalid_index >= len(self.chain) or self.is_chain_segment_valid(self.chain, invalid_index,
+                                                                                invalid_index + 1):
+                return
+
+            logger.error(f"Removing '{len(self.chain) - invalid_index}' blocks from index '{invalid_index}'")
+            if invalid_index == 0:
+                self.replace_chain([self.create_genesis_block()])
+            else:
+                self.roll_back_chain(invalid_index)
+
+    def get_record_proof(self, filename):
+        """
+        Gets a Merkle inclusion proof for a record on the chain
+        :param filename:    Filename of the record
+        :return:            Tuple of the block containing the record, the record and its
+                            inclusion proof, or None if the record is not on the chain
+        """
+        if filename not in self.record_index:
+            return None
+
+        block = self.chain[self.record_index[filename]]
+        leaf_hashes = [merkle_utils.get_record_leaf_hash(record) for record in block.records]
+        for leaf_index, record in enumerate(block.records):
+            if record.filename == filename:
+                return block, record, merkle_utils.get_merkle_proof(leaf_hashes, leaf_index)
+        return None
 
     def is_record_valid(self, file_hash, filename):
-        previous_hash = ""
-        for block in self.chain:
-            for record in block.records:
-                if record.filename == filename and file_hash == record.file_hash:
-                    if block.previous_hash == previous_hash and self.is_block_hash_valid(block):
-                        return True
-            previous_hash = block.get_block_hash()
-        return False
\ No newline at end of file
+        """
+        Checks a record with the given file hash is verified on the chain
+        :param file_hash:   Hash of the record's file in hex format
+        :param filename:    Filename of the record
+        :return:            True if record is valid, False otherwise
+        """
+        record_proof = self.get_record_proof(filename)
+        if record_proof is None:
+            return False
+
+        block, record, proof = record_proof
+        if record.file_hash.hex() != file_hash:
+            return False
+
+        # Header must be linked to its predecessor and be validly sealed, the header's Merkle
+        # root is then committed to by the block hash
+        header = self.chain.headers[block.index]
+        if header.previous_hash != self.chain.headers[block.index - 1].hash or not self.is_block_hash_valid(header):
+            return False
+
+        # Proof is built from the stored records, so it is checked against the committed root
+        # rather than a root recomputed from those same records
+        leaf_hash = merkle_utils.get_record_leaf_hash(record)
+        return merkle_utils.is_merkle_proof_valid(leaf_hash, proof, header.merkle_root)
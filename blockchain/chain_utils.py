@@ -1,10 +1,35 @@
+import atexit
+import hashlib
 import json
 import os
 import logging
 
 from pathlib import Path
 from blockchain import block_utils
-from json.decoder import JSONDecodeError
+from blockchain.binary_store import BinaryChainStore
+from blockchain.block_log import BlockLog
+from blockchain.fingerprint_cache import FingerprintCache
+from blockchain.lazy_chain import LazyChain
+from blockchain.sqlite_store import SqliteChainStore
+from blockchain.tiered_store import TieredChainStore
+
+# Backend storing the node's chain, either 'log', 'sqlite', 'binary' or 'tiered'
+chain_store_backend = os.environ.get("MIBLOCK_CHAIN_STORE", "log")
+
+# Seconds an fsync of the chain store waits for more blocks to join it
+commit_window = float(os.environ.get("MIBLOCK_COMMIT_WINDOW", 0.005))
+
+# Blocks deeper than this are compressed into archive segments by the tiered store
+archive_depth = int(os.environ.get("MIBLOCK_ARCHIVE_DEPTH", 1000))
+archive_segment_size = int(os.environ.get("MIBLOCK_ARCHIVE_SEGMENT_SIZE", 100))
+# Compression used for new archive segments, either 'zlib' or 'lzma'
+archive_compression = os.environ.get("MIBLOCK_ARCHIVE_COMPRESSION", "zlib")
+
+# Node's chain store, opened on first use
+chain_store = None
+
+# Node's cache of record file hashes, opened on first use
+fingerprint_cache = None
 
 
 def init_logger(name):
@@ -17,8 +42,10 @@ def init_logger(name):
     logger = logging.getLogger(name)
     logger.setLevel(logging.DEBUG)
 
-    # Create log file
-    logfile = str(get_app_root_directory()) + "/blockchain/logs/node.log"
+    # Create log file, the log directory is missing when the node isn't run from its container
+    log_directory = f"{get_app_root_directory()}/blockchain/logs"
+    os.makedirs(log_directory, exist_ok=True)
+    logfile = log_directory + "/node.log"
     handler = logging.FileHandler(logfile)
 
     # Create logging format
@@ -31,42 +58,58 @@ def init_logger(name):
     return logger
 
 
-def is_record_verified(record_filename):
+def get_records_by_aircraft(aircraft_reg_number):
     """
-    A utility function to traverse the chain and return the block that contains the given filename
-    :param record_filename: Name of file to lookup
-    :return:                True if record has been verified on chain, False otherwise
+    A utility function to get every record on the chain for an aircraft
+    :param aircraft_reg_number: Registration number of the aircraft
+    :return:                    List of records in dictionary format
     """
-    chain = load_chain_from_storage()
-    for block in chain:
-        for record in block.records:
-            if record.filename == record_filename:
-                return True
-    return False
+    return get_chain_store().get_records_by_aircraft(aircraft_reg_number)
 
 
-def load_chain_from_storage():
+def load_chain_from_storage(cache_size=1000, snapshot=None):
     """
-    A utility function to load the chain from storage
-    :return: Node's chain from storage
+    A utility function to load the chain from storage, only block headers are loaded and
+    records are read from storage when a block is accessed
+    :param cache_size:  Maximum number of blocks with records held in memory
+    :param snapshot:    Local snapshot of the chain, headers in it are not read from storage
+    :return:            Node's chain from storage
     """
-    try:
-        # Open file containing node's chain
-        chain_file = open(path_to_stored_chain(), "r")
+    return LazyChain(get_chain_store(), cache_size, snapshot)
 
-        # Load chain in JSON format
-        chain_json = json.load(chain_file)
 
-        # Convert chain to object format
-        chain = []
-        for block in chain_json:
-            chain.append(block_utils.get_block_object_from_dict(block))
-    except IOError:
-        return []
-    except JSONDecodeError:
-        return []
-    else:
-        return chain
+def get_chain_store():
+    """
+    Utility function to get the store the node's chain is kept in, the backend is chosen
+    with the MIBLOCK_CHAIN_STORE environment variable
+    :return: Node's chain store
+    """
+    global chain_store
+    if chain_store is None:
+        if chain_store_backend == "sqlite":
+            chain_store = SqliteChainStore(path_to_chain_database())
+        elif chain_store_backend == "binary":
+            chain_store = BinaryChainStore(path_to_binary_chain(), path_to_binary_chain_offsets(), commit_window)
+        elif chain_store_backend == "tiered":
+            chain_store = TieredChainStore(path_to_chain_archive(), archive_depth, archive_segment_size,
+                                           archive_compression, commit_window)
+        else:
+            chain_store = BlockLog(path_to_stored_chain(), path_to_block_index(), commit_window,
+                                   path_to_block_headers())
+    return chain_store
+
+
+def get_fingerprint_cache():
+    """
+    Utility function to get the cache of record file hashes, the cache is saved when the
+    node exits
+    :return: Node's fingerprint cache
+    """
+    global fingerprint_cache
+    if fingerprint_cache is None:
+        fingerprint_cache = FingerprintCache(path_to_fingerprint_cache())
+        atexit.register(fingerprint_cache.save)
+    return fingerprint_cache
 
 
 def get_app_root_directory():
@@ -79,6 +122,9 @@ def get_app_root_directory():
 
     # Change directory from current directory to app root
     while str(current_directory).split("/")[-1] != 'miBlock':
+        # Checkouts not named 'miBlock' use the directory holding the blockchain package
+        if current_directory.parent == current_directory:
+            return Path(__file__).parent.parent
         current_directory = current_directory.parent
     return current_directory
 
@@ -96,29 +142,184 @@ def path_to_stored_chain():
     """
     Gets the path to the file that stores a node's chain
     """
-    return f"{get_app_root_directory()}/data/blocks.json"
+    return f"{get_app_root_directory()}/data/blocks.log"
+
+
+def path_to_block_index():
+    """
+    Gets the path to the file that stores the offset of each block in the node's chain
+    """
+    return f"{get_app_root_directory()}/data/blocks.idx"
+
+
+def path_to_block_headers():
+    """
+    Gets the path to the file that stores the header of every block in the node's chain
+    """
+    return f"{get_app_root_directory()}/data/blocks.hdr"
+
+
+def path_to_chain_database():
+    """
+    Gets the path to the SQLite database that stores a node's chain
+    """
+    return f"{get_app_root_directory()}/data/chain.db"
+
+
+def path_to_binary_chain():
+    """
+    Gets the path to the memory-mapped binary file that stores a node's chain
+    """
+    return f"{get_app_root_directory()}/data/chain.bin"
+
+
+def path_to_binary_chain_offsets():
+    """
+    Gets the path to the table of the offset of each block in the binary chain file
+    """
+    return f"{get_app_root_directory()}/data/chain.offsets"
+
+
+def path_to_chain_archive():
+    """
+    Gets the path to the directory holding the tiered store's recent blocks and compressed
+    archive segments
+    """
+    return f"{get_app_root_directory()}/data/archive"
+
+
+def path_to_fingerprint_cache():
+    """
+    Gets the path to the file that stores the hashes of record files
+    """
+    return f"{get_app_root_directory()}/data/fingerprints.json"
+
+
+def path_to_validation_checkpoint():
+    """
+    Gets the path to the file that stores the highest validated block of a node's chain
+    """
+    return f"{get_app_root_directory()}/data/checkpoint.json"
+
+
+def path_to_node_key():
+    """
+    Gets the path to the file that stores the key a node seals blocks with under proof of authority
+    """
+    return os.environ.get("MIBLOCK_NODE_KEY", f"{get_app_root_directory()}/data/node_key")
+
+
+def path_to_authorities():
+    """
+    Gets the path to the file listing the public keys of the nodes allowed to seal blocks
+    """
+    return os.environ.get("MIBLOCK_AUTHORITIES", f"{get_app_root_directory()}/data/authorities.json")
+
+
+def path_to_chain_snapshot():
+    """
+    Gets the path to the file that stores a snapshot of the node's block headers and record index
+    """
+    return f"{get_app_root_directory()}/data/snapshot.json"
+
+
+def load_chain_snapshot():
+    """
+    Utility function to load the local snapshot of the chain, the snapshot is checked
+    against its checksum before it is used
+    :return: Snapshot in dictionary format, None if there is no snapshot or it is corrupt
+    """
+    try:
+        with open(path_to_chain_snapshot(), 'rb') as snapshot_file:
+            checksum = snapshot_file.readline().strip()
+            snapshot_json = snapshot_file.read()
+        if hashlib.sha256(snapshot_json).hexdigest().encode() != checksum:
+            return None
+        return json.loads(snapshot_json)
+    except (IOError, ValueError):
+        return None
+
+
+def write_chain_snapshot(headers, record_index):
+    """
+    Utility function to store a snapshot of the chain's headers and record index, the
+    snapshot starts with a SHA-256 checksum of its contents
+    :param headers:         List of block headers in object form
+    :param record_index:    Dictionary of record filenames to the index of their block
+    """
+    snapshot = {
+        'headers': [block_utils.get_header_dict_from_object(header) for header in headers],
+        'records': list(record_index.items())
+    }
+    snapshot_json = json.dumps(snapshot, separators=(',', ':')).encode()
+
+    # Write to a temporary file so a crash never leaves a partly written snapshot
+    temp_path = path_to_chain_snapshot() + ".tmp"
+    with open(temp_path, 'wb') as snapshot_file:
+        snapshot_file.write(hashlib.sha256(snapshot_json).hexdigest().encode() + b'\n' + snapshot_json)
+    os.replace(temp_path, path_to_chain_snapshot())
+
+
+def remove_chain_snapshot():
+    """
+    Utility function to remove the local snapshot, e.g. when the chain it was taken of is invalid
+    """
+    if os.path.exists(path_to_chain_snapshot()):
+        os.remove(path_to_chain_snapshot())
+
+
+def load_validation_checkpoint():
+    """
+    Utility function to load the highest validated block from storage
+    :return: Tuple of the block's index and hash, None if no checkpoint is stored
+    """
+    try:
+        with open(path_to_validation_checkpoint(), 'r') as checkpoint_file:
+            checkpoint = json.load(checkpoint_file)
+        return checkpoint['index'], bytes.fromhex(checkpoint['hash'])
+    except (IOError, ValueError, KeyError):
+        return None
+
+
+def write_validation_checkpoint(index, block_hash):
+    """
+    Utility function to store the highest validated block
+    :param index:       Index of the block
+    :param block_hash:  Hash of the block in bytes
+    """
+    # Write to a temporary file so a crash never leaves a partly written checkpoint
+    temp_path = path_to_validation_checkpoint() + ".tmp"
+    with open(temp_path, 'w') as checkpoint_file:
+        json.dump({'index': index, 'hash': block_hash.hex()}, checkpoint_file)
+    os.replace(temp_path, path_to_validation_checkpoint())
 
 
 def write_block_to_chain(block):
     """
-    Utility function to append block to the stored chain
-    :param block: Block to be written to stored chain
+    Utility function to append block to the stored chain, only the new block is written.
+    The block is durable once 'wait_for_chain_commit' returns.
+    :param block:   Block to be written to stored chain
+    :return:        Sequence number of the write
     """
-    with open(path_to_stored_chain()) as chain_file:
-        # Get block in JSON serializable format
-        block_dict = block_utils.get_block_dict_from_object(block)
+    return get_chain_store().append(block_utils.get_block_encoding(block))
 
-        # Load chain from storage
-        chain = json.load(chain_file)
 
-        # Add new block to the chain
-        chain.append(block_dict)
+def wait_for_chain_commit(sequence):
+    """
+    Utility function to wait until a block written to the stored chain is durable, blocks
+    written together are synced to disk together
+    :param sequence:    Sequence number returned when the block was written
+    """
+    get_chain_store().wait_for_commit(sequence)
 
-        # Close file
-        chain_file.close()
 
-        # Write updated chain to storage
-        write_chain(get_chain_from_json(chain))
+def truncate_chain(length):
+    """
+    Utility function to remove every block after the first 'length' blocks from the stored
+    chain, e.g. when they are orphaned by a fork
+    :param length:  Number of blocks kept
+    """
+    get_chain_store().truncate(length)
 
 
 def write_chain(chain):
@@ -126,28 +327,17 @@ def write_chain(chain):
     Utility function to write chain to storage
     :param chain: Chain to be written
     """
-    # Open file and clear it's contents
-    chain_file = open(path_to_stored_chain(), "r+")
-    chain_file.read().split("\n")
-    chain_file.seek(0)
-    chain_file.truncate()
+    get_chain_store().rewrite([block_utils.get_block_encoding(block) for block in chain])
 
-    # Write updated chain to storage
-    json.dump(get_chain_json(chain), chain_file, sort_keys=True, indent=2)
 
-
-def get_chain_json(chain):
+def get_chain_encoding(chain):
     """
-    Utility function to get a node's chain in JSON format
+    Utility function to get a node's chain as a JSON array, built from the cached encoding
+    of each block rather than serialising every block again
     :param chain:   Chain in object form
-    :return:        Chain in JSON format
-    """
-    chain_json = []
-    # For each block in the chain, append it to a new chain in JSON format
-    for block in chain:
-        block_json = block_utils.get_block_dict_from_object(block)
-        chain_json.append(block_json)
-    return chain_json
+    :return:        Chain in JSON format, in bytes
+    """
+    return b'[' + b','.join(block_utils.get_block_encoding(block) for block in chain) + b']'
 
 
 def get_chain_from_json(chain_json):
@@ -1,8 +1,11 @@
 import hashlib
-import requests
 import json
 import math
 
+import requests
+
+from blockchain import transport
+
 
 def get_hash(address):
     # Gets SHA1 hash value of a node address
@@ -16,7 +19,10 @@ def get_hash(address):
 
 def find_successor(node_address, key):
     # Send get request to a node asking to find the successor of a key
-    response = requests.get(f"http://{node_address}/chord/lookup?key={key}")
+    try:
+        response = transport.get(f"http://{node_address}/chord/lookup?key={key}")
+    except requests.RequestException:
+        return None
     if response.status_code == 200:
         return response.json()['successor']
     else:
@@ -25,7 +31,10 @@ def find_successor(node_address, key):
 
 def get_predecessor(node_address):
     # Send get request to address asking for their predecessor
-    response = requests.get(f"http://{node_address}/chord/predecessor")
+    try:
+        response = transport.get(f"http://{node_address}/chord/predecessor")
+    except requests.RequestException:
+        return None
     if response.status_code == 200:
         return response.json()['predecessor']
     else:
@@ -34,12 +43,18 @@ def get_predecessor(node_address):
 
 def notify_successor(successor_address, node_address):
     # Send a post request to a successor, notifying them of their new predecessor
-    response = requests.post(f"http://{successor_address}/chord/notify",
-                             data=json.dumps({'predecessor': node_address}),
-                             headers={'Content-Type': "application/json"})
+    try:
+        response = transport.post(f"http://{successor_address}/chord/notify",
+                                  data=json.dumps({'predecessor': node_address}),
+                                  headers={'Content-Type': "application/json"})
+    except requests.RequestException:
+        return False
     return response.status_code == 200
 
 
 def stabalise_node(node_address):
-    response = requests.get(f"http://{node_address}/chord/stabalise")
-    return response.status_code == 200
\ No newline at end of file
+    try:
+        response = transport.get(f"http://{node_address}/chord/stabalise")
+    except requests.RequestException:
+        return False
+    return response.status_code == 200
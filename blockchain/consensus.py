@@ -0,0 +1,213 @@
+import json
+import os
+
+from blockchain import chain_utils, difficulty
+
+# Create logger
+logger = chain_utils.init_logger("Consensus")
+
+# Consensus algorithm used by the node, either 'pow' or 'poa'. Every node on the network
+# must use the same algorithm.
+consensus_algorithm = os.environ.get("MIBLOCK_CONSENSUS", "pow")
+
+
+class ProofOfWork:
+    miner = None
+
+    def __init__(self, miner):
+        """
+        ProofOfWork class constructor, blocks are sealed by searching for a nonce giving a
+        block hash below the target for the block's difficulty
+        :param miner:   Miner used to search for nonces
+        """
+        self.miner = miner
+
+    def get_difficulty(self, chain, index):
+        """
+        :param chain:   Chain holding the blocks before the index
+        :param index:   Index of a block
+        :return:        Difficulty the block must be mined with
+        """
+        return difficulty.get_expected_difficulty(chain, index)
+
+    def seal(self, block, session=None):
+        """
+        Proof of work consensus algorithm, a mathematical problem that requires computational
+        power to solve
+        :param block:   Block to be solved
+        :param session: Mining session allowing proof of work to be cancelled
+        :return:        Hash of the solved block, None if the session was cancelled
+        """
+        logger.info(f"Starting proof of work for block with index '{block.index}'")
+        block_hash = self.miner.solve(block, session)
+        if block_hash is not None:
+            logger.info(f"Block solved with a hash '{block_hash.hex()}'")
+        return block_hash
+
+    def is_block_sealed(self, block, chain):
+        """
+        Checks a block's hash is valid and was mined at the difficulty expected at its height
+        :param block:   The block in question
+        :param chain:   Chain holding the blocks before the block
+        :return:        True if block is sealed, False otherwise
+        """
+        if block.difficulty != self.get_difficulty(chain, block.index):
+            return False
+
+        block_hash = block.get_block_hash()
+        return difficulty.is_hash_below_target(block_hash, block.difficulty) and block_hash == block.hash
+
+    def get_block_work(self, block):
+        """
+        :param block:   Sealed block or block header
+        :return:        Expected number of hashes needed to mine the block
+        """
+        return 2 ** block.difficulty
+
+
+class ProofOfAuthority:
+    node_key = None
+    node_id = None
+    authorities = None
+
+    def __init__(self, node_key, authorities):
+        """
+        ProofOfAuthority class constructor, blocks are sealed by an allow-listed node signing
+        the block hash, no nonce search is needed
+        :param node_key:    Node's Ed25519 private key
+        :param authorities: Set of public keys in bytes allowed to seal blocks
+        """
+        # Only needed under proof of authority, so proof of work nodes don't need cryptography installed
+        from cryptography.hazmat.primitives.serialization import Encoding, PublicFormat
+
+        self.node_key = node_key
+        self.node_id = node_key.public_key().public_bytes(Encoding.Raw, PublicFormat.Raw)
+        self.authorities = authorities
+
+    def get_difficulty(self, chain, index):
+        """
+        Blocks sealed by an authority have no proof of work
+        """
+        return 0
+
+    def get_block_work(self, block):
+        """
+        Every block sealed by an authority counts the same, so the longest chain has the most work
+        """
+        return 1
+
+    def seal(self, block, session=None):
+        """
+        Signs a block with the node's key
+        :param block:   Block to be sealed
+        :param session: Unused, signing a block is not cancelled
+        :return:        Hash of the sealed block, None if the node is not an authority
+        """
+        if self.node_id not in self.authorities:
+            logger.error(f"Node '{self.node_id.hex()}' is not an authority and can't seal blocks")
+            return None
+
+        block.signer = self.node_id
+        block_hash = block.get_block_hash()
+        block.signature = self.node_key.sign(block_hash)
+        logger.info(f"Block signed with a hash '{block_hash.hex()}'")
+        return block_hash
+
+    def is_block_sealed(self, block, chain):
+        """
+        Checks a block's hash is valid and was signed by an allow-listed authority
+        :param block:   The block in question
+        :param chain:   Chain holding the blocks before the block
+        :return:        True if block is sealed, False otherwise
+        """
+        return is_signed_by_authority(block, self.authorities)
+
+
+def is_signed_by_authority(block, authorities):
+    """
+    Checks a block's hash is valid and was signed by an allow-listed authority
+    :param block:       Block or block header in question
+    :param authorities: Set of public keys in bytes allowed to seal blocks
+    :return:            True if block is signed by an authority, False otherwise
+    """
+    from cryptography.exceptions import InvalidSignature
+    from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PublicKey
+
+    if block.difficulty != 0 or block.signer not in authorities or block.signature is None:
+        return False
+
+    block_hash = block.get_block_hash()
+    if block_hash != block.hash:
+        return False
+
+    try:
+        public_key = Ed25519PublicKey.from_public_bytes(block.signer)
+        public_key.verify(block.signature, block_hash)
+    except (InvalidSignature, ValueError):
+        return False
+    return True
+
+
+def is_header_sealed(header, authorities=None):
+    """
+    Checks a block header's seal on its own, allowing a client holding only the header to
+    check it. Without the chain before the header, a proof of work header is only checked
+    against the difficulty it claims rather than the difficulty expected at its height.
+    :param header:      Block header in object form
+    :param authorities: Set of public keys in bytes allowed to seal blocks under proof of
+                        authority, the configured authorities are used when not provided
+    :return:            True if the header is sealed, False otherwise
+    """
+    if consensus_algorithm == "poa":
+        return is_signed_by_authority(header, load_authorities() if authorities is None else authorities)
+
+    block_hash = header.get_block_hash()
+    return header.difficulty >= difficulty.min_difficulty and block_hash == header.hash and \
+        difficulty.is_hash_below_target(block_hash, header.difficulty)
+
+
+def get_consensus(miner):
+    """
+    Utility function to create the consensus algorithm chosen with MIBLOCK_CONSENSUS
+    :param miner:   Miner used when blocks are sealed with proof of work
+    :return:        Consensus algorithm
+    """
+    if consensus_algorithm == "poa":
+        return ProofOfAuthority(load_node_key(), load_authorities())
+    return ProofOfWork(miner)
+
+
+def load_node_key():
+    """
+    Utility function to load the node's signing key, a key is generated the first time
+    :return: Node's Ed25519 private key
+    """
+    from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PrivateKey
+    from cryptography.hazmat.primitives.serialization import Encoding, NoEncryption, PrivateFormat, PublicFormat
+
+    key_path = chain_utils.path_to_node_key()
+    if os.path.exists(key_path):
+        with open(key_path, 'r') as key_file:
+            return Ed25519PrivateKey.from_private_bytes(bytes.fromhex(key_file.read().strip()))
+
+    node_key = Ed25519PrivateKey.generate()
+    with open(key_path, 'w') as key_file:
+        key_file.write(node_key.private_bytes(Encoding.Raw, PrivateFormat.Raw, NoEncryption()).hex())
+    os.chmod(key_path, 0o600)
+
+    public_key = node_key.public_key().public_bytes(Encoding.Raw, PublicFormat.Raw).hex()
+    logger.info(f"Generated node key with public key '{public_key}'")
+    return node_key
+
+
+def load_authorities():
+    """
+    Utility function to load the public keys of the nodes allowed to seal blocks
+    :return: Set of public keys in bytes
+    """
+    try:
+        with open(chain_utils.path_to_authorities(), 'r') as authorities_file:
+            return set(bytes.fromhex(public_key) for public_key in json.load(authorities_file)['authorities'])
+    except (IOError, ValueError, KeyError):
+        logger.error("No authorities are configured, no blocks can be sealed or accepted")
+        return set()
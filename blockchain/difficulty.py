@@ -0,0 +1,103 @@
+import math
+import os
+import time
+
+# Difficulty is the number of leading zero bits required in a block hash, 16 bits is the
+# same as the four leading hex zeros the chain was mined with before retargeting
+initial_difficulty = 16
+min_difficulty = 1
+max_difficulty = 255
+
+# Every node on the network must use the same retargeting settings
+target_block_interval = float(os.environ.get("MIBLOCK_TARGET_BLOCK_INTERVAL", 10))
+retarget_interval = int(os.environ.get("MIBLOCK_RETARGET_INTERVAL", 10))
+
+# Largest change in difficulty at a single retarget, in bits
+max_adjustment = 2
+
+# Seconds a block's timestamp may be ahead of the node's clock, allowing for clock drift between nodes
+max_future_block_time = float(os.environ.get("MIBLOCK_MAX_FUTURE_BLOCK_TIME", 120))
+
+# Smallest gap between the timestamps of consecutive blocks
+min_block_time_step = 0.001
+
+
+def get_target(difficulty):
+    """
+    Gets the value a block hash must be below to meet a difficulty
+    :param difficulty:  Number of leading zero bits required in the hash
+    :return:            Target as a 32 byte big-endian value, comparable with a hash digest
+    """
+    return (1 << (256 - difficulty)).to_bytes(32, 'big')
+
+
+def is_hash_below_target(block_hash, difficulty):
+    """
+    Checks a block hash meets a difficulty
+    :param block_hash:  Block hash in bytes
+    :param difficulty:  Number of leading zero bits required in the hash
+    :return:            True if the hash meets the difficulty, False otherwise
+    """
+    return block_hash < get_target(difficulty)
+
+
+def is_timestamp_valid(timestamp, previous_timestamp):
+    """
+    Checks a block's timestamp is after its parent's and not too far in the future, so the
+    timestamps retargeting is based on can't be moved backwards or far forwards
+    :param timestamp:           Timestamp of the block
+    :param previous_timestamp:  Timestamp of the previous block in the chain
+    :return:                    True if the timestamp is valid, False otherwise
+    """
+    return previous_timestamp < timestamp <= time.time() + max_future_block_time
+
+
+def get_next_timestamp(previous_timestamp):
+    """
+    :param previous_timestamp:  Timestamp of the block a new block is built on
+    :return:                    Timestamp of a new block, after its parent's even if the
+                                parent came from a node with a clock ahead of this node's
+    """
+    return max(time.time(), previous_timestamp + min_block_time_step)
+
+
+def get_header(chain, index):
+    """
+    Gets the header of a block, chains holding their headers in memory don't load the block's records
+    :param chain:   Chain in object form
+    :param index:   Index of the block
+    :return:        Block or block header
+    """
+    if hasattr(chain, 'get_header'):
+        return chain.get_header(index)
+    return chain[index]
+
+
+def get_expected_difficulty(chain, index):
+    """
+    Gets the difficulty the block at an index must be mined with. Difficulty only changes
+    every 'retarget_interval' blocks, moving toward the target block interval based on how
+    long the previous blocks took to mine.
+
+    :param chain:   Chain in object form, holding at least the blocks before the index
+    :param index:   Index of the block in question
+    :return:        Required difficulty in bits
+    """
+    if index <= 1:
+        return initial_difficulty
+
+    previous_difficulty = get_header(chain, index - 1).difficulty
+    if index % retarget_interval != 0 or index <= retarget_interval:
+        return previous_difficulty
+
+    # Time taken to mine the last 'retarget_interval' blocks
+    first_block = get_header(chain, index - retarget_interval)
+    last_block = get_header(chain, index - 1)
+    actual_timespan = max(last_block.timestamp - first_block.timestamp, 0.001)
+    expected_timespan = target_block_interval * (retarget_interval - 1)
+
+    # Each bit of difficulty doubles the expected work to mine a block
+    adjustment = round(math.log2(expected_timespan / actual_timespan))
+    adjustment = max(-max_adjustment, min(max_adjustment, adjustment))
+
+    return max(min_difficulty, min(max_difficulty, previous_difficulty + adjustment))
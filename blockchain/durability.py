@@ -0,0 +1,84 @@
+import os
+import threading
+import time
+
+
+class GroupCommit:
+    sync = None
+    window = None
+
+    def __init__(self, sync, window=0.005):
+        """
+        GroupCommit class constructor, makes appended writes durable in groups so writes
+        arriving together share a single fsync
+        :param sync:    Function syncing every write made so far to disk
+        :param window:  Seconds a sync waits for more writes to join it
+        """
+        self.sync = sync
+        self.window = window
+        self.condition = threading.Condition()
+        self.written = 0
+        self.synced = 0
+        self.syncing = False
+
+    def add_write(self):
+        """
+        Records a write that has been made but isn't durable yet
+        :return: Sequence number of the write
+        """
+        with self.condition:
+            self.written += 1
+            return self.written
+
+    def wait(self, sequence):
+        """
+        Waits until a write is durable, the first writer to wait syncs every write made
+        before it starts syncing whilst later writers wait for it
+        :param sequence:    Sequence number of the write
+        """
+        with self.condition:
+            while self.synced < sequence:
+                if self.syncing:
+                    self.condition.wait()
+                    continue
+
+                self.syncing = True
+                try:
+                    # Writes made during the window are synced along with this one
+                    self.condition.release()
+                    try:
+                        if self.window > 0:
+                            time.sleep(self.window)
+                        with self.condition:
+                            target = self.written
+                        self.sync()
+                    finally:
+                        self.condition.acquire()
+                    self.synced = max(self.synced, target)
+                finally:
+                    self.syncing = False
+                    self.condition.notify_all()
+
+
+def fsync_file(file):
+    """
+    Flushes a file and syncs it to disk
+    :param file:    Open file
+    """
+    file.flush()
+    os.fsync(file.fileno())
+
+
+def replace_file(temp_path, path):
+    """
+    Atomically replaces a file with a fully written and synced temporary file, the rename
+    itself is made durable by syncing the directory
+    :param temp_path:   Path to the temporary file
+    :param path:        Path to the file being replaced
+    """
+    os.replace(temp_path, path)
+    directory_fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    try:
+        os.fsync(directory_fd)
+    finally:
+        os.close(directory_fd)
@@ -0,0 +1,142 @@
+import hashlib
+import json
+import os
+import threading
+
+from collections import OrderedDict
+
+
+class FingerprintCache:
+    cache_path = None
+    max_entries = None
+    hits = 0
+    misses = 0
+
+    def __init__(self, cache_path, max_entries=10000, save_interval=100):
+        """
+        FingerprintCache class constructor, a bounded cache of the SHA-256 and MD5 hashes of
+        record files. An entry is only used while the file's size, modification time and inode
+        are unchanged.
+
+        :param cache_path:      Path to the file the cache is saved to across restarts
+        :param max_entries:     Number of files held before the least recently used is evicted
+        :param save_interval:   Number of newly hashed files before the cache is saved
+        """
+        self.cache_path = cache_path
+        self.max_entries = max_entries
+        self.save_interval = save_interval
+        self.unsaved_entries = 0
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.save_lock = threading.Lock()
+        self.load()
+
+    def get_sha256(self, file_path):
+        """
+        :param file_path:   Path to a file
+        :return:            SHA-256 hash of the file in hex format
+        """
+        return self.get_fingerprint(file_path)['sha256']
+
+    def get_md5(self, file_path):
+        """
+        :param file_path:   Path to a file
+        :return:            MD5 checksum of the file in hex format
+        """
+        return self.get_fingerprint(file_path)['md5']
+
+    def get_fingerprint(self, file_path):
+        """
+        Gets the hashes of a file, the file is only read if it has changed since it was cached
+        :param file_path:   Path to a file
+        :return:            Dictionary containing the file's SHA-256 and MD5 hashes
+        """
+        file_path = os.path.abspath(file_path)
+        file_stat = os.stat(file_path)
+        identity = [file_stat.st_size, file_stat.st_mtime_ns, file_stat.st_ino]
+
+        with self.lock:
+            entry = self.entries.get(file_path)
+            if entry is not None and entry['identity'] == identity:
+                self.hits += 1
+                self.entries.move_to_end(file_path)
+                return entry
+            self.misses += 1
+
+        entry = {'identity': identity}
+        entry.update(hash_file(file_path))
+
+        with self.lock:
+            self.entries[file_path] = entry
+            self.entries.move_to_end(file_path)
+
+            # Evict least recently used files
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+            self.unsaved_entries += 1
+            save_required = self.unsaved_entries >= self.save_interval
+
+        if save_required:
+            self.save()
+        return entry
+
+    def get_stats(self):
+        """
+        :return: Dictionary containing the size of the cache and its hit and miss counters
+        """
+        with self.lock:
+            return {'entries': len(self.entries), 'hits': self.hits, 'misses': self.misses}
+
+    def load(self):
+        """
+        Loads the cache from disk, an unreadable cache file is ignored
+        """
+        try:
+            with open(self.cache_path, 'r') as cache_file:
+                entries = json.load(cache_file)
+        except (IOError, ValueError):
+            return
+
+        with self.lock:
+            for file_path, entry in entries:
+                self.entries[file_path] = entry
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def save(self):
+        """
+        Saves the cache to disk in least to most recently used order
+        """
+        with self.lock:
+            entries = list(self.entries.items())
+            self.unsaved_entries = 0
+
+        # Write to a temporary file so a crash never leaves a partly written cache
+        with self.save_lock:
+            temp_path = self.cache_path + ".tmp"
+            with open(temp_path, 'w') as cache_file:
+                json.dump(entries, cache_file)
+            os.replace(temp_path, self.cache_path)
+
+
+def hash_file(file_path):
+    """
+    Reads a file once to produce both its SHA-256 and MD5 hashes
+    :param file_path:   Path to a file
+    :return:            Dictionary containing the file's SHA-256 and MD5 hashes
+    """
+    sha256 = hashlib.sha256()
+    md5_hash = hashlib.md5()
+
+    with open(file_path, 'rb') as file:
+        while True:
+            data = file.read(65536)
+            if not data:
+                break
+            sha256.update(data)
+            md5_hash.update(data)
+
+    return {'sha256': sha256.hexdigest(), 'md5': md5_hash.hexdigest()}
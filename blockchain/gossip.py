@@ -0,0 +1,114 @@
+import collections
+import os
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+class Gossip:
+    # Number of peers each node passes a new message on to
+    fan_out = int(os.environ.get("MIBLOCK_GOSSIP_FAN_OUT", 4))
+    # Number of times a message is passed on before it stops spreading
+    ttl = int(os.environ.get("MIBLOCK_GOSSIP_TTL", 6))
+    # Number of message IDs remembered for deduplication
+    max_seen = int(os.environ.get("MIBLOCK_GOSSIP_MAX_SEEN", 10000))
+    # Number of messages passed on at once, and the most waiting to be passed on
+    relay_workers = int(os.environ.get("MIBLOCK_GOSSIP_RELAY_WORKERS", 4))
+    max_pending_relays = int(os.environ.get("MIBLOCK_GOSSIP_MAX_PENDING_RELAYS", 100))
+
+    def __init__(self):
+        """
+        Gossip class constructor, spreads records and blocks through the network by passing
+        each new message on to a few random peers, rather than the origin sending it to
+        every peer itself. Messages a node has already seen are not passed on again.
+        """
+        self.seen = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+        # Messages are passed on from a pool of its own, as passing a message on waits for
+        # requests sent from the transport's fan out pool
+        self.relay_executor = ThreadPoolExecutor(max_workers=self.relay_workers, thread_name_prefix="gossip-relay")
+        self.pending_relays = threading.BoundedSemaphore(self.max_pending_relays)
+
+    def has_seen(self, message_id):
+        """
+        :param message_id:  ID of the message, see get_record_message_id and get_block_message_id
+        :return:            True if the message has been seen, False otherwise
+        """
+        with self.lock:
+            if message_id in self.seen:
+                self.seen.move_to_end(message_id)
+                return True
+            return False
+
+    def mark_seen(self, message_id):
+        """
+        Marks a message as seen once it has been accepted, so a message that was rejected is
+        accepted if it arrives again. The oldest seen messages are forgotten once max_seen is
+        reached.
+        :param message_id:  ID of the message, see get_record_message_id and get_block_message_id
+        :return:            True if the message hadn't been seen before, False otherwise
+        """
+        with self.lock:
+            if message_id in self.seen:
+                self.seen.move_to_end(message_id)
+                return False
+
+            self.seen[message_id] = True
+            while len(self.seen) > self.max_seen:
+                self.seen.popitem(last=False)
+            return True
+
+    def relay(self, function, *args):
+        """
+        Passes a message on in the background, so the peer it came from doesn't wait for it to
+        spread. Messages are dropped rather than queued without limit when the node falls behind.
+        :param function:    Function passing the message on to peers
+        :param args:        Arguments of the function
+        :return:            True if the message will be passed on, False if it was dropped
+        """
+        if not self.pending_relays.acquire(blocking=False):
+            return False
+
+        try:
+            future = self.relay_executor.submit(function, *args)
+        except RuntimeError:
+            # The node was reset and its pool shut down
+            self.pending_relays.release()
+            return False
+        future.add_done_callback(lambda _: self.pending_relays.release())
+        return True
+
+    def close(self):
+        """
+        Stops passing on messages, messages already being passed on are left to finish
+        """
+        self.relay_executor.shutdown(wait=False)
+
+    def choose_peers(self, peers, sender=None):
+        """
+        Chooses the peers a message is passed on to
+        :param peers:   List of known peer addresses
+        :param sender:  Address of the peer the message was received from, which already has it
+        :return:        List of at most fan_out peer addresses
+        """
+        candidates = [peer for peer in peers if peer != sender]
+        if len(candidates) <= self.fan_out:
+            return candidates
+        return random.sample(candidates, self.fan_out)
+
+
+def get_record_message_id(record):
+    """
+    :param record:  Unverified maintenance record
+    :return:        ID of the gossip message carrying the record
+    """
+    return f"record:{record.filename}"
+
+
+def get_block_message_id(block):
+    """
+    :param block:   Sealed block
+    :return:        ID of the gossip message carrying the block
+    """
+    return f"block:{block.hash.hex()}"
@@ -0,0 +1,209 @@
+import collections
+import threading
+
+from blockchain import block_utils
+
+
+class CorruptBlockError(Exception):
+    """
+    Raised when a stored block can't be read or no longer matches its header
+    """
+
+    def __init__(self, index):
+        super().__init__(f"Stored block with index '{index}' is corrupt")
+        self.index = index
+
+
+class LazyChain:
+    store = None
+    headers = []
+    cache_size = None
+
+    def __init__(self, store, cache_size=1000, snapshot=None):
+        """
+        LazyChain class constructor, a view of the stored chain that keeps every block header
+        in memory but only loads a block's records when the block is accessed. Loaded blocks
+        are kept in a least recently used cache, so memory doesn't grow with the chain.
+        :param store:       Chain store holding the node's chain
+        :param cache_size:  Maximum number of blocks with records held in memory
+        :param snapshot:    Local snapshot of the chain's headers and record filenames, only
+                            blocks added after the snapshot are read from the store
+        """
+        self.store = store
+        self.cache_size = cache_size
+        self.blocks = collections.OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        # Headers in an intact snapshot are trusted without hashing them again
+        self.headers = []
+        self.snapshot_records = []
+        if snapshot is not None and is_snapshot_current(snapshot, store):
+            self.headers = [block_utils.get_header_object_from_dict(header_dict) for header_dict in snapshot['headers']]
+            self.snapshot_records = snapshot['records']
+        self.snapshot_length = len(self.headers)
+
+        for header_dict in store.read_headers(self.snapshot_length):
+            self.headers.append(block_utils.get_header_object_from_dict(header_dict))
+
+    def __len__(self):
+        return len(self.headers)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self.get_block(i) for i in range(*index.indices(len(self.headers)))]
+
+        if index < 0:
+            index += len(self.headers)
+        if not 0 <= index < len(self.headers):
+            raise IndexError("chain index out of range")
+        return self.get_block(index)
+
+    def __iter__(self):
+        # Blocks added whilst iterating are not included
+        for index in range(len(self.headers)):
+            yield self.get_block(index)
+
+    def get_block(self, index):
+        """
+        Gets a block with its records, loading it from storage if it isn't cached
+        :param index:   Index of the block
+        :return:        Block object
+        :raises CorruptBlockError: If the stored block doesn't match its header
+        """
+        with self.lock:
+            block = self.blocks.get(index)
+            if block is not None:
+                self.hits += 1
+                self.blocks.move_to_end(index)
+                return block
+            self.misses += 1
+
+        # Loading the block checks its records still hash to the block hash
+        block_dict = self.store.read(index)
+        block = None if block_dict is None else block_utils.get_block_object_from_dict(block_dict)
+        if block is None or block.hash != self.headers[index].hash:
+            raise CorruptBlockError(index)
+
+        self.cache_block(block)
+        return block
+
+    def get_header(self, index):
+        """
+        :param index:   Index of the block
+        :return:        Block object holding only the block's header, no records are loaded
+        """
+        return self.headers[index]
+
+    def cache_block(self, block):
+        """
+        Adds a block to the cache, evicting the least recently used blocks
+        :param block:   Block with its records
+        """
+        with self.lock:
+            self.blocks[block.index] = block
+            self.blocks.move_to_end(block.index)
+            while len(self.blocks) > self.cache_size:
+                self.blocks.popitem(last=False)
+
+    def append(self, block):
+        """
+        Adds a block to the end of the chain, the block must already be in the store
+        :param block:   Block to be added
+        """
+        self.headers.append(block_utils.get_header_object_from_block(block))
+        self.cache_block(block)
+
+    def truncate(self, length):
+        """
+        Removes every block after the first 'length' blocks, the blocks must already be
+        removed from the store
+        :param length:  Number of blocks kept
+        """
+        with self.lock:
+            del self.headers[length:]
+            for index in [index for index in self.blocks if index >= length]:
+                del self.blocks[index]
+            self.snapshot_length = min(self.snapshot_length, length)
+
+    def get_record_filenames(self):
+        """
+        :return: List of tuples of the filename of every record on the chain and the index
+                 of the block it is in
+        """
+        record_filenames = self.snapshot_records + self.store.read_record_filenames(self.snapshot_length)
+        # Records from the snapshot are only needed to build the record index once
+        self.snapshot_records = []
+        return record_filenames
+
+    def get_stats(self):
+        """
+        :return: Dictionary containing the length of the chain, the number of cached blocks
+                 and the cache's hits and misses
+        """
+        with self.lock:
+            return {
+                'length': len(self.headers),
+                'cached_blocks': len(self.blocks),
+                'max_cached_blocks': self.cache_size,
+                'hits': self.hits,
+                'misses': self.misses
+            }
+
+
+class ForkedChain:
+    chain = None
+    ancestor_index = None
+    blocks = []
+
+    def __init__(self, chain, ancestor_index, blocks):
+        """
+        ForkedChain class constructor, a view of a peer's fork made of the node's chain up to
+        the common ancestor followed by the peer's blocks, so the peer's blocks can be checked
+        without changing the node's chain
+        :param chain:           Node's chain
+        :param ancestor_index:  Index of the last block both chains share
+        :param blocks:          Peer's blocks after the common ancestor in object form
+        """
+        self.chain = chain
+        self.ancestor_index = ancestor_index
+        self.blocks = blocks
+
+    def __len__(self):
+        return self.ancestor_index + 1 + len(self.blocks)
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("chain index out of range")
+
+        if index <= self.ancestor_index:
+            return self.chain[index]
+        return self.blocks[index - self.ancestor_index - 1]
+
+    def get_header(self, index):
+        """
+        :param index:   Index of the block
+        :return:        Header of a block before the fork, or a block on the fork
+        """
+        if index <= self.ancestor_index:
+            return self.chain.get_header(index)
+        return self.blocks[index - self.ancestor_index - 1]
+
+
+def is_snapshot_current(snapshot, store):
+    """
+    Checks a snapshot is a prefix of the stored chain, the store may have had blocks added
+    since the snapshot was taken
+    :param snapshot:    Snapshot in dictionary format
+    :param store:       Chain store holding the node's chain
+    :return:            True if the snapshot matches the store, False otherwise
+    """
+    snapshot_length = len(snapshot['headers'])
+    if snapshot_length == 0 or snapshot_length > len(store):
+        return False
+
+    last_block_dict = store.read(snapshot_length - 1)
+    return last_block_dict is not None and last_block_dict['hash'] == snapshot['headers'][-1]['hash']
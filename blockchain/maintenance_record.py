@@ -1,31 +1,60 @@
-import hashlib
+from blockchain import block_utils, chain_utils
 
 
 class MaintenanceRecord:
-    aircraft_reg_number = None
-    date_of_record = None
-    filename = None
-    file_hash = None
-    file_path = None
-
-    def __init__(self, aircraft_reg_number, date_of_record, filename, file_path):
-        self.aircraft_reg_number = aircraft_reg_number
-        self.date_of_record = date_of_record
-        self.filename = filename
-        self.file_path = file_path
-        self.file_hash = self.get_file_hash()
+    # Slots keep records small when a large chain is held in memory
+    __slots__ = ('aircraft_reg_number', 'date_of_record', 'filename', 'stored', 'file_hash')
 
-    def get_file_hash(self):
+    def __init__(self, aircraft_reg_number, date_of_record, filename, stored, file_hash=None):
         """
-        Generates a fingerprint of a maintenance record document
+        MaintenanceRecord class constructor, a record can't be changed once it is created
+        :param aircraft_reg_number: Registration number of the aircraft the record is for
+        :param date_of_record:      Date the maintenance was carried out
+        :param filename:            Name of the record's file
+        :param stored:              True if the record's file is in the used records directory
+        :param file_hash:           Fingerprint of the record's file in bytes, the file is only
+                                    hashed when this is not provided
         """
-        sha256 = hashlib.sha256()
+        # Fields are set past __setattr__, which stops the record being changed afterwards
+        object.__setattr__(self, 'aircraft_reg_number', aircraft_reg_number)
+        object.__setattr__(self, 'date_of_record', date_of_record)
+        object.__setattr__(self, 'filename', filename)
+        object.__setattr__(self, 'stored', stored)
+        if file_hash is None:
+            file_hash = self.get_file_hash()
+        object.__setattr__(self, 'file_hash', file_hash)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"Record '{self.filename}' can't be changed")
+
+    def __reduce__(self):
+        # Records are rebuilt through the constructor when a block is sent to a mining process
+        return MaintenanceRecord, (self.aircraft_reg_number, self.date_of_record, self.filename, self.stored,
+                                   self.file_hash)
 
-        with open(self.file_path, 'rb') as f:
-            while True:
-                data = f.read(65536)
-                if not data:
-                    break
-                sha256.update(data)
+    @property
+    def file_path(self):
+        """
+        Path to the record's file on this node, None if the node doesn't have the file
+        """
+        if self.stored:
+            return block_utils.path_to_stored_record(self.filename)
+        return block_utils.path_to_unused_record(self.filename)
 
-        return sha256.hexdigest()
+    def get_file_hash(self):
+        """
+        Generates a fingerprint of a maintenance record document, files that are unchanged
+        since they were last hashed are not read again
+        """
+        return bytes.fromhex(chain_utils.get_fingerprint_cache().get_sha256(self.file_path))
+
+    def get_record_data(self):
+        """
+        Returns the record in a format suitable for JSON serialisation
+        """
+        return {
+            'aircraft_reg_number': self.aircraft_reg_number,
+            'date_of_record': self.date_of_record,
+            'filename': self.filename,
+            'file_hash': self.file_hash.hex()
+        }
@@ -0,0 +1,131 @@
+import hashlib
+import json
+
+# Prefixes keep leaf hashes and interior node hashes from ever colliding
+leaf_prefix = b'\x00'
+node_prefix = b'\x01'
+
+
+def get_record_leaf_hash(record):
+    """
+    Utility function to get the leaf hash of a maintenance record
+    :param record:  Record in MaintenanceRecord type
+    :return:        Hash of the record's leaf in the Merkle tree in bytes
+    """
+    return get_leaf_hash(record.get_record_data())
+
+
+def get_leaf_hash(record_data):
+    """
+    Utility function to get the leaf hash of a record in dictionary format
+    :param record_data: Record in dictionary format
+    :return:            Hash of the record's leaf in the Merkle tree in bytes
+    """
+    json_record = json.dumps(record_data, sort_keys=True)
+    return hashlib.sha256(leaf_prefix + json_record.encode()).digest()
+
+
+def get_node_hash(left_hash, right_hash):
+    """
+    Utility function to get the hash of an interior node from the hashes of its children,
+    hashes are in bytes
+    """
+    return hashlib.sha256(node_prefix + left_hash + right_hash).digest()
+
+
+def get_next_level(level):
+    """
+    Utility function to hash a level of the Merkle tree into the level above it, a node
+    without a sibling is promoted to the next level unchanged
+    :param level:   List of hashes in a level of the tree
+    :return:        List of hashes in the level above
+    """
+    next_level = []
+    for i in range(0, len(level) - 1, 2):
+        next_level.append(get_node_hash(level[i], level[i + 1]))
+    if len(level) % 2 == 1:
+        next_level.append(level[-1])
+    return next_level
+
+
+def get_merkle_root(leaf_hashes):
+    """
+    Utility function to get the root of a Merkle tree
+    :param leaf_hashes: List of leaf hashes in the tree
+    :return:            Merkle root of the tree in bytes
+    """
+    if len(leaf_hashes) == 0:
+        return hashlib.sha256(b'').digest()
+
+    level = list(leaf_hashes)
+    while len(level) > 1:
+        level = get_next_level(level)
+    return level[0]
+
+
+def get_merkle_proof(leaf_hashes, leaf_index):
+    """
+    Utility function to get an inclusion proof for a leaf of a Merkle tree
+    :param leaf_hashes: List of leaf hashes in the tree
+    :param leaf_index:  Position of the leaf the proof is for
+    :return:            List of sibling hashes from the leaf to the root, each with the side
+                        the sibling is on
+    """
+    proof = []
+    level = list(leaf_hashes)
+    index = leaf_index
+
+    while len(level) > 1:
+        # Nodes without a sibling are promoted, so contribute nothing to the proof
+        if index % 2 == 1:
+            proof.append({'hash': level[index - 1], 'position': 'left'})
+        elif index + 1 < len(level):
+            proof.append({'hash': level[index + 1], 'position': 'right'})
+        level = get_next_level(level)
+        index //= 2
+    return proof
+
+
+def get_root_from_proof(leaf_hash, proof):
+    """
+    Utility function to hash a leaf with its inclusion proof up to the root of the tree
+    :param leaf_hash:   Hash of the leaf
+    :param proof:       Inclusion proof for the leaf
+    :return:            Merkle root the proof leads to
+    """
+    current_hash = leaf_hash
+    for sibling in proof:
+        if sibling['position'] == 'left':
+            current_hash = get_node_hash(sibling['hash'], current_hash)
+        else:
+            current_hash = get_node_hash(current_hash, sibling['hash'])
+    return current_hash
+
+
+def is_merkle_proof_valid(leaf_hash, proof, merkle_root):
+    """
+    Utility function to check a leaf is included in a Merkle tree
+    :param leaf_hash:   Hash of the leaf
+    :param proof:       Inclusion proof for the leaf
+    :param merkle_root: Root of the tree
+    :return:            True if the proof is valid, False otherwise
+    """
+    return get_root_from_proof(leaf_hash, proof) == merkle_root
+
+
+def get_proof_dict(proof):
+    """
+    Utility function to change the format of an inclusion proof allowing it to be JSON serialised
+    :param proof:   Inclusion proof with sibling hashes in bytes
+    :return:        Inclusion proof with sibling hashes in hex format
+    """
+    return [{'hash': sibling['hash'].hex(), 'position': sibling['position']} for sibling in proof]
+
+
+def get_proof_from_dict(proof_dict):
+    """
+    Utility function to convert an inclusion proof received in JSON format back to bytes
+    :param proof_dict:  Inclusion proof with sibling hashes in hex format
+    :return:            Inclusion proof with sibling hashes in bytes
+    """
+    return [{'hash': bytes.fromhex(sibling['hash']), 'position': sibling['position']} for sibling in proof_dict]
@@ -0,0 +1,164 @@
+import multiprocessing
+import os
+import queue
+
+from blockchain import chain_utils, difficulty
+from blockchain.block import get_block_digest_from_midstate
+
+# Create logger
+logger = chain_utils.init_logger("Miner")
+
+# Number of nonces a worker tries between checks of the stop event
+stop_check_interval = 2048
+
+
+def search_nonces(block, start_nonce, step, stop_event, result_queue):
+    """
+    Worker function, tries every 'step'-th nonce starting from 'start_nonce' until a valid
+    hash is found or another worker signals that the block has been solved
+
+    :param block:           Block to be solved
+    :param start_nonce:     First nonce tried by this worker
+    :param step:            Distance between nonces tried by this worker
+    :param stop_event:      Event set once the block is solved
+    :param result_queue:    Queue the solving nonce and hash are put on
+    """
+    target = difficulty.get_target(block.difficulty)
+    nonce = start_nonce
+
+    # The header prefix is hashed once, each attempt only hashes the nonce
+    midstate = block.get_midstate()
+
+    while not stop_event.is_set():
+        # Try a batch of nonces before checking the stop event again
+        for _ in range(stop_check_interval):
+            block_digest = get_block_digest_from_midstate(midstate, nonce)
+            if block_digest < target:
+                result_queue.put((nonce, block_digest))
+                stop_event.set()
+                return
+            nonce += step
+
+
+class MiningSession:
+    block = None
+    stop_event = None
+    cancelled = False
+
+    def __init__(self, block):
+        """
+        MiningSession class constructor, a session tracks the mining of a single block
+        :param block:   Block being mined
+        """
+        self.block = block
+        self.stop_event = multiprocessing.get_context().Event()
+        self.cancelled = False
+
+    def cancel(self):
+        """
+        Stops every worker mining the block, e.g. when a peer's block for the same index arrives
+        """
+        self.cancelled = True
+        self.stop_event.set()
+
+
+class Miner:
+    num_workers = None
+
+    def __init__(self, num_workers=None):
+        """
+        Miner class constructor
+        :param num_workers: Number of processes searching for a nonce, defaults to the number
+                            of cores on the machine
+        """
+        self.num_workers = num_workers or os.cpu_count() or 1
+
+    def solve(self, block, session=None):
+        """
+        Splits the nonce space across a pool of processes, every process is stopped as soon
+        as one of them finds a valid hash or the session is cancelled. The solving nonce is
+        set on the block.
+
+        :param block:   Block to be solved
+        :param session: Mining session allowing the search to be cancelled
+        :return:        Hash of the solved block, None if the session was cancelled
+        """
+        logger.info(f"Solving block with index '{block.index}' using {self.num_workers} worker(s)")
+
+        if session is None:
+            session = MiningSession(block)
+
+        # Avoid the cost of starting processes when mining on a single core
+        if self.num_workers == 1:
+            return self.solve_in_process(block, session)
+
+        context = multiprocessing.get_context()
+        stop_event = session.stop_event
+        result_queue = context.Queue()
+
+        # Worker 'i' tries nonces i, i + n, i + 2n, ... for n workers
+        workers = []
+        for worker_index in range(self.num_workers):
+            worker = context.Process(target=search_nonces,
+                                     args=(block, worker_index, self.num_workers, stop_event, result_queue),
+                                     daemon=True)
+            worker.start()
+            workers.append(worker)
+
+        try:
+            result = self.wait_for_result(workers, result_queue, session)
+        finally:
+            # Stop every worker once the block has been solved
+            stop_event.set()
+            for worker in workers:
+                worker.join()
+
+        if result is None:
+            logger.info(f"Mining of block with index '{block.index}' was cancelled")
+            return None
+
+        block.nonce, block_hash = result
+        return block_hash
+
+    def solve_in_process(self, block, session):
+        """
+        Increments the nonce of a block until a valid hash is found, without starting workers
+        :param block:   Block to be solved
+        :param session: Mining session allowing the search to be cancelled
+        :return:        Hash of the solved block, None if the session was cancelled
+        """
+        target = difficulty.get_target(block.difficulty)
+        midstate = block.get_midstate()
+        nonce = 0
+
+        while not session.cancelled:
+            # Try a batch of nonces before checking the session again
+            for _ in range(stop_check_interval):
+                block_digest = get_block_digest_from_midstate(midstate, nonce)
+                if block_digest < target:
+                    block.nonce = nonce
+                    return block_digest
+                nonce += 1
+
+        logger.info(f"Mining of block with index '{block.index}' was cancelled")
+        return None
+
+    @staticmethod
+    def wait_for_result(workers, result_queue, session):
+        """
+        Waits for a worker to put a solution on the result queue
+        :param workers:         Worker processes searching for a nonce
+        :param result_queue:    Queue the solving nonce and hash are put on
+        :param session:         Mining session allowing the search to be cancelled
+        :return:                Tuple of the solving nonce and the block hash, None if the
+                                session was cancelled
+        """
+        while True:
+            try:
+                return result_queue.get(timeout=0.1)
+            except queue.Empty:
+                if session.cancelled:
+                    return None
+                # Every worker exiting without a result means they failed
+                if not any(worker.is_alive() for worker in workers) and result_queue.empty():
+                    raise RuntimeError("Every mining worker exited without solving the block")
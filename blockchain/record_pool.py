@@ -1,3 +1,5 @@
+import threading
+
 from blockchain import chain_utils
 
 # Create logger
@@ -7,48 +9,88 @@ logger = chain_utils.init_logger("Record Pool")
 class RecordPool:
 
     def __init__(self):
-        self.unverified_records = []
+        # Unverified records keyed by filename, in the order they were added
+        self.records = {}
+        # Filenames of records already verified on the chain
+        self.verified_filenames = set()
+        self.lock = threading.Lock()
+
+    @property
+    def unverified_records(self):
+        """
+        List of unverified records in the order they were added
+        """
+        with self.lock:
+            return list(self.records.values())
 
     def add_record(self, record):
         """
         :param record: Record to be added to the pool of unverified records
+        :return:       True if the record was added, False if it is already in the pool or verified
         """
-        for added_record in self.unverified_records:
-            if added_record.filename == record.filename:
-                return None
-        self.unverified_records.append(record)
+        with self.lock:
+            if record.filename in self.records or record.filename in self.verified_filenames:
+                return False
+            self.records[record.filename] = record
+            return True
 
-    def get_unverified_records(self):
+    def get_unverified_records(self, policy):
         """
-        Return a list of at most three unverified records, or
-        Return None if no records in record pool.
+        Return as many unverified records as the block assembly policy allows, or
+        Return an empty list if no records in record pool.
+        :param policy:  Block assembly policy selecting the records
         """
-        records = []
-
-        # Return at most 3 records, unless no records exist in pool
-        if self.get_num_unverified_records() >= 3:
-            for i in range(3):
-                records.append(self.unverified_records[i])
-        elif self.get_num_unverified_records() > 0:
-            for i in range(self.get_num_unverified_records()):
-                records.append(self.unverified_records[i])
-                
-        return records
+        with self.lock:
+            return policy.select_records(self.records.values())
 
     def get_num_unverified_records(self):
         """
         Return the number of unverified records in record pool
         """
-        return len(self.unverified_records)
+        return len(self.records)
 
     def remove_records(self, records):
         """
-        Removes a record from record pool once it has been verified
+        Removes records from record pool once they have been verified, verified records
+        are not accepted back into the pool
         :param records: List of records to be removed from pool
-        :return:       True if record removed, False otherwise
         """
-        for verified_record in records:
-            for unverified_record in self.unverified_records:
-                if unverified_record.aircraft_reg_number == verified_record.aircraft_reg_number and \
-                   unverified_record.filename == verified_record.filename:
-                    self.unverified_records.remove(unverified_record)
+        self.mark_verified([verified_record.filename for verified_record in records])
+
+    def mark_verified(self, filenames):
+        """
+        Marks records as verified, removing them from the pool if they are in it
+        :param filenames:   List of filenames of verified records
+        """
+        with self.lock:
+            for filename in filenames:
+                self.records.pop(filename, None)
+                self.verified_filenames.add(filename)
+
+    def mark_unverified(self, filenames):
+        """
+        Forgets that records are verified, e.g. when the blocks they were in are removed from
+        the chain, so the records are accepted back into the pool
+        :param filenames:   List of filenames of records no longer on the chain
+        """
+        with self.lock:
+            for filename in filenames:
+                self.verified_filenames.discard(filename)
+
+    def restore_records(self, records):
+        """
+        Returns records to the pool when the block they were verified in is orphaned by a fork
+        :param records: List of records no longer on the chain
+        """
+        with self.lock:
+            for record in records:
+                self.verified_filenames.discard(record.filename)
+                if record.filename not in self.records:
+                    self.records[record.filename] = record
+
+    def clear_verified_records(self):
+        """
+        Forgets which records are verified, e.g. when the node's chain is replaced
+        """
+        with self.lock:
+            self.verified_filenames = set()
@@ -0,0 +1,195 @@
+import json
+import sqlite3
+import threading
+
+# Record columns are declared without a type so values keep the type they were given
+schema = """
+CREATE TABLE IF NOT EXISTS headers (
+    block_index INTEGER PRIMARY KEY,
+    previous_hash TEXT NOT NULL,
+    timestamp REAL NOT NULL,
+    nonce INTEGER NOT NULL,
+    difficulty INTEGER NOT NULL,
+    merkle_root TEXT NOT NULL,
+    hash TEXT,
+    signer TEXT,
+    signature TEXT
+);
+CREATE TABLE IF NOT EXISTS records (
+    block_index INTEGER NOT NULL REFERENCES headers (block_index),
+    position INTEGER NOT NULL,
+    aircraft_reg_number,
+    date_of_record,
+    filename,
+    file_hash TEXT NOT NULL,
+    PRIMARY KEY (block_index, position)
+);
+CREATE INDEX IF NOT EXISTS records_filename ON records (filename);
+CREATE INDEX IF NOT EXISTS records_aircraft_reg_number ON records (aircraft_reg_number);
+CREATE INDEX IF NOT EXISTS records_date_of_record ON records (date_of_record);
+"""
+
+header_columns = ['index', 'previous_hash', 'timestamp', 'nonce', 'difficulty', 'merkle_root', 'hash', 'signer',
+                  'signature']
+record_columns = ['aircraft_reg_number', 'date_of_record', 'filename', 'file_hash']
+
+
+class SqliteChainStore:
+    database_path = None
+
+    def __init__(self, database_path):
+        """
+        SqliteChainStore class constructor, stores block headers and records in separate tables
+        so records can be looked up by filename, aircraft and date without scanning the chain
+        :param database_path:   Path to the SQLite database file
+        """
+        self.database_path = database_path
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(database_path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.executescript(schema)
+
+    def __len__(self):
+        with self.lock:
+            return self.connection.execute("SELECT COUNT(*) FROM headers").fetchone()[0]
+
+    def append(self, block_encoding):
+        """
+        Adds a block to the end of the stored chain
+        :param block_encoding:  Canonical encoding of the block in bytes
+        :return:                Sequence number of the write, SQLite commits are already durable
+        """
+        with self.lock, self.connection:
+            self.insert_block(json.loads(block_encoding))
+        return None
+
+    def wait_for_commit(self, sequence):
+        """
+        SQLite makes each transaction durable when it commits, so there is nothing to wait for
+        """
+        pass
+
+    def insert_block(self, block_dict):
+        """
+        Inserts the header and records of a block, the caller manages the transaction
+        :param block_dict:  Block in dictionary format
+        """
+        self.connection.execute("INSERT INTO headers VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                                [block_dict.get(column) for column in header_columns])
+        self.connection.executemany("INSERT INTO records VALUES (?, ?, ?, ?, ?, ?)",
+                                    [[block_dict['index'], position] + [record[column] for column in record_columns]
+                                     for position, record in enumerate(block_dict['records'])])
+
+    def read(self, index):
+        """
+        Reads a single block from the store
+        :param index:   Index of the block
+        :return:        Block in dictionary format, None if no block has the index
+        """
+        with self.lock:
+            header = self.connection.execute("SELECT * FROM headers WHERE block_index = ?", [index]).fetchone()
+            if header is None:
+                return None
+            records = self.connection.execute("SELECT * FROM records WHERE block_index = ? ORDER BY position",
+                                              [index]).fetchall()
+        return get_block_dict_from_rows(header, records)
+
+    def read_all(self):
+        """
+        Reads every block from the store
+        :return: List of blocks in dictionary format
+        """
+        with self.lock:
+            headers = self.connection.execute("SELECT * FROM headers ORDER BY block_index").fetchall()
+            records = self.connection.execute("SELECT * FROM records ORDER BY block_index, position").fetchall()
+
+        # Group records by the block they are in
+        block_records = {}
+        for record in records:
+            block_records.setdefault(record[0], []).append(record)
+
+        return [get_block_dict_from_rows(header, block_records.get(header[0], [])) for header in headers]
+
+    def read_headers(self, start_index=0):
+        """
+        Reads the header of every block without reading any records
+        :param start_index: Index of the first block to read
+        :return:            List of block headers in dictionary format
+        """
+        with self.lock:
+            headers = self.connection.execute("SELECT * FROM headers WHERE block_index >= ? ORDER BY block_index",
+                                              [start_index]).fetchall()
+        return [dict(zip(header_columns, header)) for header in headers]
+
+    def read_record_filenames(self, start_index=0):
+        """
+        Reads the filename of every record using the filename index
+        :param start_index: Index of the first block to read
+        :return:            List of tuples of a record's filename and the index of its block
+        """
+        with self.lock:
+            return self.connection.execute("SELECT filename, block_index FROM records WHERE block_index >= ?",
+                                           [start_index]).fetchall()
+
+    def rewrite(self, block_encodings):
+        """
+        Replaces every block in the store in a single transaction
+        :param block_encodings: List of canonical block encodings in bytes
+        """
+        with self.lock, self.connection:
+            self.connection.execute("DELETE FROM records")
+            self.connection.execute("DELETE FROM headers")
+            for block_encoding in block_encodings:
+                self.insert_block(json.loads(block_encoding))
+
+    def truncate(self, length):
+        """
+        Removes every block after the first 'length' blocks in a single transaction
+        :param length:  Number of blocks kept
+        """
+        with self.lock, self.connection:
+            self.connection.execute("DELETE FROM records WHERE block_index >= ?", [length])
+            self.connection.execute("DELETE FROM headers WHERE block_index >= ?", [length])
+
+    def find_block_index(self, filename):
+        """
+        Looks up the block a record was verified in using the filename index
+        :param filename:    Filename of the record
+        :return:            Index of the block, None if the record is not on the chain
+        """
+        with self.lock:
+            row = self.connection.execute("SELECT block_index FROM records WHERE filename = ? LIMIT 1",
+                                          [filename]).fetchone()
+        return None if row is None else row[0]
+
+    def get_records_by_aircraft(self, aircraft_reg_number):
+        """
+        Looks up every record for an aircraft using the aircraft registration index
+        :param aircraft_reg_number: Registration number of the aircraft
+        :return:                    List of records in dictionary format, in chain order
+        """
+        with self.lock:
+            rows = self.connection.execute("SELECT * FROM records WHERE aircraft_reg_number = ? "
+                                           "ORDER BY block_index, position",
+                                           [aircraft_reg_number]).fetchall()
+        return [get_record_dict_from_row(row) for row in rows]
+
+
+def get_block_dict_from_rows(header, records):
+    """
+    Converts the rows of a block back to dictionary format
+    :param header:  Row from the headers table
+    :param records: Rows from the records table, in the order they appear in the block
+    :return:        Block in dictionary format
+    """
+    block_dict = dict(zip(header_columns, header))
+    block_dict['records'] = [get_record_dict_from_row(record) for record in records]
+    return block_dict
+
+
+def get_record_dict_from_row(row):
+    """
+    :param row: Row from the records table
+    :return:    Record in dictionary format
+    """
+    return dict(zip(record_columns, row[2:]))
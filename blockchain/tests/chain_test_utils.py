@@ -0,0 +1,98 @@
+import atexit
+import os
+import tempfile
+import unittest
+import warnings
+from pathlib import Path
+from unittest import mock
+
+from blockchain import block_utils, chain_utils, difficulty
+from blockchain.block import Block
+from blockchain.chain import Blockchain
+from blockchain.lazy_chain import ForkedChain
+
+
+def create_record(filename, aircraft_reg_number='G-ABCD'):
+    """
+    :param filename:            Filename of the record
+    :param aircraft_reg_number: Registration number of the aircraft the record is for
+    :return:                    Record with a made up file hash, so no record file is needed
+    """
+    return block_utils.get_record_object_from_dict({'aircraft_reg_number': aircraft_reg_number,
+                                                    'date_of_record': '01/01/2020',
+                                                    'filename': filename,
+                                                    'file_hash': 'ab' * 32}, False)
+
+
+class ChainTestCase(unittest.TestCase):
+    """
+    Test case giving each test a node chain stored in its own temporary data directory, mined
+    at a low difficulty in a single process
+    """
+
+    def setUp(self):
+        # Chain stores keep their files open for the life of the node
+        warnings.simplefilter('ignore', ResourceWarning)
+
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.data_directory = os.path.join(directory.name, "data")
+        os.makedirs(self.data_directory)
+
+        patches = [mock.patch.object(chain_utils, 'get_app_root_directory', return_value=Path(directory.name)),
+                   mock.patch.object(chain_utils, 'chain_store', None),
+                   mock.patch.object(chain_utils, 'fingerprint_cache', None),
+                   mock.patch.object(difficulty, 'initial_difficulty', 8),
+                   mock.patch.object(difficulty, 'retarget_interval', 1000),
+                   mock.patch.object(Blockchain, 'mining_workers', 1)]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def create_blockchain(self):
+        """
+        :return: Node's chain, opened from the test's data directory
+        """
+        blockchain = Blockchain()
+        # Snapshots are written by the test, never when the test process exits
+        atexit.unregister(blockchain.write_snapshot)
+        return blockchain
+
+    def reopen_blockchain(self):
+        """
+        :return: Node's chain, reopened from storage as it would be when the node restarts
+        """
+        chain_utils.chain_store = None
+        return self.create_blockchain()
+
+    def mine_blocks(self, blockchain, filenames):
+        """
+        Mines a block for each record on the end of a node's chain
+        :param blockchain:  Node's chain
+        :param filenames:   Filename of the record in each block
+        :return:            List of mined blocks
+        """
+        blocks = []
+        for filename in filenames:
+            blockchain.record_pool.add_record(create_record(filename))
+            blocks.append(blockchain.mine())
+        return blocks
+
+    def mine_fork(self, blockchain, ancestor_index, filenames):
+        """
+        Mines a fork of a node's chain without adding it to the chain, as a peer would
+        :param blockchain:      Node's chain
+        :param ancestor_index:  Index of the block the fork is built on
+        :param filenames:       Filename of the record in each block of the fork
+        :return:                List of the fork's blocks
+        """
+        blocks = []
+        for filename in filenames:
+            forked_chain = ForkedChain(blockchain.chain, ancestor_index, blocks)
+            previous_block = forked_chain[-1]
+            timestamp = difficulty.get_next_timestamp(previous_block.timestamp)
+            block = Block(previous_block.index + 1, previous_block.hash, timestamp, [create_record(filename)],
+                          difficulty=blockchain.consensus.get_difficulty(forked_chain, previous_block.index + 1))
+            block.hash = blockchain.seal_block(block)
+            blocks.append(block)
+        return blocks
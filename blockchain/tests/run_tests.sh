@@ -4,10 +4,13 @@ clear
 echo -e "\n\n>> Moving to root directory..."
 cd ../..
 
-echo -e ">> Removing blocks.json..."
-rm data/blocks.json > /dev/null 2>&1
+echo -e ">> Removing block log..."
+rm -r data/blocks.log data/blocks.idx data/blocks.hdr data/chain.db data/chain.bin data/chain.offsets data/archive > /dev/null 2>&1
 
-echo -e ">> Building docker container image"
+echo -e "\n\n================================[UNIT TESTS]================================"
+python3 -m unittest blockchain.tests.test_merkle blockchain.tests.test_block_log blockchain.tests.test_chain blockchain.tests.test_difficulty blockchain.tests.test_durability blockchain.tests.test_tiered_store blockchain.tests.test_transport blockchain.tests.test_gossip blockchain.tests.test_node blockchain.tests.test_binary_store blockchain.tests.test_assembly_policy blockchain.tests.test_fingerprint_cache blockchain.tests.test_record_pool blockchain.tests.test_miner
+
+echo -e "\n>> Building docker container image"
 docker build -q -t miblock:latest . > /dev/null 2>&1
 
 echo -e ">> Creating containers (port 5000, 5001 & 5002)"
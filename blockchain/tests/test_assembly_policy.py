@@ -0,0 +1,62 @@
+import unittest
+
+from blockchain.assembly_policy import BlockAssemblyPolicy, get_record_size
+from blockchain.maintenance_record import MaintenanceRecord
+
+
+def create_record(filename, aircraft_reg_number='G-ABCD', date_of_record='01/01/2020'):
+    """
+    :return: Record with a made up file hash, no record file is needed
+    """
+    return MaintenanceRecord(aircraft_reg_number, date_of_record, filename, False, bytes(32))
+
+
+def get_filenames(records):
+    return [record.filename for record in records]
+
+
+class AssemblyPolicyTests(unittest.TestCase):
+
+    def setUp(self):
+        # Records in the order they were added to the pool
+        self.records = [create_record('a.pdf', 'G-BBBB', '03/01/2020'),
+                        create_record('b.pdf', 'G-AAAA', '2020-01-01'),
+                        create_record('c.pdf', 'G-CCCC', 'unknown'),
+                        create_record('d.pdf', 'G-AAAA', '02/01/2020')]
+
+    def test_unknown_ordering_rejected(self):
+        with self.assertRaises(ValueError):
+            BlockAssemblyPolicy(ordering='newest')
+
+    def test_arrival_ordering(self):
+        policy = BlockAssemblyPolicy(max_records=3)
+        self.assertEqual(get_filenames(policy.select_records(self.records)), ['a.pdf', 'b.pdf', 'c.pdf'])
+
+    def test_oldest_ordering(self):
+        # Dates in either format are compared, dates that can't be parsed go last
+        policy = BlockAssemblyPolicy(ordering='oldest')
+        self.assertEqual(get_filenames(policy.select_records(self.records)), ['b.pdf', 'd.pdf', 'a.pdf', 'c.pdf'])
+
+        policy = BlockAssemblyPolicy(max_records=2, ordering='oldest')
+        self.assertEqual(get_filenames(policy.select_records(iter(self.records))), ['b.pdf', 'd.pdf'])
+
+    def test_aircraft_ordering(self):
+        # Records for the same aircraft stay in the order they arrived
+        policy = BlockAssemblyPolicy(max_records=3, ordering='aircraft')
+        self.assertEqual(get_filenames(policy.select_records(self.records)), ['b.pdf', 'd.pdf', 'a.pdf'])
+
+    def test_size_limit(self):
+        records = [create_record('a.pdf'), create_record('long_filename.pdf'), create_record('c.pdf')]
+        max_size = get_record_size(records[0]) + get_record_size(records[1]) - 1
+        policy = BlockAssemblyPolicy(max_size=max_size)
+
+        # The block is full once a record doesn't fit, later records aren't looked at
+        def arriving_records():
+            yield from records
+            self.fail("Records were taken after the block was full")
+
+        self.assertEqual(get_filenames(policy.select_records(arriving_records())), ['a.pdf'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,148 @@
+import json
+import os
+import struct
+import tempfile
+import unittest
+import warnings
+from unittest import mock
+
+from blockchain.binary_store import (BinaryChainStore, convert_binary_to_json, convert_json_to_binary, encode_block,
+                                     offset_format)
+
+
+def create_block_dicts(start_index, end_index, num_records=1):
+    """
+    :param start_index: Index of the first block
+    :param end_index:   Index after the last block
+    :param num_records: Number of records in each block
+    :return:            List of block dictionaries with every field the binary format holds
+    """
+    return [{'index': index,
+             'previous_hash': f"{max(index - 1, 0):064x}",
+             'timestamp': 1577836800.0 + index,
+             'nonce': index * 7,
+             'difficulty': 8,
+             'merkle_root': f"{index:064x}",
+             'hash': f"{index:064x}",
+             'signer': None,
+             'signature': None,
+             'records': [{'aircraft_reg_number': str(index % 2),
+                          'date_of_record': '01/01/2020',
+                          'filename': f"record_{index}_{record_index}.pdf",
+                          'file_hash': 'ab' * 32} for record_index in range(num_records)]}
+            for index in range(start_index, end_index)]
+
+
+def encode_block_dict(block_dict):
+    """
+    :param block_dict:  Block in dictionary format
+    :return:            Canonical encoding of the block in bytes
+    """
+    return json.dumps(block_dict, sort_keys=True, separators=(',', ':')).encode()
+
+
+class BinaryStoreTests(unittest.TestCase):
+
+    def setUp(self):
+        # Stores keep their chain file mapped for the life of the node
+        warnings.simplefilter('ignore', ResourceWarning)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.chain_path = os.path.join(directory.name, "chain.bin")
+        self.offsets_path = os.path.join(directory.name, "chain.off")
+        self.json_path = os.path.join(directory.name, "chain.json")
+
+    def open_store(self):
+        return BinaryChainStore(self.chain_path, self.offsets_path, commit_window=0)
+
+    def append_blocks(self, store, block_dicts):
+        for block_dict in block_dicts:
+            store.wait_for_commit(store.append(encode_block_dict(block_dict)))
+
+    def test_read_after_append(self):
+        store = self.open_store()
+        self.append_blocks(store, create_block_dicts(0, 2))
+        self.assertEqual(store.read(1), create_block_dicts(1, 2)[0])
+
+        # The chain file is mapped again after an append, so the new block is read from the new map
+        self.append_blocks(store, create_block_dicts(2, 4, num_records=2))
+        self.assertEqual(store.read(3), create_block_dicts(3, 4, num_records=2)[0])
+        self.assertIsNone(store.read(4))
+        self.assertEqual([header['hash'] for header in store.read_headers(2)], [f"{2:064x}", f"{3:064x}"])
+        self.assertEqual(store.find_block_index('record_3_1.pdf'), 3)
+
+        self.assertEqual(self.open_store().read_all(), create_block_dicts(0, 2) +
+                         create_block_dicts(2, 4, num_records=2))
+
+    def test_recover_torn_write(self):
+        store = self.open_store()
+        self.append_blocks(store, create_block_dicts(0, 3))
+
+        # A crash part way through appending leaves half an entry at the end of the file, and
+        # the offset table isn't synced so it can hold the torn entry's offset
+        torn_entry = encode_block(create_block_dicts(3, 4)[0])
+        with open(self.offsets_path, 'ab') as offsets_file:
+            offsets_file.write(struct.pack(offset_format, os.path.getsize(self.chain_path)))
+        with open(self.chain_path, 'ab') as chain_file:
+            chain_file.write(torn_entry[:len(torn_entry) // 2])
+        chain_size = os.path.getsize(self.chain_path)
+
+        store = self.open_store()
+        self.assertEqual(len(store), 3)
+        self.assertEqual(store.read_all(), create_block_dicts(0, 3))
+        self.assertLess(os.path.getsize(self.chain_path), chain_size)
+
+        # New blocks are appended after the last intact entry
+        self.append_blocks(store, create_block_dicts(3, 5))
+        self.assertEqual(self.open_store().read_all(), create_block_dicts(0, 5))
+
+    def test_recover_missing_offset_table(self):
+        store = self.open_store()
+        self.append_blocks(store, create_block_dicts(0, 4))
+
+        os.remove(self.offsets_path)
+        store = self.open_store()
+        self.assertEqual(len(store), 4)
+        self.assertEqual(store.read(3), create_block_dicts(3, 4)[0])
+
+    def test_recover_crash_during_rewrite(self):
+        store = self.open_store()
+        self.append_blocks(store, create_block_dicts(0, 5))
+
+        # Crash after the new file is renamed into place but before its offset table is written, the
+        # new blocks are a different size so the old offsets aren't the start of entries in the new file
+        new_block_dicts = create_block_dicts(0, 3, num_records=3)
+        write_offsets = BinaryChainStore.write_offsets
+
+        def crash_after_file_renamed(crashing_store):
+            if crashing_store.offsets:
+                raise OSError("crash")
+            write_offsets(crashing_store)
+
+        with mock.patch.object(BinaryChainStore, 'write_offsets', crash_after_file_renamed):
+            with self.assertRaises(OSError):
+                store.rewrite([encode_block_dict(block_dict) for block_dict in new_block_dicts])
+
+        store = self.open_store()
+        self.assertEqual(store.read_all(), new_block_dicts)
+
+
+    def test_convert_round_trip(self):
+        block_dicts = create_block_dicts(0, 4, num_records=2)
+        block_dicts[2]['signer'], block_dicts[2]['signature'] = 'cd' * 32, 'ef' * 64
+
+        # A whole '/chain' response converts as well as a bare list of blocks
+        for chain_json in (block_dicts, {'chain': block_dicts, 'length': len(block_dicts)}):
+            with open(self.json_path, 'w') as json_file:
+                json.dump(chain_json, json_file)
+            convert_json_to_binary(self.json_path, self.chain_path, self.offsets_path)
+            self.assertEqual(self.open_store().read_all(), block_dicts)
+
+            os.remove(self.json_path)
+            convert_binary_to_json(self.chain_path, self.offsets_path, self.json_path)
+            with open(self.json_path, 'r') as json_file:
+                self.assertEqual(json.load(json_file), block_dicts)
+
+
+if __name__ == '__main__':
+    unittest.main()
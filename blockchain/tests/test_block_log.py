@@ -0,0 +1,239 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from blockchain.block_log import BlockLog, encode_entry, decode_entry
+
+
+def create_block_dicts(start_index, end_index):
+    """
+    :param start_index: Index of the first block
+    :param end_index:   Index after the last block
+    :return:            List of block dictionaries, only the fields the stores read are filled in
+    """
+    return [{'index': index, 'hash': f"{index:064x}", 'records': [{'filename': f"record_{index}.pdf",
+                                                                    'aircraft_reg_number': str(index % 2)}]}
+            for index in range(start_index, end_index)]
+
+
+def encode_block_dict(block_dict):
+    """
+    :param block_dict:  Block in dictionary format
+    :return:            Canonical encoding of the block in bytes
+    """
+    return json.dumps(block_dict, sort_keys=True, separators=(',', ':')).encode()
+
+
+class BlockLogTests(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.log_path = os.path.join(self.directory.name, "blocks.log")
+        self.index_path = os.path.join(self.directory.name, "blocks.idx")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def open_log(self, headers_path=None):
+        return BlockLog(self.log_path, self.index_path, commit_window=0, headers_path=headers_path)
+
+    def append_blocks(self, block_log, block_dicts):
+        for block_dict in block_dicts:
+            block_log.wait_for_commit(block_log.append(encode_block_dict(block_dict)))
+
+    def test_entry_round_trip(self):
+        block_dict = create_block_dicts(0, 1)[0]
+        entry = encode_entry(encode_block_dict(block_dict))
+        self.assertEqual(decode_entry(entry), block_dict)
+        # A torn entry has no newline and a corrupt entry fails its checksum
+        self.assertIsNone(decode_entry(entry[:-5]))
+        self.assertIsNone(decode_entry(entry[:12] + b'X' + entry[13:]))
+
+    def test_reopen(self):
+        block_log = self.open_log()
+        self.append_blocks(block_log, create_block_dicts(0, 5))
+
+        block_log = self.open_log()
+        self.assertEqual(len(block_log), 5)
+        self.assertEqual(block_log.read_all(), create_block_dicts(0, 5))
+        self.assertEqual(block_log.read(3), create_block_dicts(3, 4)[0])
+
+    def test_recover_torn_write(self):
+        block_log = self.open_log()
+        self.append_blocks(block_log, create_block_dicts(0, 3))
+
+        # A crash part way through appending leaves half an entry at the end of the log
+        torn_entry = encode_entry(encode_block_dict(create_block_dicts(3, 4)[0]))
+        with open(self.log_path, 'ab') as log_file:
+            log_file.write(torn_entry[:len(torn_entry) // 2])
+        log_size = os.path.getsize(self.log_path)
+
+        block_log = self.open_log()
+        self.assertEqual(len(block_log), 3)
+        self.assertEqual(block_log.read_all(), create_block_dicts(0, 3))
+        self.assertLess(os.path.getsize(self.log_path), log_size)
+
+        # New blocks are appended after the last intact entry
+        self.append_blocks(block_log, create_block_dicts(3, 5))
+        self.assertEqual(self.open_log().read_all(), create_block_dicts(0, 5))
+
+    def corrupt_entry(self, offset):
+        # A flipped byte fails the entry's CRC
+        with open(self.log_path, 'r+b') as log_file:
+            log_file.seek(offset + 20)
+            byte = log_file.read(1)
+            log_file.seek(offset + 20)
+            log_file.write(bytes([byte[0] ^ 0xff]))
+
+    def test_recover_corrupt_last_entry(self):
+        block_log = self.open_log()
+        self.append_blocks(block_log, create_block_dicts(0, 4))
+        corrupt_offset = block_log.offsets[3]
+        self.corrupt_entry(corrupt_offset)
+
+        # The last entry is checked on opening, a corrupt one is treated as torn
+        block_log = self.open_log()
+        self.assertEqual(len(block_log), 3)
+        self.assertEqual(block_log.read_all(), create_block_dicts(0, 3))
+        self.assertEqual(os.path.getsize(self.log_path), corrupt_offset)
+
+    def test_read_corrupt_entry(self):
+        block_log = self.open_log()
+        self.append_blocks(block_log, create_block_dicts(0, 4))
+        self.corrupt_entry(block_log.offsets[1])
+
+        # Earlier entries are only checked when they are read
+        block_log = self.open_log()
+        self.assertEqual(len(block_log), 4)
+        self.assertIsNone(block_log.read(1))
+        self.assertEqual(block_log.read(2), create_block_dicts(2, 3)[0])
+
+    def test_recover_missing_index(self):
+        block_log = self.open_log()
+        self.append_blocks(block_log, create_block_dicts(0, 4))
+
+        # The index isn't synced, so a crash can lose entries the log still has
+        os.remove(self.index_path)
+        block_log = self.open_log()
+        self.assertEqual(len(block_log), 4)
+        self.assertEqual(block_log.read(3), create_block_dicts(3, 4)[0])
+
+    def test_recover_index_past_log(self):
+        block_log = self.open_log()
+        self.append_blocks(block_log, create_block_dicts(0, 4))
+        with open(self.log_path, 'r+b') as log_file:
+            log_file.truncate(block_log.offsets[3])
+
+        # Offsets pointing past the end of the log are dropped
+        block_log = self.open_log()
+        self.assertEqual(len(block_log), 3)
+        self.assertEqual(block_log.read_all(), create_block_dicts(0, 3))
+
+    def test_rewrite(self):
+        block_log = self.open_log()
+        self.append_blocks(block_log, create_block_dicts(0, 4))
+        block_log.rewrite([encode_block_dict(block_dict) for block_dict in create_block_dicts(0, 2)])
+
+        self.assertEqual(block_log.read_all(), create_block_dicts(0, 2))
+        self.assertEqual(self.open_log().read_all(), create_block_dicts(0, 2))
+
+    def test_recover_crash_during_rewrite(self):
+        block_log = self.open_log()
+        self.append_blocks(block_log, create_block_dicts(0, 5))
+
+        # Crash after the new log is renamed into place but before its index is written, the new
+        # blocks are a different size so the old offsets aren't the start of entries in the new log
+        new_block_dicts = [dict(block_dict, hash=f"{block_dict['index'] + 100:064x}", records=[])
+                           for block_dict in create_block_dicts(0, 3)]
+        write_index = BlockLog.write_index
+
+        def crash_after_log_renamed(crashing_log):
+            if crashing_log.offsets:
+                raise OSError("crash")
+            write_index(crashing_log)
+
+        with mock.patch.object(BlockLog, 'write_index', crash_after_log_renamed):
+            with self.assertRaises(OSError):
+                block_log.rewrite([encode_block_dict(block_dict) for block_dict in new_block_dicts])
+
+        block_log = self.open_log()
+        self.assertEqual(block_log.read_all(), new_block_dicts)
+        self.assertEqual(block_log.read_headers(2), [{'index': 2, 'hash': f"{102:064x}"}])
+
+    def test_read_headers_and_record_filenames(self):
+        block_log = self.open_log()
+        self.append_blocks(block_log, create_block_dicts(0, 3))
+
+        self.assertEqual(block_log.read_headers(1), [{'index': 1, 'hash': f"{1:064x}"},
+                                                     {'index': 2, 'hash': f"{2:064x}"}])
+        self.assertEqual(block_log.read_record_filenames(1), [('record_1.pdf', 1), ('record_2.pdf', 2)])
+        self.assertEqual(block_log.find_block_index('record_2.pdf'), 2)
+        self.assertEqual(len(block_log.get_records_by_aircraft('0')), 2)
+
+
+class HeaderFileTests(BlockLogTests):
+
+    def setUp(self):
+        super().setUp()
+        self.headers_path = os.path.join(self.directory.name, "blocks.hdr")
+
+    def open_log(self, headers_path=None):
+        return super().open_log(self.headers_path)
+
+    def test_headers_read_from_header_file(self):
+        block_log = self.open_log()
+        self.append_blocks(block_log, create_block_dicts(0, 3))
+
+        # Headers and record filenames come from the header file, so the log isn't parsed
+        with mock.patch('blockchain.block_log.decode_entry') as decode_entry_mock:
+            self.assertEqual(block_log.read_headers(1), [{'index': 1, 'hash': f"{1:064x}"},
+                                                         {'index': 2, 'hash': f"{2:064x}"}])
+            self.assertEqual(block_log.read_record_filenames(), [('record_0.pdf', 0), ('record_1.pdf', 1),
+                                                                 ('record_2.pdf', 2)])
+            decode_entry_mock.assert_not_called()
+
+    def test_missing_header_file_rebuilt(self):
+        block_log = self.open_log()
+        self.append_blocks(block_log, create_block_dicts(0, 3))
+        os.remove(self.headers_path)
+
+        block_log = self.open_log()
+        self.assertEqual(len(block_log.read_headers()), 3)
+        self.assertTrue(os.path.exists(self.headers_path))
+
+    def test_stale_header_file_rebuilt(self):
+        block_log = self.open_log()
+        self.append_blocks(block_log, create_block_dicts(0, 3))
+
+        # A crash can leave the header of a block that never reached the log, followed by a torn header
+        with open(self.headers_path, 'ab') as headers_file:
+            headers_file.write(b'{"hash":"' + b'f' * 64 + b'","index":3,"record_filenames":[]}\n{"hash"')
+        block_log = self.open_log()
+        self.append_blocks(block_log, create_block_dicts(3, 4))
+        self.assertEqual(block_log.read_headers(3), [{'index': 3, 'hash': f"{3:064x}"}])
+
+    def test_header_file_rebuilt_up_to_corrupt_block(self):
+        block_log = self.open_log()
+        self.append_blocks(block_log, create_block_dicts(0, 4))
+        self.corrupt_entry(block_log.offsets[1])
+        os.remove(self.headers_path)
+
+        # The corrupt block and the blocks after it are cut from the log like a torn entry
+        block_log = self.open_log()
+        self.assertEqual(len(block_log), 1)
+        self.assertEqual(block_log.read_headers(), [{'index': 0, 'hash': f"{0:064x}"}])
+        self.assertEqual(self.open_log().read_all(), create_block_dicts(0, 1))
+
+    def test_truncate_header_file(self):
+        block_log = self.open_log()
+        self.append_blocks(block_log, create_block_dicts(0, 4))
+        block_log.truncate(2)
+
+        self.assertEqual(len(block_log.read_headers()), 2)
+        self.assertEqual(len(self.open_log().read_headers()), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,362 @@
+import time
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+from blockchain import block_utils, chain_utils
+from blockchain.block import Block
+from blockchain.chain import Blockchain
+from blockchain.lazy_chain import CorruptBlockError
+from blockchain.tests.chain_test_utils import ChainTestCase, create_record
+
+
+class ChainValidationTests(ChainTestCase):
+
+    def test_genesis_block_is_shared(self):
+        blockchain = self.create_blockchain()
+        self.assertEqual(blockchain.chain[0].hash, blockchain.genesis_hash)
+        self.assertEqual(blockchain.create_genesis_block().hash, blockchain.genesis_hash)
+
+    def test_chain_valid_after_reopening(self):
+        blockchain = self.create_blockchain()
+        self.mine_blocks(blockchain, ['a.pdf', 'b.pdf', 'c.pdf'])
+        self.assertTrue(blockchain.is_chain_valid())
+
+        blockchain = self.reopen_blockchain()
+        self.assertEqual(len(blockchain.chain), 4)
+        self.assertEqual(blockchain.validated_index, 3)
+        self.assertTrue(blockchain.is_chain_valid())
+
+    def test_segment_rejects_other_genesis_block(self):
+        blockchain = self.create_blockchain()
+        blocks = self.mine_blocks(blockchain, ['a.pdf'])
+
+        # A genesis block with another timestamp hashes differently to the node's own
+        other_genesis_block = Block(0, bytes(32), 1.0, [], difficulty=blockchain.chain[0].difficulty)
+        other_genesis_block.hash = other_genesis_block.get_block_hash()
+        self.assertFalse(blockchain.is_chain_segment_valid([other_genesis_block] + blocks, 0, 2))
+        self.assertTrue(blockchain.is_chain_segment_valid([blockchain.chain[0]] + blocks, 0, 2))
+
+    def test_segment_rejects_misplaced_block(self):
+        blockchain = self.create_blockchain()
+        blocks = self.mine_blocks(blockchain, ['a.pdf', 'b.pdf'])
+        self.assertFalse(blockchain.is_chain_segment_valid([blockchain.chain[0], blocks[1]], 0, 2))
+
+    def test_add_block_rejects_timestamp_before_previous_block(self):
+        blockchain = self.create_blockchain()
+        last_block = self.mine_blocks(blockchain, ['a.pdf'])[-1]
+
+        for timestamp in (last_block.timestamp, time.time() + 3600):
+            block = Block(2, last_block.hash, timestamp, [create_record('b.pdf')],
+                          difficulty=blockchain.consensus.get_difficulty(blockchain.chain, 2))
+            block.hash = blockchain.seal_block(block)
+            self.assertFalse(blockchain.add_block(block))
+        self.assertEqual(len(blockchain.chain), 2)
+
+    def test_replace_chain_refuses_invalid_chain(self):
+        blockchain = self.create_blockchain()
+        blocks = self.mine_blocks(blockchain, ['a.pdf', 'b.pdf'])
+        other_blockchain = self.reopen_blockchain()
+
+        # A chain missing a block is refused and the node keeps its own chain
+        self.assertFalse(other_blockchain.replace_chain([blockchain.chain[0], blocks[1]]))
+        self.assertFalse(other_blockchain.replace_chain([blockchain.chain[0], None]))
+        self.assertEqual(len(other_blockchain.chain), 3)
+        self.assertTrue(other_blockchain.replace_chain([blockchain.chain[0], blocks[0]]))
+        self.assertEqual(len(other_blockchain.chain), 2)
+        self.assertEqual(other_blockchain.record_index, {'a.pdf': 1})
+
+    def test_background_validation_removes_invalid_blocks(self):
+        blockchain = self.create_blockchain()
+        blocks = self.mine_blocks(blockchain, ['a.pdf', 'b.pdf', 'c.pdf'])
+        blockchain = self.reopen_blockchain()
+
+        # Every block from the corrupt block onwards is removed, its records can be mined again
+        store = chain_utils.get_chain_store()
+        block_dict = block_utils.get_block_dict_from_object(blocks[1])
+        block_dict['records'][0]['date_of_record'] = '02/01/2020'
+        read = store.read
+        with mock.patch.object(store, 'read', side_effect=lambda index: block_dict if index == 2 else read(index)):
+            blockchain.run_background_validation()
+
+        self.assertEqual(blockchain.background_validation, {'running': False, 'valid': False, 'checked': 2})
+        self.assertEqual(len(blockchain.chain), 2)
+        self.assertEqual(blockchain.last_block_on_chain().hash, blocks[0].hash)
+        self.assertEqual(blockchain.record_index, {'a.pdf': 1})
+        self.assertEqual(blockchain.chain_work, blockchain.get_chain_work(blockchain.chain.headers))
+        self.assertEqual(blockchain.validated_index, 1)
+
+        blockchain.record_pool.add_record(create_record('b.pdf'))
+        self.assertEqual(blockchain.mine().index, 2)
+        self.assertTrue(blockchain.is_chain_valid())
+
+    def test_record_without_file_hash_or_file_rejected(self):
+        # Without a file hash the node hashes the record's file itself, which it doesn't have
+        record_dict = {'aircraft_reg_number': 'G-ABCD', 'date_of_record': '01/01/2020', 'filename': 'a.pdf'}
+        self.assertIsNone(block_utils.get_record_object_from_dict(record_dict, stored=False))
+        self.assertIsNone(block_utils.get_record_object_from_dict(record_dict, stored=True))
+
+
+class ChainSyncTests(ChainTestCase):
+
+    def test_block_locator(self):
+        blockchain = self.create_blockchain()
+        self.mine_blocks(blockchain, [f"{index}.pdf" for index in range(15)])
+
+        # Ten most recent blocks, then gaps doubling back to the genesis block
+        locator = blockchain.get_block_locator()
+        self.assertEqual([index for index, _ in locator], list(range(15, 5, -1)) + [4, 0])
+        self.assertEqual([block_hash for _, block_hash in locator],
+                         [blockchain.chain.headers[index].hash for index, _ in locator])
+
+    def test_find_common_ancestor(self):
+        blockchain = self.create_blockchain()
+        self.mine_blocks(blockchain, ['a.pdf', 'b.pdf', 'c.pdf', 'd.pdf'])
+        fork = self.mine_fork(blockchain, 2, ['e.pdf', 'f.pdf', 'g.pdf'])
+
+        # Peer's locator lists its fork's blocks, then the blocks it shares with the node
+        shared_locator = [entry for entry in blockchain.get_block_locator() if entry[0] <= 2]
+        fork_locator = [(block.index, block.hash) for block in reversed(fork)]
+        self.assertEqual(blockchain.find_common_ancestor(fork_locator + shared_locator), 2)
+
+        # A peer further along the same chain shares every block of the node's chain
+        self.assertEqual(blockchain.find_common_ancestor([(6, bytes(32))] + blockchain.get_block_locator()), 4)
+
+        # A peer with another genesis block shares nothing
+        self.assertEqual(blockchain.find_common_ancestor([(index, bytes(32)) for index in range(5, -1, -1)]), -1)
+
+    def test_blocks_shared_past_locator_gap_not_rolled_back(self):
+        blockchain = self.create_blockchain()
+        self.mine_blocks(blockchain, [f"{index}.pdf" for index in range(11)])
+        fork = self.mine_fork(blockchain, 9, [f"fork_{index}.pdf" for index in range(10)])
+
+        # Peer's locator skips from index 10 to 8, so block 9 is shared but not found as the ancestor
+        peer = SimpleNamespace(chain=SimpleNamespace(headers=blockchain.chain.headers[:10] + fork))
+        ancestor_index = blockchain.find_common_ancestor(Blockchain.get_block_locator(peer))
+        self.assertEqual(ancestor_index, 8)
+
+        with mock.patch.object(chain_utils, 'truncate_chain', wraps=chain_utils.truncate_chain) as truncate_chain:
+            self.assertTrue(blockchain.sync_chain(ancestor_index, [blockchain.chain[9]] + fork))
+        truncate_chain.assert_called_once_with(10)
+        self.assertEqual([header.hash for header in blockchain.chain.headers[10:]], [block.hash for block in fork])
+
+        # Blocks the node already has are nothing to adopt
+        self.assertFalse(blockchain.sync_chain(8, [blockchain.chain[9]]))
+
+    def test_fork_without_more_work_not_adopted(self):
+        blockchain = self.create_blockchain()
+        blocks = self.mine_blocks(blockchain, ['a.pdf', 'b.pdf', 'c.pdf', 'd.pdf'])
+
+        # Forks as long as or shorter than the orphaned blocks have no more work at a fixed difficulty
+        for num_blocks in (1, 2):
+            fork = self.mine_fork(blockchain, 2, [f"fork_{index}.pdf" for index in range(num_blocks)])
+            self.assertFalse(blockchain.sync_chain(2, fork))
+            self.assertEqual(blockchain.last_block_on_chain().hash, blocks[-1].hash)
+        self.assertEqual(blockchain.chain_work, blockchain.get_chain_work(blockchain.chain.headers))
+
+    def test_fork_with_more_work_adopted(self):
+        blockchain = self.create_blockchain()
+        self.mine_blocks(blockchain, ['a.pdf', 'b.pdf', 'c.pdf', 'd.pdf'])
+        fork = self.mine_fork(blockchain, 2, ['e.pdf', 'c.pdf', 'f.pdf'])
+        self.assertEqual(blockchain.get_fork_work(2, fork), blockchain.chain_work + blockchain.get_chain_work(fork[:1]))
+
+        self.assertTrue(blockchain.sync_chain(2, fork))
+        self.assertEqual(len(blockchain.chain), 6)
+        self.assertEqual(blockchain.last_block_on_chain().hash, fork[-1].hash)
+        self.assertEqual(blockchain.chain_work, blockchain.get_chain_work(blockchain.chain.headers))
+        self.assertEqual(blockchain.record_index, {'a.pdf': 1, 'b.pdf': 2, 'e.pdf': 3, 'c.pdf': 4, 'f.pdf': 5})
+
+        # Only records that were in orphaned blocks and aren't on the fork go back to the record pool
+        self.assertEqual([record.filename for record in blockchain.record_pool.unverified_records], ['d.pdf'])
+
+        blockchain = self.reopen_blockchain()
+        self.assertEqual(blockchain.last_block_on_chain().hash, fork[-1].hash)
+        self.assertTrue(blockchain.is_chain_valid())
+
+    def test_chain_from_other_genesis_block_refused(self):
+        blockchain = self.create_blockchain()
+        genesis_block = blockchain.chain[0]
+        fork = self.mine_fork(blockchain, 0, ['a.pdf', 'b.pdf'])
+
+        other_genesis_block = Block(0, bytes(32), 1.0, [], difficulty=genesis_block.difficulty)
+        other_genesis_block.hash = other_genesis_block.get_block_hash()
+        self.assertFalse(blockchain.sync_chain(-1, [other_genesis_block] + fork))
+        self.assertFalse(blockchain.sync_chain(-1, fork))
+        self.assertEqual(len(blockchain.chain), 1)
+
+        # A peer sharing no block from its locator is adopted if its chain starts from the same genesis block
+        self.assertTrue(blockchain.sync_chain(-1, [genesis_block] + fork))
+        self.assertEqual(blockchain.last_block_on_chain().hash, fork[-1].hash)
+
+
+class MiningTests(ChainTestCase):
+
+    def test_peer_block_cancels_mining(self):
+        blockchain = self.create_blockchain()
+        peer_block = self.mine_fork(blockchain, 0, ['peer.pdf'])[0]
+        blockchain.record_pool.add_record(create_record('a.pdf'))
+        seal_block = blockchain.seal_block
+        sessions = []
+
+        def add_peer_block_whilst_sealing(block, session=None):
+            # The peer's block for the same index arrives before the node's block is solved
+            if not sessions:
+                self.assertTrue(blockchain.add_block(peer_block))
+                self.assertTrue(session.cancelled)
+            sessions.append(session)
+            return seal_block(block, session)
+
+        with mock.patch.object(blockchain, 'seal_block', side_effect=add_peer_block_whilst_sealing):
+            new_block = blockchain.mine()
+
+        # Mining restarts on the end of the chain with a new session
+        self.assertEqual(len(sessions), 2)
+        self.assertFalse(sessions[1].cancelled)
+        self.assertIsNone(blockchain.mining_session)
+        self.assertEqual(new_block.previous_hash, peer_block.hash)
+        self.assertEqual([header.hash for header in blockchain.chain.headers[1:]], [peer_block.hash, new_block.hash])
+
+
+class ChainStoreTruncateTests(ChainTestCase):
+    """
+    Orphaned blocks are removed from the end of the stored chain, checked against each store
+    """
+    chain_store_backend = 'log'
+
+    def setUp(self):
+        super().setUp()
+        # Tiered stores archive all but the two most recent blocks
+        patches = [mock.patch.object(chain_utils, 'chain_store_backend', self.chain_store_backend),
+                   mock.patch.object(chain_utils, 'archive_depth', 2),
+                   mock.patch.object(chain_utils, 'archive_segment_size', 2)]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def test_roll_back_chain(self):
+        blockchain = self.create_blockchain()
+        blocks = self.mine_blocks(blockchain, ['a.pdf', 'b.pdf', 'c.pdf', 'd.pdf', 'e.pdf', 'f.pdf'])
+
+        blockchain.roll_back_chain(3)
+        self.assertEqual(len(blockchain.chain), 3)
+        self.assertEqual(blockchain.record_index, {'a.pdf': 1, 'b.pdf': 2})
+        self.assertEqual(blockchain.chain_work, blockchain.get_chain_work(blockchain.chain.headers))
+
+        blockchain = self.reopen_blockchain()
+        store = chain_utils.get_chain_store()
+        self.assertEqual(len(store), 3)
+        self.assertEqual([header.hash for header in blockchain.chain.headers[1:]], [block.hash for block in blocks[:2]])
+        self.assertEqual(store.find_block_index('b.pdf'), 2)
+        self.assertIsNone(store.find_block_index('c.pdf'))
+
+        # Records in removed blocks can be mined again on the end of the shorter chain
+        self.assertEqual(self.mine_blocks(blockchain, ['c.pdf'])[0].index, 3)
+        self.assertTrue(self.reopen_blockchain().is_chain_valid())
+
+    def test_reorganise(self):
+        blockchain = self.create_blockchain()
+        self.mine_blocks(blockchain, ['a.pdf', 'b.pdf', 'c.pdf', 'd.pdf', 'e.pdf'])
+        fork = self.mine_fork(blockchain, 1, ['f.pdf', 'g.pdf', 'h.pdf', 'i.pdf', 'j.pdf'])
+        self.assertTrue(blockchain.sync_chain(1, fork))
+
+        blockchain = self.reopen_blockchain()
+        self.assertEqual([header.hash for header in blockchain.chain.headers[2:]], [block.hash for block in fork])
+        self.assertEqual(blockchain.record_index, {'a.pdf': 1, 'f.pdf': 2, 'g.pdf': 3, 'h.pdf': 4, 'i.pdf': 5,
+                                                   'j.pdf': 6})
+        self.assertTrue(blockchain.is_chain_valid())
+
+
+class SqliteChainStoreTruncateTests(ChainStoreTruncateTests):
+    chain_store_backend = 'sqlite'
+
+
+class BinaryChainStoreTruncateTests(ChainStoreTruncateTests):
+    chain_store_backend = 'binary'
+
+
+class TieredChainStoreTruncateTests(ChainStoreTruncateTests):
+    chain_store_backend = 'tiered'
+
+
+class LazyChainTests(ChainTestCase):
+
+    def test_headers_loaded_without_records(self):
+        blockchain = self.create_blockchain()
+        blocks = self.mine_blocks(blockchain, ['a.pdf', 'b.pdf'])
+
+        blockchain = self.reopen_blockchain()
+        self.assertEqual([header.hash for header in blockchain.chain.headers[1:]], [block.hash for block in blocks])
+        self.assertIsNone(blockchain.chain.headers[1].records)
+        self.assertEqual(blockchain.last_block_on_chain().hash, blocks[-1].hash)
+        self.assertEqual(blockchain.record_index, {'a.pdf': 1, 'b.pdf': 2})
+
+    @mock.patch.object(Blockchain, 'start_background_validation')
+    def test_chain_loaded_from_snapshot_and_checkpoint(self, start_background_validation):
+        blockchain = self.create_blockchain()
+        self.mine_blocks(blockchain, ['a.pdf', 'b.pdf', 'c.pdf'])
+        blockchain.write_snapshot()
+        blocks = self.mine_blocks(blockchain, ['d.pdf', 'e.pdf'])
+        headers = [header.hash for header in blockchain.chain.headers]
+
+        # Headers up to the snapshot come from the snapshot, blocks up to the checkpoint aren't checked again
+        with mock.patch.object(Blockchain, 'is_chain_segment_valid', autospec=True) as is_chain_segment_valid:
+            blockchain = self.reopen_blockchain()
+        self.assertEqual(blockchain.chain.snapshot_length, 4)
+        self.assertEqual([header.hash for header in blockchain.chain.headers], headers)
+        self.assertEqual(blockchain.record_index, {'a.pdf': 1, 'b.pdf': 2, 'c.pdf': 3, 'd.pdf': 4, 'e.pdf': 5})
+        self.assertEqual((blockchain.validated_index, blockchain.validated_hash), (5, blocks[-1].hash))
+        is_chain_segment_valid.assert_not_called()
+        # Snapshot headers weren't hashed when loaded, so the whole chain is checked in the background
+        start_background_validation.assert_called_once_with()
+
+        # A checkpoint no longer on the chain is discarded and the chain checked from the genesis block
+        chain_utils.write_validation_checkpoint(5, bytes(32))
+        with mock.patch.object(Blockchain, 'is_chain_segment_valid', autospec=True,
+                               side_effect=Blockchain.is_chain_segment_valid) as is_chain_segment_valid:
+            blockchain = self.reopen_blockchain()
+        is_chain_segment_valid.assert_called_once_with(blockchain, blockchain.chain, 0, 6)
+        self.assertEqual((blockchain.validated_index, blockchain.validated_hash), (5, blocks[-1].hash))
+
+    def test_corrupt_block_raises(self):
+        blockchain = self.create_blockchain()
+        blocks = self.mine_blocks(blockchain, ['a.pdf', 'b.pdf'])
+        blockchain = self.reopen_blockchain()
+
+        # A stored block with changed records no longer hashes to its header's hash
+        block_dict = block_utils.get_block_dict_from_object(blocks[0])
+        block_dict['records'][0]['date_of_record'] = '02/01/2020'
+        with mock.patch.object(chain_utils.get_chain_store(), 'read', return_value=block_dict):
+            with self.assertRaises(CorruptBlockError):
+                blockchain.chain[1]
+            self.assertFalse(blockchain.is_chain_valid())
+            with self.assertRaises(CorruptBlockError):
+                blockchain.get_record_proof('a.pdf')
+
+            # Only the header is needed to mine on the end of the chain
+            self.assertEqual(blockchain.last_block_on_chain().hash, blocks[-1].hash)
+
+
+class BlockDecodingTests(ChainTestCase):
+
+    def test_block_round_trip(self):
+        block = self.mine_blocks(self.create_blockchain(), ['a.pdf'])[0]
+        block_dict = block_utils.get_block_dict_from_object(block)
+        self.assertEqual(block_utils.get_block_object_from_dict(block_dict).hash, block.hash)
+
+    def test_malformed_blocks_rejected(self):
+        block = self.mine_blocks(self.create_blockchain(), ['a.pdf'])[0]
+        changes = [{'difficulty': 256}, {'difficulty': -1}, {'difficulty': '16'}, {'index': True},
+                   {'nonce': 2 ** 64}, {'timestamp': float('nan')}, {'timestamp': '0'}, {'hash': 'xyz'},
+                   {'previous_hash': '0' * 65}, {'previous_hash': None}, {'signer': 'ab'}, {'records': {}},
+                   {'records': [{'filename': 'a.pdf'}]},
+                   {'records': [{'aircraft_reg_number': 'G-ABCD', 'date_of_record': '01/01/2020',
+                                 'filename': 'a.pdf'}]},
+                   {'records': [{'aircraft_reg_number': 'G-ABCD', 'date_of_record': '01/01/2020',
+                                 'filename': 'a.pdf', 'file_hash': 'xyz'}]}]
+        for change in changes:
+            block_dict = dict(block_utils.get_block_dict_from_object(block), **change)
+            self.assertIsNone(block_utils.get_block_object_from_dict(block_dict), change)
+
+
+if __name__ == '__main__':
+    unittest.main()
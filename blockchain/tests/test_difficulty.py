@@ -0,0 +1,75 @@
+import time
+import unittest
+from unittest import mock
+
+from blockchain import difficulty
+from blockchain.block import Block
+
+
+def create_chain(block_times, block_difficulty=16):
+    """
+    :param block_times:         Seconds between each block and the one before it
+    :param block_difficulty:    Difficulty of every block
+    :return:                    Chain of unsealed blocks, only the timestamps and difficulties
+                                are used for retargeting
+    """
+    chain = [Block(0, bytes(32), 0.0, [], difficulty=block_difficulty)]
+    for block_time in block_times:
+        chain.append(Block(len(chain), bytes(32), chain[-1].timestamp + block_time, [],
+                           difficulty=block_difficulty))
+    return chain
+
+
+@mock.patch.object(difficulty, 'retarget_interval', 10)
+@mock.patch.object(difficulty, 'target_block_interval', 10.0)
+class DifficultyTests(unittest.TestCase):
+
+    def test_initial_difficulty(self):
+        self.assertEqual(difficulty.get_expected_difficulty([], 0), difficulty.initial_difficulty)
+        self.assertEqual(difficulty.get_expected_difficulty(create_chain([10]), 1), difficulty.initial_difficulty)
+
+    def test_difficulty_kept_between_retargets(self):
+        chain = create_chain([1] * 14)
+        self.assertEqual(difficulty.get_expected_difficulty(chain, 15), 16)
+
+    def test_retarget_on_target(self):
+        chain = create_chain([10] * 19)
+        self.assertEqual(difficulty.get_expected_difficulty(chain, 20), 16)
+
+    def test_retarget_up_when_blocks_are_fast(self):
+        # Blocks mined four times too fast need four times the work
+        chain = create_chain([2.5] * 19)
+        self.assertEqual(difficulty.get_expected_difficulty(chain, 20), 18)
+
+    def test_retarget_down_when_blocks_are_slow(self):
+        chain = create_chain([20] * 19)
+        self.assertEqual(difficulty.get_expected_difficulty(chain, 20), 15)
+
+    def test_retarget_is_clamped(self):
+        fast_chain, slow_chain = create_chain([0.01] * 19), create_chain([1000] * 19)
+        self.assertEqual(difficulty.get_expected_difficulty(fast_chain, 20), 16 + difficulty.max_adjustment)
+        self.assertEqual(difficulty.get_expected_difficulty(slow_chain, 20), 16 - difficulty.max_adjustment)
+        self.assertEqual(difficulty.get_expected_difficulty(create_chain([1000] * 19, 1), 20), difficulty.min_difficulty)
+
+    def test_target(self):
+        self.assertTrue(difficulty.is_hash_below_target(bytes([0x0f]) + bytes(31), 4))
+        self.assertFalse(difficulty.is_hash_below_target(bytes([0x10]) + bytes(31), 4))
+
+    def test_timestamp_must_follow_previous_block(self):
+        now = time.time()
+        self.assertTrue(difficulty.is_timestamp_valid(now, now - 1))
+        self.assertFalse(difficulty.is_timestamp_valid(now, now))
+        self.assertFalse(difficulty.is_timestamp_valid(now - 1, now))
+
+    def test_timestamp_not_far_in_future(self):
+        now = time.time()
+        self.assertTrue(difficulty.is_timestamp_valid(now + difficulty.max_future_block_time / 2, now))
+        self.assertFalse(difficulty.is_timestamp_valid(now + difficulty.max_future_block_time + 60, now))
+
+    def test_next_timestamp_follows_previous_block(self):
+        future_timestamp = time.time() + 30
+        self.assertGreater(difficulty.get_next_timestamp(future_timestamp), future_timestamp)
+
+
+if __name__ == '__main__':
+    unittest.main()
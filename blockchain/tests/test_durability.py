@@ -0,0 +1,75 @@
+import os
+import tempfile
+import threading
+import unittest
+
+from blockchain.durability import GroupCommit, replace_file
+
+
+class GroupCommitTests(unittest.TestCase):
+
+    def test_writes_share_one_sync(self):
+        syncs = []
+        group_commit = GroupCommit(lambda: syncs.append(group_commit.written), window=0.05)
+
+        # Writes made before the first sync starts are made durable by it
+        sequences = [group_commit.add_write() for _ in range(5)]
+        threads = [threading.Thread(target=group_commit.wait, args=(sequence,)) for sequence in sequences]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(syncs, [5])
+        self.assertEqual(group_commit.synced, 5)
+
+    def test_durable_write_not_synced_again(self):
+        syncs = []
+        group_commit = GroupCommit(lambda: syncs.append(None), window=0)
+        sequence = group_commit.add_write()
+        group_commit.wait(sequence)
+        group_commit.wait(sequence)
+        self.assertEqual(len(syncs), 1)
+
+        # A later write needs a sync of its own
+        group_commit.wait(group_commit.add_write())
+        self.assertEqual(len(syncs), 2)
+
+    def test_failed_sync_is_retried(self):
+        failures = [OSError("Disk full")]
+
+        def sync():
+            if failures:
+                raise failures.pop()
+
+        group_commit = GroupCommit(sync, window=0)
+        sequence = group_commit.add_write()
+        with self.assertRaises(OSError):
+            group_commit.wait(sequence)
+        self.assertEqual(group_commit.synced, 0)
+        self.assertFalse(group_commit.syncing)
+
+        # The write isn't durable until a sync succeeds
+        group_commit.wait(sequence)
+        self.assertEqual(group_commit.synced, 1)
+
+
+class ReplaceFileTests(unittest.TestCase):
+
+    def test_replace_file(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, "index")
+        temp_path = path + ".tmp"
+        for contents in (b'old', b'new'):
+            with open(temp_path, 'wb') as temp_file:
+                temp_file.write(contents)
+            replace_file(temp_path, path)
+
+        with open(path, 'rb') as replaced_file:
+            self.assertEqual(replaced_file.read(), b'new')
+        self.assertFalse(os.path.exists(temp_path))
+
+
+if __name__ == '__main__':
+    unittest.main()
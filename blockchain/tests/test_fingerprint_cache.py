@@ -0,0 +1,73 @@
+import hashlib
+import os
+import tempfile
+import unittest
+
+from blockchain.fingerprint_cache import FingerprintCache
+
+
+class FingerprintCacheTests(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        self.cache_path = os.path.join(self.directory, "fingerprints.json")
+
+    def write_file(self, filename, data, mtime_ns=None):
+        """
+        :param filename:    Name of the file in the test directory
+        :param data:        Contents of the file in bytes
+        :param mtime_ns:    Modification time of the file in nanoseconds, left as written when not provided
+        :return:            Path to the file
+        """
+        file_path = os.path.join(self.directory, filename)
+        with open(file_path, 'wb') as file:
+            file.write(data)
+        if mtime_ns is not None:
+            os.utime(file_path, ns=(mtime_ns, mtime_ns))
+        return file_path
+
+    def test_unchanged_file_not_hashed_again(self):
+        cache = FingerprintCache(self.cache_path)
+        file_path = self.write_file('a.pdf', b'record')
+
+        self.assertEqual(cache.get_sha256(file_path), hashlib.sha256(b'record').hexdigest())
+        self.assertEqual(cache.get_md5(file_path), hashlib.md5(b'record').hexdigest())
+        self.assertEqual(cache.get_stats(), {'entries': 1, 'hits': 1, 'misses': 1})
+
+    def test_changed_file_hashed_again(self):
+        cache = FingerprintCache(self.cache_path)
+        file_path = self.write_file('a.pdf', b'record', mtime_ns=10 ** 18)
+        cache.get_sha256(file_path)
+
+        # The same size with a new modification time, then a new size with the old modification time
+        self.write_file('a.pdf', b'RECORD', mtime_ns=10 ** 18 + 1)
+        self.assertEqual(cache.get_sha256(file_path), hashlib.sha256(b'RECORD').hexdigest())
+        self.write_file('a.pdf', b'new record', mtime_ns=10 ** 18 + 1)
+        self.assertEqual(cache.get_sha256(file_path), hashlib.sha256(b'new record').hexdigest())
+        self.assertEqual(cache.get_stats(), {'entries': 1, 'hits': 0, 'misses': 3})
+
+    def test_least_recently_used_evicted(self):
+        cache = FingerprintCache(self.cache_path, max_entries=2)
+        file_paths = [self.write_file(f"{name}.pdf", name.encode()) for name in ('a', 'b', 'c')]
+
+        cache.get_sha256(file_paths[0])
+        cache.get_sha256(file_paths[1])
+        # Using 'a' again leaves 'b' as the least recently used
+        cache.get_sha256(file_paths[0])
+        cache.get_sha256(file_paths[2])
+        self.assertEqual(list(cache.entries), [file_paths[0], file_paths[2]])
+
+    def test_saved_across_restarts(self):
+        cache = FingerprintCache(self.cache_path, save_interval=1)
+        file_path = self.write_file('a.pdf', b'record')
+        cache.get_sha256(file_path)
+
+        cache = FingerprintCache(self.cache_path)
+        cache.get_sha256(file_path)
+        self.assertEqual(cache.get_stats(), {'entries': 1, 'hits': 1, 'misses': 0})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+import threading
+import unittest
+from unittest import mock
+
+from blockchain.gossip import Gossip
+
+
+class GossipTests(unittest.TestCase):
+
+    def setUp(self):
+        self.gossip = Gossip()
+        self.addCleanup(self.gossip.close)
+
+    def test_message_seen_once_marked(self):
+        # A message is only seen once it is marked, e.g. after the block in it was added
+        self.assertFalse(self.gossip.has_seen('block:a'))
+        self.assertFalse(self.gossip.has_seen('block:a'))
+        self.assertTrue(self.gossip.mark_seen('block:a'))
+        self.assertTrue(self.gossip.has_seen('block:a'))
+        self.assertFalse(self.gossip.mark_seen('block:a'))
+
+    @mock.patch.object(Gossip, 'max_seen', 2)
+    def test_oldest_seen_message_forgotten(self):
+        for message_id in ('a', 'b'):
+            self.gossip.mark_seen(message_id)
+        # Seeing a message again keeps it from being forgotten
+        self.gossip.has_seen('a')
+        self.gossip.mark_seen('c')
+        self.assertEqual(list(self.gossip.seen), ['a', 'c'])
+
+    @mock.patch.object(Gossip, 'fan_out', 2)
+    def test_peers_chosen_without_sender(self):
+        peers = ['a', 'b', 'c', 'd']
+        for _ in range(20):
+            chosen_peers = self.gossip.choose_peers(peers, sender='a')
+            self.assertEqual(len(chosen_peers), 2)
+            self.assertNotIn('a', chosen_peers)
+        self.assertEqual(self.gossip.choose_peers(['a', 'b'], sender='a'), ['b'])
+
+    @mock.patch.object(Gossip, 'relay_workers', 1)
+    @mock.patch.object(Gossip, 'max_pending_relays', 2)
+    def test_relays_bounded(self):
+        gossip = Gossip()
+        self.addCleanup(gossip.close)
+        release = threading.Event()
+        self.addCleanup(release.set)
+        relayed = []
+
+        def relay(ttl):
+            release.wait()
+            relayed.append(ttl)
+
+        # Messages are dropped once too many are waiting, rather than starting a thread each
+        self.assertTrue(gossip.relay(relay, 5))
+        self.assertTrue(gossip.relay(relay, 4))
+        self.assertFalse(gossip.relay(relay, 3))
+
+        release.set()
+        gossip.relay_executor.shutdown(wait=True)
+        self.assertEqual(relayed, [5, 4])
+        self.assertFalse(gossip.relay(relay, 2))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,164 @@
+import unittest
+from unittest import mock
+
+from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PrivateKey
+
+from blockchain import block_utils, consensus, difficulty, merkle_utils
+from blockchain.block import Block
+from blockchain.maintenance_record import MaintenanceRecord
+
+
+def create_records(num_records):
+    """
+    :param num_records: Number of records to create
+    :return:            List of records with made up file hashes, no record files are needed
+    """
+    return [MaintenanceRecord(str(i), '01/01/2020', f"record_{i}.pdf", False, bytes([i]) * 32)
+            for i in range(num_records)]
+
+
+def mine_test_block(records, block_difficulty=4):
+    """
+    Mines a block at a low difficulty in this process
+    :param records:             Records in the block
+    :param block_difficulty:    Number of leading zero bits required in the block hash
+    :return:                    Sealed block
+    """
+    block = Block(1, bytes(32), 1577836800.0, records, difficulty=block_difficulty)
+    while not difficulty.is_hash_below_target(block.get_block_hash(), block_difficulty):
+        block.nonce += 1
+    block.hash = block.get_block_hash()
+    return block
+
+
+def get_trusted_headers(block):
+    """
+    :param block:   Block with index one
+    :return:        Headers of a chain holding the block, as a client would hold them
+    """
+    genesis_block = Block(0, bytes(32), 0.0, [])
+    genesis_block.hash = genesis_block.get_block_hash()
+    return [genesis_block, block_utils.get_header_object_from_block(block)]
+
+
+class MerkleTests(unittest.TestCase):
+
+    def test_proof_round_trip(self):
+        # Odd sized levels promote a node without a sibling, so every tree size up to nine is checked
+        for num_leaves in range(1, 10):
+            leaf_hashes = [merkle_utils.get_record_leaf_hash(record) for record in create_records(num_leaves)]
+            merkle_root = merkle_utils.get_merkle_root(leaf_hashes)
+            for leaf_index, leaf_hash in enumerate(leaf_hashes):
+                proof = merkle_utils.get_merkle_proof(leaf_hashes, leaf_index)
+                self.assertTrue(merkle_utils.is_merkle_proof_valid(leaf_hash, proof, merkle_root))
+
+    def test_proof_rejects_other_leaf(self):
+        leaf_hashes = [merkle_utils.get_record_leaf_hash(record) for record in create_records(5)]
+        merkle_root = merkle_utils.get_merkle_root(leaf_hashes)
+        proof = merkle_utils.get_merkle_proof(leaf_hashes, 2)
+        self.assertFalse(merkle_utils.is_merkle_proof_valid(leaf_hashes[3], proof, merkle_root))
+
+    def test_proof_rejects_swapped_sibling(self):
+        leaf_hashes = [merkle_utils.get_record_leaf_hash(record) for record in create_records(4)]
+        merkle_root = merkle_utils.get_merkle_root(leaf_hashes)
+        proof = merkle_utils.get_merkle_proof(leaf_hashes, 0)
+        proof[0]['position'] = 'left'
+        self.assertFalse(merkle_utils.is_merkle_proof_valid(leaf_hashes[0], proof, merkle_root))
+
+    def test_block_merkle_root_matches_tree(self):
+        records = create_records(3)
+        leaf_hashes = [merkle_utils.get_record_leaf_hash(record) for record in records]
+        self.assertEqual(Block(1, bytes(32), 0.0, records).get_merkle_root(), merkle_utils.get_merkle_root(leaf_hashes))
+
+    def test_record_proof_from_header(self):
+        records = create_records(6)
+        block = mine_test_block(records)
+        header_dict = block_utils.get_header_dict_from_object(block)
+        headers = get_trusted_headers(block)
+        leaf_hashes = [merkle_utils.get_record_leaf_hash(record) for record in records]
+
+        for leaf_index, record in enumerate(records):
+            proof = merkle_utils.get_proof_dict(merkle_utils.get_merkle_proof(leaf_hashes, leaf_index))
+            self.assertTrue(block_utils.is_record_proof_valid(header_dict, record.get_record_data(), proof, headers))
+
+        # A changed record no longer leads to the root committed in the header
+        record_dict = records[0].get_record_data()
+        record_dict['date_of_record'] = '02/01/2020'
+        proof = merkle_utils.get_proof_dict(merkle_utils.get_merkle_proof(leaf_hashes, 0))
+        self.assertFalse(block_utils.is_record_proof_valid(header_dict, record_dict, proof, headers))
+
+    def test_record_proof_rejects_changed_header(self):
+        records = create_records(2)
+        block = mine_test_block(records)
+        headers = get_trusted_headers(block)
+        leaf_hashes = [merkle_utils.get_record_leaf_hash(record) for record in records]
+        proof = merkle_utils.get_proof_dict(merkle_utils.get_merkle_proof(leaf_hashes, 0))
+
+        # A Merkle root not committed to by the block hash is rejected
+        other_leaf_hashes = [merkle_utils.get_record_leaf_hash(record) for record in create_records(3)]
+        header_dict = block_utils.get_header_dict_from_object(block)
+        header_dict['merkle_root'] = merkle_utils.get_merkle_root(other_leaf_hashes).hex()
+        other_proof = merkle_utils.get_proof_dict(merkle_utils.get_merkle_proof(other_leaf_hashes, 0))
+        self.assertFalse(block_utils.is_record_proof_valid(header_dict, records[0].get_record_data(), other_proof,
+                                                           headers))
+
+        header_dict = block_utils.get_header_dict_from_object(block)
+        self.assertTrue(block_utils.is_record_proof_valid(header_dict, records[0].get_record_data(), proof, headers))
+
+    def test_record_proof_rejects_low_difficulty_header(self):
+        # Any hash meets a difficulty of zero, so the header carries no proof of work
+        records = create_records(2)
+        block = Block(1, bytes(32), 1577836800.0, records, difficulty=0)
+        block.hash = block.get_block_hash()
+        leaf_hashes = [merkle_utils.get_record_leaf_hash(record) for record in records]
+        proof = merkle_utils.get_proof_dict(merkle_utils.get_merkle_proof(leaf_hashes, 0))
+        header_dict = block_utils.get_header_dict_from_object(block)
+        self.assertFalse(block_utils.is_record_proof_valid(header_dict, records[0].get_record_data(), proof,
+                                                           get_trusted_headers(block)))
+
+    def test_record_proof_rejects_header_not_on_trusted_chain(self):
+        # A header sealed at the lowest difficulty it may claim takes a few tries to forge
+        records = create_records(2)
+        block = mine_test_block(records, difficulty.min_difficulty)
+        leaf_hashes = [merkle_utils.get_record_leaf_hash(record) for record in records]
+        proof = merkle_utils.get_proof_dict(merkle_utils.get_merkle_proof(leaf_hashes, 0))
+        header_dict = block_utils.get_header_dict_from_object(block)
+        self.assertTrue(consensus.is_header_sealed(block_utils.get_header_object_from_dict(header_dict)))
+
+        trusted_block = mine_test_block(create_records(3))
+        for headers in (get_trusted_headers(trusted_block), get_trusted_headers(trusted_block)[:1]):
+            self.assertFalse(block_utils.is_record_proof_valid(header_dict, records[0].get_record_data(), proof,
+                                                               headers))
+
+    @mock.patch.object(consensus, 'consensus_algorithm', 'poa')
+    def test_record_proof_checks_authority_signature(self):
+        authority = consensus.ProofOfAuthority(Ed25519PrivateKey.generate(), set())
+        other_node = consensus.ProofOfAuthority(Ed25519PrivateKey.generate(), set())
+        authority.authorities = {authority.node_id}
+        other_node.authorities = {other_node.node_id}
+
+        records = create_records(3)
+        leaf_hashes = [merkle_utils.get_record_leaf_hash(record) for record in records]
+        proof = merkle_utils.get_proof_dict(merkle_utils.get_merkle_proof(leaf_hashes, 1))
+        record_dict = records[1].get_record_data()
+
+        block = Block(1, bytes(32), 1577836800.0, records)
+        block.hash = authority.seal(block)
+        header_dict = block_utils.get_header_dict_from_object(block)
+        headers = get_trusted_headers(block)
+        self.assertTrue(block_utils.is_record_proof_valid(header_dict, record_dict, proof, headers,
+                                                          authority.authorities))
+
+        # Headers that are unsigned or signed by a node that isn't an authority are rejected
+        unsigned_header_dict = dict(header_dict, signer=None, signature=None)
+        self.assertFalse(block_utils.is_record_proof_valid(unsigned_header_dict, record_dict, proof, headers,
+                                                           authority.authorities))
+
+        block = Block(1, bytes(32), 1577836800.0, records)
+        block.hash = other_node.seal(block)
+        header_dict = block_utils.get_header_dict_from_object(block)
+        self.assertFalse(block_utils.is_record_proof_valid(header_dict, record_dict, proof, get_trusted_headers(block),
+                                                           authority.authorities))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,41 @@
+import threading
+import unittest
+
+from blockchain import difficulty
+from blockchain.block import Block
+from blockchain.miner import Miner, MiningSession
+from blockchain.tests.test_merkle import create_records
+
+
+class MinerTests(unittest.TestCase):
+
+    def create_block(self, block_difficulty):
+        """
+        :param block_difficulty:    Number of leading zero bits required in the block hash
+        :return:                    Unsolved block, records are made up so no record files are needed
+        """
+        return Block(1, bytes(32), 1577836800.0, create_records(3), difficulty=block_difficulty)
+
+    def test_workers_solve_block(self):
+        # Each worker searches its own nonces, the solving worker's nonce is set on the block
+        for num_workers in (1, 3):
+            block = self.create_block(12)
+            block_hash = Miner(num_workers).solve(block)
+            self.assertEqual(block.get_block_hash(), block_hash)
+            self.assertTrue(difficulty.is_hash_below_target(block_hash, 12))
+
+    def test_cancelled_session_stops_workers(self):
+        # No worker finds a hash this far below the target before the session is cancelled
+        for num_workers in (1, 3):
+            block = self.create_block(255)
+            session = MiningSession(block)
+            timer = threading.Timer(0.2, session.cancel)
+            timer.start()
+            self.addCleanup(timer.cancel)
+
+            self.assertIsNone(Miner(num_workers).solve(block, session))
+            self.assertTrue(session.stop_event.is_set())
+
+
+if __name__ == '__main__':
+    unittest.main()
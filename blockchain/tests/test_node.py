@@ -0,0 +1,103 @@
+import atexit
+import json
+import unittest
+from unittest import mock
+
+import requests
+
+from blockchain import block_utils, transport
+from blockchain.tests.chain_test_utils import ChainTestCase, create_record
+
+
+class NodeTestCase(ChainTestCase):
+    """
+    Test case sending requests to a node through Flask's test client, the node's chain is
+    stored in the test's data directory
+    """
+
+    def setUp(self):
+        super().setUp()
+        # The node creates its chain when it is first imported
+        from blockchain.REST import node
+        atexit.unregister(node.blockchain.write_snapshot)
+
+        self.node = node
+        self.blockchain = self.create_blockchain()
+        patches = [mock.patch.object(node, 'blockchain', self.blockchain),
+                   mock.patch.object(node, 'peers', [])]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+        self.client = node.app.test_client()
+
+
+class RecordPoolTests(NodeTestCase):
+
+    def test_get_record_pool(self):
+        records = [create_record('a.pdf'), create_record('b.pdf', 'G-WXYZ')]
+        for record in records:
+            self.blockchain.record_pool.add_record(record)
+
+        response = self.client.get('/chain/record-pool')
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data)
+        self.assertEqual(data['length'], 2)
+        self.assertEqual(data['records'], [record.get_record_data() for record in records])
+
+    def test_sync_record_pool_skips_unreachable_peers(self):
+        peer_records = [create_record('a.pdf').get_record_data()]
+
+        def get(url, **kwargs):
+            if url.startswith('http://down'):
+                raise requests.ConnectionError("Connection refused")
+            response = requests.Response()
+            response.status_code = 200
+            response._content = json.dumps({'length': len(peer_records), 'records': peer_records}).encode()
+            return response
+
+        self.node.peers.extend(['down:5000', 'up:5000'])
+        with mock.patch.object(transport, 'get', side_effect=get):
+            response = self.client.get('/chain/sync/record-pool')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual([record.filename for record in self.blockchain.record_pool.unverified_records],
+                             ['a.pdf'])
+
+            # Only a sync where every peer fails is an error
+            self.node.peers.remove('up:5000')
+            self.assertEqual(self.client.get('/chain/sync/record-pool').status_code, 400)
+
+
+class RecordProofTests(NodeTestCase):
+
+    def test_record_proof_checkable_from_json(self):
+        self.mine_blocks(self.blockchain, ['a.pdf', 'b.pdf'])
+
+        # Hashes in the proof and header are sent in hex format and checked by a client with only the JSON
+        response = self.client.get('/chain/record-proof?filename=b.pdf')
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data)
+        self.assertTrue(block_utils.is_record_proof_valid(data['header'], data['record'], data['proof'],
+                                                          self.blockchain.chain.headers))
+        self.assertEqual(self.client.get('/chain/record-proof?filename=c.pdf').status_code, 404)
+
+
+class AddBlockTests(NodeTestCase):
+
+    def test_block_with_record_missing_file_hash_rejected(self):
+        block = self.mine_fork(self.blockchain, 0, ['a.pdf'])[0]
+        block_dict = block_utils.get_block_dict_from_object(block)
+        del block_dict['records'][0]['file_hash']
+
+        response = self.client.post('/chain/add-block', data=json.dumps(block_dict), content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(len(self.blockchain.chain), 1)
+
+        response = self.client.post('/chain/add-block', data=block_utils.get_block_encoding(block),
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(self.blockchain.chain), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+import unittest
+
+from blockchain.assembly_policy import BlockAssemblyPolicy
+from blockchain.record_pool import RecordPool
+from blockchain.tests.test_assembly_policy import create_record, get_filenames
+
+
+class RecordPoolTests(unittest.TestCase):
+
+    def setUp(self):
+        self.record_pool = RecordPool()
+
+    def test_add_record(self):
+        self.assertTrue(self.record_pool.add_record(create_record('a.pdf')))
+        self.assertTrue(self.record_pool.add_record(create_record('b.pdf')))
+        self.assertEqual(get_filenames(self.record_pool.unverified_records), ['a.pdf', 'b.pdf'])
+        self.assertEqual(self.record_pool.get_num_unverified_records(), 2)
+
+    def test_duplicate_record_not_added(self):
+        self.record_pool.add_record(create_record('a.pdf'))
+        # Records are deduplicated by filename
+        self.assertFalse(self.record_pool.add_record(create_record('a.pdf', 'G-WXYZ')))
+        self.assertEqual(self.record_pool.unverified_records[0].aircraft_reg_number, 'G-ABCD')
+
+    def test_removed_records_not_added_again(self):
+        records = [create_record('a.pdf'), create_record('b.pdf')]
+        for record in records:
+            self.record_pool.add_record(record)
+
+        # Verified records are removed and not accepted back into the pool
+        self.record_pool.remove_records(records[:1])
+        self.assertEqual(get_filenames(self.record_pool.unverified_records), ['b.pdf'])
+        self.assertFalse(self.record_pool.add_record(create_record('a.pdf')))
+
+        # Until the block they were verified in is removed from the chain
+        self.record_pool.mark_unverified(['a.pdf'])
+        self.assertTrue(self.record_pool.add_record(create_record('a.pdf')))
+
+    def test_orphaned_records_restored(self):
+        records = [create_record('a.pdf'), create_record('b.pdf')]
+        self.record_pool.add_record(records[1])
+        self.record_pool.mark_verified(['a.pdf'])
+
+        self.record_pool.restore_records(records)
+        self.assertEqual(get_filenames(self.record_pool.unverified_records), ['b.pdf', 'a.pdf'])
+
+    def test_unverified_records_selected_by_policy(self):
+        for filename in ('a.pdf', 'b.pdf', 'c.pdf'):
+            self.record_pool.add_record(create_record(filename))
+
+        records = self.record_pool.get_unverified_records(BlockAssemblyPolicy(max_records=2))
+        self.assertEqual(get_filenames(records), ['a.pdf', 'b.pdf'])
+        # Selecting records doesn't remove them from the pool
+        self.assertEqual(self.record_pool.get_num_unverified_records(), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
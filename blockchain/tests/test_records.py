@@ -37,11 +37,7 @@ class BasicTests(unittest.TestCase):
         response = requests.get("http://127.0.0.1:5000/record")
         self.assertEqual(response.json()['length'], 5)
 
-        requests.get("http://127.0.0.1:5000/mine")
-
-        response = requests.get("http://127.0.0.1:5000/record")
-        self.assertEqual(response.json()['length'], 2)
-
+        # All five records fit in a single block under the default assembly policy
         requests.get("http://127.0.0.1:5000/mine")
 
         response = requests.get("http://127.0.0.1:5000/record")
@@ -0,0 +1,97 @@
+import os
+import tempfile
+import unittest
+import warnings
+
+from blockchain.tests.test_block_log import create_block_dicts, encode_block_dict
+from blockchain.tiered_store import TieredChainStore
+
+
+class TieredStoreTests(unittest.TestCase):
+
+    def setUp(self):
+        # Stores keep their block log open for the life of the node
+        warnings.simplefilter('ignore', ResourceWarning)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.archive_path = directory.name
+
+    def open_store(self):
+        return TieredChainStore(self.archive_path, archive_depth=3, segment_size=2, commit_window=0)
+
+    def append_blocks(self, store, block_dicts):
+        for block_dict in block_dicts:
+            store.wait_for_commit(store.append(encode_block_dict(block_dict)))
+
+    def test_cold_blocks_archived(self):
+        store = self.open_store()
+        self.append_blocks(store, create_block_dicts(0, 8))
+
+        # Blocks deeper than the archive depth are compressed a whole segment at a time
+        self.assertEqual([segment[:2] for segment in store.segments], [(0, 2), (2, 4)])
+        self.assertEqual(len(store.hot_log), 4)
+        self.assertEqual(len(store), 8)
+        self.assertEqual(store.read_all(), create_block_dicts(0, 8))
+        self.assertEqual(store.read(1), create_block_dicts(1, 2)[0])
+        self.assertEqual([header['hash'] for header in store.read_headers(1)],
+                         [block_dict['hash'] for block_dict in create_block_dicts(1, 8)])
+        self.assertEqual(store.find_block_index('record_3.pdf'), 3)
+
+        store = self.open_store()
+        self.assertEqual(store.read_all(), create_block_dicts(0, 8))
+
+    def test_truncate_into_archive(self):
+        store = self.open_store()
+        self.append_blocks(store, create_block_dicts(0, 8))
+
+        store.truncate(4)
+        self.assertEqual([segment[:2] for segment in store.segments], [(0, 2)])
+        self.assertEqual(store.read_all(), create_block_dicts(0, 4))
+
+        store = self.open_store()
+        self.assertEqual(store.read_all(), create_block_dicts(0, 4))
+        self.append_blocks(store, create_block_dicts(4, 6))
+        self.assertEqual(store.read_all(), create_block_dicts(0, 6))
+
+    def test_recover_archived_blocks_left_in_log(self):
+        store = self.open_store()
+        self.append_blocks(store, create_block_dicts(0, 5))
+
+        # Crash after the segment is written but before the block log is shortened
+        store.write_segment(create_block_dicts(0, 2))
+        store = self.open_store()
+        self.assertEqual([segment[:2] for segment in store.segments], [(0, 2)])
+        self.assertEqual(store.hot_log.read(0)['index'], 2)
+        self.assertEqual(store.read_all(), create_block_dicts(0, 5))
+
+    def test_recover_interrupted_rewrite(self):
+        store = self.open_store()
+        self.append_blocks(store, create_block_dicts(0, 8))
+
+        # Crash after the new chain is written to the block log but before the old segments are removed
+        new_block_dicts = [dict(block_dict, hash=f"{block_dict['index'] + 100:064x}")
+                           for block_dict in create_block_dicts(0, 3)]
+        store.hot_log.rewrite([encode_block_dict(block_dict) for block_dict in new_block_dicts])
+        store = self.open_store()
+        self.assertEqual(store.segments, [])
+        self.assertEqual(store.read_all(), new_block_dicts)
+
+    def test_rewrite(self):
+        store = self.open_store()
+        self.append_blocks(store, create_block_dicts(0, 8))
+        store.rewrite([encode_block_dict(block_dict) for block_dict in create_block_dicts(0, 3)])
+        self.assertEqual(store.segments, [])
+        self.assertEqual(self.open_store().read_all(), create_block_dicts(0, 3))
+
+    def test_recover_rejects_gap(self):
+        store = self.open_store()
+        self.append_blocks(store, create_block_dicts(0, 8))
+
+        # Blocks missing between the archive and the block log can't be recovered
+        os.remove(store.segments[-1][2])
+        with self.assertRaises(ValueError):
+            self.open_store()
+
+
+if __name__ == '__main__':
+    unittest.main()
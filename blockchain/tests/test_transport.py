@@ -0,0 +1,62 @@
+import threading
+import unittest
+
+import requests
+
+from blockchain import transport
+
+
+def create_response(status_code):
+    """
+    :param status_code: HTTP status code of the response
+    :return:            Response as a peer would send it, without making a request
+    """
+    response = requests.Response()
+    response.status_code = status_code
+    return response
+
+
+class FanOutTests(unittest.TestCase):
+
+    def test_error_responses_fail(self):
+        status_codes = {'a': 200, 'b': 404, 'c': 500}
+        results, errors = transport.fan_out(list(status_codes), lambda peer: create_response(status_codes[peer]))
+        self.assertEqual(list(results), ['a'])
+        self.assertEqual(sorted(errors), ['b', 'c'])
+        self.assertIsInstance(errors['b'], requests.HTTPError)
+
+    def test_deadline_leaves_out_slow_peers(self):
+        release = threading.Event()
+        self.addCleanup(release.set)
+
+        def call(peer):
+            if peer == 'slow':
+                release.wait()
+            return peer
+
+        results, errors = transport.fan_out(['fast', 'slow'], call, deadline=0.2)
+        self.assertEqual(results, {'fast': 'fast'})
+        self.assertIsInstance(errors['slow'], TimeoutError)
+
+    def test_first_k_successes_returned(self):
+        release, failed = threading.Event(), threading.Event()
+        self.addCleanup(release.set)
+
+        def call(peer):
+            if peer == 'failing':
+                failed.set()
+                return create_response(500)
+            if peer == 'slow':
+                release.wait()
+            else:
+                failed.wait()
+            return peer
+
+        # A failed call doesn't count toward the successes waited for, the slow call is ignored
+        results, errors = transport.fan_out(['failing', 'fast', 'slow'], call, first_k=1)
+        self.assertEqual(results, {'fast': 'fast'})
+        self.assertEqual(list(errors), ['failing'])
+
+
+if __name__ == '__main__':
+    unittest.main()
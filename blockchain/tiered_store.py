@@ -0,0 +1,354 @@
+import collections
+import json
+import lzma
+import os
+import re
+import threading
+import zlib
+
+from blockchain.block_log import BlockLog
+from blockchain.durability import fsync_file, replace_file
+
+# File extension of an archive segment for each compression
+segment_extensions = {'zlib': '.zlib', 'lzma': '.xz'}
+
+# Segment files are named after the indexes of the first block and the block after the last
+segment_pattern = re.compile(r'^segment-(\d{12})-(\d{12})(\.zlib|\.xz)$')
+
+
+def compress_segment(data, compression):
+    """
+    :param data:        Uncompressed segment in bytes
+    :param compression: Either 'zlib' or 'lzma'
+    :return:            Compressed segment in bytes
+    """
+    if compression == 'lzma':
+        return lzma.compress(data)
+    return zlib.compress(data, 9)
+
+
+def decompress_segment(data, extension):
+    """
+    :param data:        Compressed segment in bytes
+    :param extension:   File extension of the segment, which gives its compression
+    :return:            Uncompressed segment in bytes
+    """
+    if extension == segment_extensions['lzma']:
+        return lzma.decompress(data)
+    return zlib.decompress(data)
+
+
+def encode_block_dict(block_dict):
+    """
+    :param block_dict:  Block in dictionary format
+    :return:            Canonical encoding of the block in bytes
+    """
+    return json.dumps(block_dict, sort_keys=True, separators=(',', ':')).encode()
+
+
+class TieredChainStore:
+    archive_path = None
+    archive_depth = None
+    segment_size = None
+    compression = None
+
+    def __init__(self, archive_path, archive_depth=1000, segment_size=100, compression='zlib', commit_window=0.005):
+        """
+        TieredChainStore class constructor, keeps recent blocks in a block log and compresses
+        blocks deeper than the archive depth into segments. Archived blocks are decompressed
+        when they are read, so callers can't tell which tier a block is in.
+        :param archive_path:    Path to the directory holding the block log and segments
+        :param archive_depth:   Number of blocks from the end of the chain kept uncompressed
+        :param segment_size:    Number of blocks compressed together in a segment
+        :param compression:     Compression used for new segments, either 'zlib' or 'lzma'
+        :param commit_window:   Seconds an fsync waits for more appended blocks to join it
+        """
+        if compression not in segment_extensions:
+            raise ValueError(f"Unknown compression '{compression}', expected one of {list(segment_extensions)}")
+
+        self.archive_path = archive_path
+        self.archive_depth = archive_depth
+        self.segment_size = segment_size
+        self.compression = compression
+        self.lock = threading.RLock()
+
+        # Only the most recently read segments are held decompressed
+        self.segment_cache = collections.OrderedDict()
+        self.segment_cache_size = 2
+
+        os.makedirs(archive_path, exist_ok=True)
+        self.segments = self.find_segments()
+        self.hot_log = BlockLog(os.path.join(archive_path, "hot.log"), os.path.join(archive_path, "hot.idx"),
+                                commit_window, os.path.join(archive_path, "hot.hdr"))
+        self.recover()
+
+    def __len__(self):
+        return self.get_archived_length() + len(self.hot_log)
+
+    def get_archived_length(self):
+        """
+        :return: Number of blocks in archive segments
+        """
+        return self.segments[-1][1] if self.segments else 0
+
+    def find_segments(self):
+        """
+        Finds the archive segments, segments must cover the chain from the genesis block
+        without gaps
+        :return: List of tuples of a segment's first block index, the index after its last
+                 block and its path, in chain order
+        """
+        segments = []
+        for filename in os.listdir(self.archive_path):
+            match = segment_pattern.match(filename)
+            if match:
+                segments.append((int(match.group(1)), int(match.group(2)), os.path.join(self.archive_path, filename)))
+        segments.sort()
+
+        contiguous_segments = []
+        for segment in segments:
+            if segment[0] != (contiguous_segments[-1][1] if contiguous_segments else 0):
+                break
+            contiguous_segments.append(segment)
+        return contiguous_segments
+
+    def recover(self):
+        """
+        Repairs the store after a crash part way through moving blocks between tiers. Blocks
+        archived just before the crash, when the segment was written but the log wasn't yet
+        shortened, are removed from the block log. Segments left in front of a block log that
+        was rewritten or truncated are removed.
+        """
+        with self.lock:
+            archived_length = self.get_archived_length()
+            if len(self.hot_log) == 0:
+                return
+
+            hot_start_index = self.hot_log.read(0)['index']
+            if hot_start_index == archived_length:
+                return
+            if hot_start_index > archived_length:
+                raise ValueError(f"Block log starts at index '{hot_start_index}' but the archive ends at "
+                                 f"index '{archived_length}'")
+
+            # The block log overlaps the archive, check whether they hold the same chain
+            block_dicts = self.hot_log.read_all()
+            overlap_matches = all(self.read(block_dict['index'])['hash'] == block_dict['hash']
+                                  for block_dict in block_dicts if block_dict['index'] < archived_length)
+
+            if overlap_matches and block_dicts[-1]['index'] >= archived_length - 1:
+                block_dicts = [block_dict for block_dict in block_dicts if block_dict['index'] >= archived_length]
+                self.hot_log.rewrite([encode_block_dict(block_dict) for block_dict in block_dicts])
+                return
+
+            # The log was rewritten or truncated, segments from its first block on are no longer on the chain
+            if not overlap_matches and hot_start_index != 0:
+                raise ValueError(f"Block log from index '{hot_start_index}' doesn't match the archive")
+            if not any(segment[1] == hot_start_index for segment in self.segments) and hot_start_index != 0:
+                raise ValueError(f"Block log starts at index '{hot_start_index}' inside an archive segment")
+            self.remove_segments(hot_start_index)
+
+    def remove_segments(self, start_index):
+        """
+        Removes the archive segments starting at or after a block, last segment first so the
+        remaining segments always cover the chain from the genesis block without gaps
+        :param start_index: Index of the first block no longer archived
+        """
+        with self.lock:
+            kept_segments = [segment for segment in self.segments if segment[0] < start_index]
+            for segment in reversed(self.segments[len(kept_segments):]):
+                os.remove(segment[2])
+                self.segment_cache.pop(segment[2], None)
+            self.segments = kept_segments
+
+    def read_segment(self, segment):
+        """
+        Reads the blocks in an archive segment, decompressing it if it isn't cached
+        :param segment: Tuple of the segment's first block index, end index and path
+        :return:        List of canonical block encodings in the segment
+        """
+        with self.lock:
+            block_encodings = self.segment_cache.get(segment[2])
+            if block_encodings is not None:
+                self.segment_cache.move_to_end(segment[2])
+                return block_encodings
+
+            with open(segment[2], 'rb') as segment_file:
+                data = decompress_segment(segment_file.read(), os.path.splitext(segment[2])[1])
+            block_encodings = data.split(b'\n')
+
+            self.segment_cache[segment[2]] = block_encodings
+            while len(self.segment_cache) > self.segment_cache_size:
+                self.segment_cache.popitem(last=False)
+            return block_encodings
+
+    def write_segment(self, block_dicts):
+        """
+        Compresses blocks into a new archive segment
+        :param block_dicts: List of consecutive blocks in dictionary format
+        """
+        start_index, end_index = block_dicts[0]['index'], block_dicts[-1]['index'] + 1
+        data = b'\n'.join(encode_block_dict(block_dict) for block_dict in block_dicts)
+        segment_path = os.path.join(self.archive_path, f"segment-{start_index:012d}-{end_index:012d}"
+                                                       f"{segment_extensions[self.compression]}")
+
+        temp_path = segment_path + ".tmp"
+        with open(temp_path, 'wb') as segment_file:
+            segment_file.write(compress_segment(data, self.compression))
+            fsync_file(segment_file)
+        replace_file(temp_path, segment_path)
+        self.segments.append((start_index, end_index, segment_path))
+
+    def archive_cold_blocks(self):
+        """
+        Compresses blocks deeper than the archive depth into segments and removes them from
+        the block log
+        """
+        with self.lock:
+            num_cold_blocks = len(self.hot_log) - self.archive_depth
+            if num_cold_blocks < self.segment_size:
+                return
+
+            block_dicts = self.hot_log.read_all()
+            num_archived = num_cold_blocks - num_cold_blocks % self.segment_size
+            for start in range(0, num_archived, self.segment_size):
+                self.write_segment(block_dicts[start:start + self.segment_size])
+
+            # A crash before the log is shortened is repaired by 'recover'
+            self.hot_log.rewrite([encode_block_dict(block_dict) for block_dict in block_dicts[num_archived:]])
+
+    def append(self, block_encoding):
+        """
+        Appends a block to the end of the chain, archiving blocks that are now deep enough.
+        The block is only durable once wait_for_commit returns for the write.
+        :param block_encoding:  Canonical encoding of the block in bytes
+        :return:                Sequence number of the write
+        """
+        with self.lock:
+            sequence = self.hot_log.append(block_encoding)
+            self.archive_cold_blocks()
+            return sequence
+
+    def wait_for_commit(self, sequence):
+        """
+        Waits until an appended block is durable
+        :param sequence:    Sequence number of the write
+        """
+        self.hot_log.wait_for_commit(sequence)
+
+    def read(self, index):
+        """
+        Reads a single block from whichever tier it is in
+        :param index:   Index of the block
+        :return:        Block in dictionary format, None if no block has the index
+        """
+        with self.lock:
+            archived_length = self.get_archived_length()
+            if index >= archived_length:
+                if index - archived_length >= len(self.hot_log):
+                    return None
+                return self.hot_log.read(index - archived_length)
+
+            for segment in self.segments:
+                if segment[0] <= index < segment[1]:
+                    return json.loads(self.read_segment(segment)[index - segment[0]])
+            return None
+
+    def read_all(self, start_index=0):
+        """
+        Reads every block from the archive and the block log
+        :param start_index: Index of the first block to read
+        :return:            List of blocks in dictionary format
+        """
+        with self.lock:
+            block_dicts = []
+            for segment in self.segments:
+                if segment[1] <= start_index:
+                    continue
+                block_encodings = self.read_segment(segment)[max(start_index - segment[0], 0):]
+                block_dicts.extend(json.loads(block_encoding) for block_encoding in block_encodings)
+
+            hot_start_index = max(start_index - self.get_archived_length(), 0)
+            return block_dicts + self.hot_log.read_all(hot_start_index)
+
+    def read_headers(self, start_index=0):
+        """
+        Reads the header of every block
+        :param start_index: Index of the first block to read
+        :return:            List of block headers in dictionary format
+        """
+        with self.lock:
+            # Archived blocks are decompressed whole, recent headers are read from the block log's header file
+            headers = []
+            for segment in self.segments:
+                if segment[1] <= start_index:
+                    continue
+                for block_encoding in self.read_segment(segment)[max(start_index - segment[0], 0):]:
+                    block_dict = json.loads(block_encoding)
+                    del block_dict['records']
+                    headers.append(block_dict)
+
+            hot_start_index = max(start_index - self.get_archived_length(), 0)
+            return headers + self.hot_log.read_headers(hot_start_index)
+
+    def read_record_filenames(self, start_index=0):
+        """
+        Reads the filename of every record by scanning every block
+        :param start_index: Index of the first block to read
+        :return:            List of tuples of a record's filename and the index of its block
+        """
+        return [(record['filename'], block_dict['index'])
+                for block_dict in self.read_all(start_index) for record in block_dict['records']]
+
+    def rewrite(self, block_encodings):
+        """
+        Replaces every block in the store, e.g. when adopting a peer's chain
+        :param block_encodings: List of canonical block encodings in bytes
+        """
+        with self.lock:
+            # The new chain is written to the block log before the old segments are removed,
+            # so a crash leaves the whole new chain in the log, which 'recover' keeps
+            self.hot_log.rewrite(block_encodings)
+            self.remove_segments(0)
+            self.archive_cold_blocks()
+
+    def truncate(self, length):
+        """
+        Removes every block after the first 'length' blocks, e.g. when they are orphaned by a
+        fork. Kept blocks in a partly removed segment are moved back to the block log.
+        :param length:  Number of blocks kept
+        """
+        with self.lock:
+            archived_length = self.get_archived_length()
+            if length > archived_length:
+                self.hot_log.truncate(length - archived_length)
+                return
+
+            # The kept blocks are written to the log before any segment is removed, so a crash
+            # leaves them in front of the removed segments, which 'recover' then removes. The
+            # segment holding the last kept block is always moved, so the log is never empty.
+            kept_segments = [segment for segment in self.segments if segment[1] < length]
+            partial_start = kept_segments[-1][1] if kept_segments else 0
+            kept_blocks = [block_dict for block_dict in self.read_all(partial_start) if block_dict['index'] < length]
+            self.hot_log.rewrite([encode_block_dict(block_dict) for block_dict in kept_blocks])
+            self.remove_segments(partial_start)
+
+    def find_block_index(self, filename):
+        """
+        Finds the block a record was verified in by scanning every block
+        :param filename:    Filename of the record
+        :return:            Index of the block, None if the record is not on the chain
+        """
+        for record_filename, block_index in self.read_record_filenames():
+            if record_filename == filename:
+                return block_index
+        return None
+
+    def get_records_by_aircraft(self, aircraft_reg_number):
+        """
+        Finds every record for an aircraft by scanning every block
+        :param aircraft_reg_number: Registration number of the aircraft
+        :return:                    List of records in dictionary format, in chain order
+        """
+        return [record for block_dict in self.read_all() for record in block_dict['records']
+                if record['aircraft_reg_number'] == aircraft_reg_number]
@@ -0,0 +1,143 @@
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Maximum number of keep-alive connections held open to each peer
+pool_size = int(os.environ.get("MIBLOCK_HTTP_POOL_SIZE", 10))
+
+# Seconds to wait for a peer to accept a connection and to send a response
+connect_timeout = float(os.environ.get("MIBLOCK_CONNECT_TIMEOUT", 3.05))
+read_timeout = float(os.environ.get("MIBLOCK_READ_TIMEOUT", 30))
+
+# Maximum number of requests sent to peers at once when fanning out
+fan_out_workers = int(os.environ.get("MIBLOCK_FAN_OUT_WORKERS", 16))
+
+# Thread pool fanned out requests are sent from, created on first use
+fan_out_executor = None
+
+# Keep-alive session for each peer, keyed by the peer's address
+sessions = {}
+sessions_lock = threading.Lock()
+
+
+def get_session(address):
+    """
+    Gets the session used for every request to a peer, so requests reuse the peer's open
+    connections instead of making a new TCP connection each time
+    :param address: Address of the peer
+    :return:        Session for the peer
+    """
+    with sessions_lock:
+        session = sessions.get(address)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            sessions[address] = session
+        return session
+
+
+def request(method, url, timeout=None, **kwargs):
+    """
+    Sends a request to a node over the node's pooled session
+    :param method:  HTTP method of the request
+    :param url:     URL of the request
+    :param timeout: Tuple of the connect and read timeouts in seconds, the configured timeouts
+                    are used when this is not provided
+    :param kwargs:  Arguments passed on to requests, e.g. data and headers
+    :return:        Response from the node
+    """
+    if timeout is None:
+        timeout = (connect_timeout, read_timeout)
+    return get_session(urlsplit(url).netloc).request(method, url, timeout=timeout, **kwargs)
+
+
+def get(url, **kwargs):
+    """
+    Sends a GET request to a node, see request
+    """
+    return request('GET', url, **kwargs)
+
+
+def post(url, **kwargs):
+    """
+    Sends a POST request to a node, see request
+    """
+    return request('POST', url, **kwargs)
+
+
+def close_sessions():
+    """
+    Closes every peer's session and its open connections
+    """
+    with sessions_lock:
+        for session in sessions.values():
+            session.close()
+        sessions.clear()
+
+
+def get_fan_out_executor():
+    """
+    Gets the thread pool requests to many peers are sent from, so the number of requests in
+    flight at once is bounded however many peers there are
+    :return: Thread pool executor
+    """
+    global fan_out_executor
+    with sessions_lock:
+        if fan_out_executor is None:
+            fan_out_executor = ThreadPoolExecutor(max_workers=fan_out_workers, thread_name_prefix="fan-out")
+        return fan_out_executor
+
+
+def fan_out(peers, call, first_k=None, deadline=None):
+    """
+    Makes a call to many peers concurrently and collects each peer's result or error. A call
+    returning a response with a 4xx or 5xx status code counts as failed. Calls still running
+    when this returns are left to finish in the background.
+    :param peers:       List of peer addresses
+    :param call:        Function taking a peer's address, e.g. sending the peer a request
+    :param first_k:     Return as soon as this many calls have succeeded, calls not yet started
+                        are cancelled and calls still running are ignored. Every call is waited
+                        for when this is not provided.
+    :param deadline:    Seconds to wait for calls before returning with the results so far,
+                        calls still running at the deadline count as failed
+    :return:            Tuple of a dictionary of each successful peer's result and a
+                        dictionary of each failed peer's exception, both keyed by address
+    """
+    results, errors = {}, {}
+    if not peers:
+        return results, errors
+
+    executor = get_fan_out_executor()
+    futures = {executor.submit(call, peer): peer for peer in peers}
+    end_time = None if deadline is None else time.monotonic() + deadline
+
+    pending = set(futures)
+    while pending and (first_k is None or len(results) < first_k):
+        timeout = None if end_time is None else max(end_time - time.monotonic(), 0)
+        done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+        if not done:
+            # Deadline passed with calls still running
+            for future in pending:
+                errors[futures[future]] = TimeoutError(f"No response within '{deadline}' seconds")
+            return results, errors
+
+        for future in done:
+            try:
+                result = future.result()
+                if isinstance(result, requests.Response):
+                    result.raise_for_status()
+                results[futures[future]] = result
+            except Exception as error:
+                errors[futures[future]] = error
+
+    # Enough calls succeeded, the rest are no longer needed
+    for future in pending:
+        future.cancel()
+    return results, errors
@@ -18,8 +18,8 @@ do
 done
 docker rm $(docker ps -a -q) > /dev/null 2>&1
 
-echo -e ">> Removing blocks.json"
-rm data/blocks.json > /dev/null 2>&1
+echo -e ">> Removing block log"
+rm -r data/blocks.log data/blocks.idx data/blocks.hdr data/chain.db data/chain.bin data/chain.offsets data/archive > /dev/null 2>&1
 
 echo -e ">> Building docker container image"
 docker build -t miblock:latest . > /dev/null 2>&1
@@ -0,0 +1,127 @@
+import gc
+import getopt
+import hashlib
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.abspath('..'))
+
+from blockchain.block import Block
+from blockchain.maintenance_record import MaintenanceRecord
+
+# ---- Global Variables ----
+number_of_records = 1000000
+records_per_block = 500
+records_path = '/app/miBlock/data/records/used'
+
+
+class LegacyRecord:
+    """
+    Record layout before slots, a per-instance dict holding a hex file hash and absolute file path
+    """
+    def __init__(self, aircraft_reg_number, date_of_record, filename, file_path, file_hash):
+        self.aircraft_reg_number = aircraft_reg_number
+        self.date_of_record = date_of_record
+        self.filename = filename
+        self.file_path = file_path
+        self.file_hash = file_hash
+
+
+class LegacyBlock:
+    """
+    Block layout before slots, a per-instance dict holding hex hashes
+    """
+    def __init__(self, index, previous_hash, timestamp, records, nonce, difficulty, block_hash):
+        self.index = index
+        self.previous_hash = previous_hash
+        self.timestamp = timestamp
+        self.nonce = nonce
+        self.difficulty = difficulty
+        self.records = records
+        self.hash = block_hash
+
+
+def get_fake_hash(value):
+    return hashlib.sha256(str(value).encode()).digest()
+
+
+def build_legacy_chain():
+    chain = []
+    previous_hash = '0'
+    for index in range(number_of_records // records_per_block):
+        records = []
+        for position in range(records_per_block):
+            record_number = index * records_per_block + position
+            filename = f"record_{record_number}.pdf"
+            records.append(LegacyRecord(f"G-{record_number % 10000:04d}", "01/01/2020", filename,
+                                        f"{records_path}/{filename}", get_fake_hash(record_number).hex()))
+        block_hash = get_fake_hash(f"block_{index}").hex()
+        chain.append(LegacyBlock(index, previous_hash, time.time(), records, index, 16, block_hash))
+        previous_hash = block_hash
+    return chain
+
+
+def build_slotted_chain():
+    chain = []
+    previous_hash = bytes(32)
+    for index in range(number_of_records // records_per_block):
+        records = []
+        for position in range(records_per_block):
+            record_number = index * records_per_block + position
+            records.append(MaintenanceRecord(f"G-{record_number % 10000:04d}", "01/01/2020",
+                                             f"record_{record_number}.pdf", True, get_fake_hash(record_number)))
+        block = Block(index, previous_hash, time.time(), records, index, 16)
+        block.hash = get_fake_hash(f"block_{index}")
+        chain.append(block)
+        previous_hash = block.hash
+    return chain
+
+
+def measure(build_chain):
+    """
+    Measures the memory held by a chain once it is built
+    :param build_chain: Function building a chain
+    :return:            Tuple of the bytes held by the chain and the seconds taken to build it
+    """
+    gc.collect()
+    tracemalloc.start()
+    start_time = time.time()
+    chain = build_chain()
+    build_time = time.time() - start_time
+    gc.collect()
+    memory_used, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del chain
+    return memory_used, build_time
+
+
+def main(argv):
+    global number_of_records
+
+    try:
+        opts, args = getopt.getopt(argv, "hr:", ["records="])
+    except getopt.GetoptError:
+        print('memory_benchmark.py -r <numberRecords>')
+        sys.exit(2)
+    for opt, arg in opts:
+        if opt == "-h":
+            print('memory_benchmark.py -r <numberRecords>')
+            sys.exit()
+        elif opt in ("-r", "--records"):
+            number_of_records = int(arg)
+
+    print(f"\n>> Building chains holding {number_of_records} records in blocks of {records_per_block}")
+    legacy_memory, legacy_time = measure(build_legacy_chain)
+    slotted_memory, slotted_time = measure(build_slotted_chain)
+
+    print(f"Dict layout, hex hashes:     {legacy_memory / 2 ** 20:8.1f} MiB "
+          f"({legacy_memory / number_of_records:.0f} bytes per record, built in {legacy_time:.1f}s)")
+    print(f"Slotted layout, byte hashes: {slotted_memory / 2 ** 20:8.1f} MiB "
+          f"({slotted_memory / number_of_records:.0f} bytes per record, built in {slotted_time:.1f}s)")
+    print(f"Slotted layout uses {slotted_memory / legacy_memory:.0%} of the memory")
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])